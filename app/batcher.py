@@ -0,0 +1,112 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class InferenceBatcher:
+    """
+    Groups single inputs submitted from any thread into batched predict calls.
+
+    A background thread takes the first pending input, then waits up to
+    `max_wait` seconds for more until `batch_size` inputs are collected, and
+    calls `predict_fn(list_of_inputs)`, which must return one output per
+    input in order. Each caller gets its own output back through the Future
+    returned by `submit`, so inputs from several documents can share a batch.
+    """
+
+    def __init__(self, predict_fn, batch_size=8, max_wait=0.05, name="batcher"):
+        self.predict_fn = predict_fn
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy_time = 0.0
+        self._first_submit = None
+        self._last_done = None
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        with self._stats_lock:
+            if self._first_submit is None:
+                self._first_submit = time.perf_counter()
+        self._queue.put((item, future))
+        return future
+
+    def map(self, items):
+        """Submit all items and wait for their outputs, in input order."""
+        futures = [self.submit(item) for item in items]
+        return [f.result() for f in futures]
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            inputs = [item for item, _ in batch]
+            start = time.perf_counter()
+            try:
+                outputs = list(self.predict_fn(inputs))
+                if len(outputs) != len(inputs):
+                    raise RuntimeError(f"{self.name}: predict returned {len(outputs)} output(s) for {len(inputs)} input(s)")
+            except Exception as e:
+                logger.error(f"{self.name}: batch of {len(inputs)} failed: {e}", exc_info=True)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._stats_lock:
+                    self.busy_time += elapsed
+                    self.batches += 1
+                    self.items += len(inputs)
+                    self._last_done = time.perf_counter()
+
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
+
+    def stats(self):
+        with self._stats_lock:
+            wall = (self._last_done - self._first_submit) if self._first_submit and self._last_done else 0.0
+            return {
+                "items": self.items,
+                "batches": self.batches,
+                "busy_time": self.busy_time,
+                "wall_time": wall,
+                "items_per_sec": self.items / wall if wall > 0 else 0.0,
+            }
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
@@ -0,0 +1,87 @@
+import argparse
+import time
+import fitz
+import numpy as np
+from PIL import Image
+from config import RENDER_DPI
+from input_handler import pixmap_to_ndarray
+
+DEFAULT_PDF = "input/Metalux-14GRLED-1-x-4-LED-Troffer-2000-to-4300-Lumens-Package-spec-sheet.pdf"
+
+
+def legacy_handoff(pixmap):
+    """
+    Old path: pixmap -> bytes -> PIL image, handed to OCR as the PIL image's
+    ndarray and to doclayout_yolo as the PIL image (which it converts to a
+    BGR ndarray). Every buffer is a separate copy of the page and is counted
+    once.
+    Returns (ocr_input, layout_input, bytes_copied).
+    """
+    samples = pixmap.samples                     # copy 1: pixmap buffer -> bytes
+    img = Image.frombytes("RGB", [pixmap.width, pixmap.height], samples)  # copy 2: bytes -> PIL storage
+    ocr_input = np.asarray(img)                  # copy 3: PIL -> ndarray for OCR
+    layout_rgb = np.asarray(img)                 # copy 4: YOLO's PIL -> ndarray ...
+    layout_input = np.ascontiguousarray(layout_rgb[:, :, ::-1])  # copy 5: ... then RGB -> BGR
+    pil_bytes = img.width * img.height * len(img.getbands())
+    copied = len(samples) + pil_bytes + ocr_input.nbytes + layout_rgb.nbytes + layout_input.nbytes
+    return ocr_input, layout_input, copied
+
+
+def contiguous_handoff(pixmap):
+    """
+    New path: one contiguous BGR copy out of the pixmap buffer serves both
+    OCR and layout, and is what their preprocessing reads directly.
+    """
+    arr = pixmap_to_ndarray(pixmap, "BGR")      # copy 1: pixmap buffer -> BGR ndarray
+    assert arr.flags.c_contiguous and not _shares_pixmap_buffer(arr, pixmap)
+    return arr, arr, arr.nbytes
+
+
+def _shares_pixmap_buffer(arr, pixmap):
+    start = pixmap.samples_ptr
+    end = start + pixmap.stride * pixmap.height
+    return start <= arr.__array_interface__["data"][0] < end
+
+
+def time_handoff(fn, pixmap, repeats):
+    copied = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        _, _, copied = fn(pixmap)
+    return (time.perf_counter() - start) / repeats, copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes copied and time per page for the pixmap -> OCR/layout handoff.")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="PDF to render")
+    parser.add_argument("--dpi", type=int, default=RENDER_DPI)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    with fitz.open(args.pdf) as doc:
+        for page in doc:
+            pixmap = page.get_pixmap(dpi=args.dpi)
+            legacy_t, legacy_b = time_handoff(legacy_handoff, pixmap, args.repeats)
+            new_t, new_b = time_handoff(contiguous_handoff, pixmap, args.repeats)
+
+            legacy_ocr, legacy_layout, _ = legacy_handoff(pixmap)
+            new_ocr, new_layout, _ = contiguous_handoff(pixmap)
+            assert np.array_equal(legacy_ocr[:, :, ::-1], new_ocr), "OCR input differs"
+            assert np.array_equal(legacy_layout, new_layout), "layout input differs"
+
+            rows.append((page.number + 1, len(pixmap.samples_mv), legacy_b, legacy_t, new_b, new_t))
+
+    print(f"{'page':>4} {'page MB':>8} {'legacy MB copied':>17} {'legacy ms':>10} {'new MB copied':>14} {'new ms':>8}")
+    for page_no, size, legacy_b, legacy_t, new_b, new_t in rows:
+        print(f"{page_no:>4} {size / 1e6:>8.1f} {legacy_b / 1e6:>17.1f} {legacy_t * 1e3:>10.2f} {new_b / 1e6:>14.1f} {new_t * 1e3:>8.2f}")
+
+    n = len(rows)
+    print(
+        f"\nmean per page: legacy {sum(r[2] for r in rows) / n / 1e6:.1f} MB / {sum(r[3] for r in rows) / n * 1e3:.2f} ms, "
+        f"contiguous {sum(r[4] for r in rows) / n / 1e6:.1f} MB / {sum(r[5] for r in rows) / n * 1e3:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import random
+import time
+from generate_regex import normalize_text, sentence_similarity, group_schema_by_sentence_closeness
+
+# Formatting sentences in the style of the attribute schemas, filled in at random
+TEMPLATES = [
+    "Return the {unit} as a number followed by {sym} (e.g. {n}{sym}).",
+    "Value must be one of the predefined list: {words}.",
+    "Return Any Values found for the {thing}.",
+    "Return All Values listed for {thing}, separated by commas.",
+    "Must exactly match one of: {words}.",
+    "True/False statement: is the product {adj}?",
+    "Return the {unit} range as {n}-{m} {sym}.",
+    "Percentage value between 0 and 100 followed by % ({n}%).",
+    "Categorical field ({thing}); strictly match the fixed options {words}.",
+    "Return the {thing} in {unit} with up to {n} decimals.",
+]
+FILLERS = {
+    "unit": ["wattage", "lumens", "voltage", "color temperature", "length", "width", "weight", "efficacy"],
+    "sym": ["W", "lm", "V", "K", "in", "mm", "lbs", "lm/W"],
+    "thing": ["finish", "mounting", "lens", "driver", "housing", "optics", "controls", "certifications"],
+    "adj": ["dimmable", "damp rated", "wet rated", "emergency capable", "DLC listed"],
+    "words": ["white, black, bronze", "recessed, surface, pendant", "0-10V, DALI, TRIAC", "frosted, clear, prismatic"],
+}
+# Extra words appended to some sentences, so schemas have many small groups as well as big ones
+VOCABULARY = (
+    "nominal rated initial maintained input output ambient housing driver module fixture "
+    "luminaire optic reflector lens trim flange frame canopy bracket sensor battery photocell "
+    "per only when where including excluding approximately typical maximum minimum"
+).split()
+
+
+def make_schema(n_attributes, seed=0):
+    """Synthetic {attribute: details} with formatting sentences from TEMPLATES."""
+    rng = random.Random(seed)
+    schema = {}
+    for i in range(n_attributes):
+        template = rng.choice(TEMPLATES)
+        sentence = template.format(
+            n=rng.randint(1, 500), m=rng.randint(500, 5000),
+            **{key: rng.choice(values) for key, values in FILLERS.items()},
+        )
+        if rng.random() < 0.7:
+            sentence = " ".join([sentence] + rng.sample(VOCABULARY, rng.randint(2, 12)))
+        schema[f"Attribute {i}"] = {
+            "data_type": "str",
+            "values": [],
+            "product_types": [],
+            "Expected Output Formatting": sentence,
+        }
+    return schema
+
+
+def legacy_grouping(normalized_schema, threshold=0.5):
+    """Previous implementation: SequenceMatcher on every (base, later ungrouped) pair."""
+    items = []
+    for name, details in normalized_schema.items():
+        instr = details.get("Expected Output Formatting", "")
+        items.append({"name": name, "details": details, "text": normalize_text(instr)})
+
+    groups = []
+    visited = set()
+    for i, base in enumerate(items):
+        if i in visited:
+            continue
+        group = {base["name"]: base["details"]}
+        visited.add(i)
+        for j in range(i + 1, len(items)):
+            if j in visited:
+                continue
+            if sentence_similarity(base["text"], items[j]["text"]) >= threshold:
+                group[items[j]["name"]] = items[j]["details"]
+                visited.add(j)
+        groups.append(group)
+    return groups
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time schema grouping by formatting sentence, old vs new.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Numbers of attributes")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--legacy-max", type=int, default=1000, help="Skip the old implementation above this size")
+    args = parser.parse_args()
+
+    print(f"{'attributes':>10} {'groups':>7} {'legacy s':>9} {'new s':>8} {'speedup':>8}")
+    for size in args.sizes:
+        schema = make_schema(size)
+        groups, new_t = timed(group_schema_by_sentence_closeness, schema, args.threshold)
+        if size <= args.legacy_max:
+            legacy_groups, legacy_t = timed(legacy_grouping, schema, args.threshold)
+            assert [list(g) for g in legacy_groups] == [list(g) for g in groups], "groupings differ"
+            print(f"{size:>10} {len(groups):>7} {legacy_t:>9.2f} {new_t:>8.2f} {legacy_t / new_t:>7.1f}x")
+        else:
+            print(f"{size:>10} {len(groups):>7} {'-':>9} {new_t:>8.2f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+import time
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCacheStore:
+    """
+    Size-bounded key -> bytes store in a single SQLite file.
+
+    Entries carry their payload size and last access time; once the total
+    payload exceeds `max_bytes` the least recently used entries are evicted.
+    The connection is opened lazily and re-opened after a fork, so one store
+    object can be shared by worker processes.
+    """
+
+    def __init__(self, path, max_bytes, name="cache"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " payload BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON entries(last_access)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT payload FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, payload):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, payload, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, sqlite3.Binary(payload), len(payload), time.time()),
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.debug(f"{self.name}: evicted {evicted} entr{'y' if evicted == 1 else 'ies'} (now {total} bytes)")
+
+    def stats(self):
+        with self._lock:
+            conn = self._connection()
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
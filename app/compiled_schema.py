@@ -0,0 +1,147 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+import threading
+from config import SCHEMA_CACHE_PATH, SCHEMA_CACHE_MAX_BYTES
+from cache_store import LRUCacheStore
+
+logger = logging.getLogger(__name__)
+
+# Bump when the CompiledSchema attributes change
+SCHEMA_CACHE_VERSION = 1
+
+_schema_cache = None
+_compiled = {}          # (path, size, mtime) -> CompiledSchema, for this process
+_compiled_lock = threading.Lock()
+
+
+def build_attribute_index(schema):
+    """
+    {normalized key: original key} of `schema`; for keys that normalize the
+    same, the first one wins, as in a linear scan.
+    """
+    index = {}
+    for orig_key in schema:
+        index.setdefault(orig_key.strip().lower(), orig_key)
+    return index
+
+
+class CompiledSchema:
+    """
+    Attribute schema with the lookups every document needs, built once per
+    schema content:
+
+    - schema: the parsed JSON, {attribute: {"data_type", "values", "product_types"}}
+    - content_hash: md5 of the schema file
+    - key_index: normalized key -> original key
+    - norm_values / value_sets: normalized values per attribute
+    - all_values: every normalized value, sorted (for the value matcher)
+    - product_types: all product types, sorted; product_type_bits maps each to
+      one bit and attribute_masks holds the OR of an attribute's bits
+    """
+
+    def __init__(self, schema, content_hash):
+        self.schema = schema
+        self.content_hash = content_hash
+        self.key_index = build_attribute_index(schema)
+        self.norm_values = {
+            key: [v.strip().lower() for v in attr.get("values", [])]
+            for key, attr in schema.items()
+        }
+        self.value_sets = {key: frozenset(values) for key, values in self.norm_values.items()}
+        self.all_values = tuple(sorted({v for values in self.norm_values.values() for v in values}))
+
+        self.product_types = sorted({pt for attr in schema.values() for pt in attr.get("product_types", [])})
+        self.product_type_bits = {pt: 1 << i for i, pt in enumerate(self.product_types)}
+        self.attribute_masks = {
+            key: self.product_type_mask(attr.get("product_types", []))
+            for key, attr in schema.items()
+        }
+
+    def __len__(self):
+        return len(self.schema)
+
+    def product_type_mask(self, product_types):
+        """Bitmask of the known product types among `product_types`."""
+        mask = 0
+        for pt in product_types:
+            mask |= self.product_type_bits.get(pt, 0)
+        return mask
+
+    def attribute_info(self, search_key):
+        """
+        Same result as `get_attribute_info_by_key(search_key, schema)`, by
+        dict lookup instead of a scan.
+        """
+        orig_key = self.key_index.get(search_key.strip().lower())
+        if orig_key is None:
+            logger.warning(f"No matching attribute found for key: '{search_key}'")
+            return None
+        attr = self.schema[orig_key]
+        return {
+            "original_key": orig_key,
+            "norm_key": orig_key.strip().lower(),
+            "data_type": attr["data_type"],
+            "values": list(self.norm_values[orig_key]),
+            "product_types": attr["product_types"]
+        }
+
+
+def get_schema_cache():
+    """
+    Returns the global on-disk cache of compiled schemas, creating it if necessary.
+    """
+    global _schema_cache
+    if _schema_cache is None:
+        _schema_cache = LRUCacheStore(SCHEMA_CACHE_PATH, SCHEMA_CACHE_MAX_BYTES, name="schema_cache")
+    return _schema_cache
+
+
+def compile_schema_file(schema_path, cache=None):
+    """
+    CompiledSchema for the JSON file at `schema_path`. With `cache`, a schema
+    compiled before (same content) is unpickled instead of parsed and compiled.
+    """
+    with open(schema_path, "rb") as f:
+        raw = f.read()
+    content_hash = hashlib.md5(raw).hexdigest()
+    cache_key = f"v{SCHEMA_CACHE_VERSION}:{content_hash}"
+
+    if cache is not None:
+        payload = cache.get(cache_key)
+        if payload is not None:
+            try:
+                return pickle.loads(payload)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable cached schema {content_hash}: {e}")
+
+    try:
+        schema = json.loads(raw.decode("utf-8"))
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in schema file {schema_path}: {e}")
+        raise
+    compiled = CompiledSchema(schema, content_hash)
+    if cache is not None:
+        cache.put(cache_key, pickle.dumps(compiled, protocol=pickle.HIGHEST_PROTOCOL))
+    return compiled
+
+
+def load_compiled_schema(schema_path, use_cache=True):
+    """
+    Compiled schema for `schema_path`, built once per process (and per file
+    version) and shared by every document.
+    """
+    stat = os.stat(schema_path)
+    memo_key = (os.path.abspath(schema_path), stat.st_size, stat.st_mtime_ns)
+    with _compiled_lock:
+        compiled = _compiled.get(memo_key)
+        if compiled is None:
+            compiled = compile_schema_file(schema_path, get_schema_cache() if use_cache else None)
+            _compiled[memo_key] = compiled
+            logger.info(
+                f"Loaded schema {os.path.basename(schema_path)}: {len(compiled)} attributes, "
+                f"{len(compiled.product_types)} product types (md5 {compiled.content_hash})"
+            )
+    return compiled
@@ -4,4 +4,68 @@ LLM_FILENAME = "Qwen3-0.6B-BF16.gguf"
 
 # For production
 LLM_REPO_ID_GPU = "unsloth/Qwen3-14B-GGUF"
-LLM_FILENAME_GPU = "Qwen3-14B-Q4_K_M.gguf"
\ No newline at end of file
+LLM_FILENAME_GPU = "Qwen3-14B-Q4_K_M.gguf"
+
+# LLM generation
+LLM_PARALLEL_CONTEXTS = 2        # llama contexts generating regex guidance concurrently on CPU (GPU runs use 1)
+# Per-context RAM cache of saved KV states, so a prompt sharing a prefix with any earlier one (not just the
+# previous one on that context, which llama-cpp reuses anyway) only evaluates the rest. Off by default: each
+# saved state of Qwen3-0.6B is ~112 KiB per prompt token of KV (~220 MiB for a 2k-token prompt) plus a copy
+# of up to n_batch x n_vocab float32 logits (512 x 151936 x 4 B = ~297 MiB), and the budget is per context,
+# so resident memory grows by up to LLM_PREFIX_CACHE_BYTES x LLM_PARALLEL_CONTEXTS.
+LLM_PREFIX_CACHE_BYTES = 0       # bytes per context, logits copies included (0 disables)
+
+# Page rendering / text extraction
+RENDER_DPI = 300                 # All OCR coordinates are in pixels at this DPI
+PAGE_CACHE_SIZE = 2              # Rendered pages kept in memory per document
+TEXT_LAYER_MIN_CHARS = 50        # Pages with fewer extractable chars fall back to OCR
+TEXT_LAYER_MAX_GARBAGE_RATIO = 0.1  # Max share of unmappable glyphs (U+FFFD) in a usable text layer
+
+# OCR batching
+OCR_BATCH_SIZE = 8               # Page images per PaddleOCR predict call
+OCR_BATCH_MAX_WAIT = 0.05        # Seconds to wait for more pages before running a partial batch
+
+# Layout detection (doclayout_yolo)
+LAYOUT_PAGE_CHUNK = 4            # Pages sent to layout detection per predict call
+LAYOUT_IMGSZ = 1024              # Prediction image size
+LAYOUT_CONF = 0.05               # Confidence threshold
+LAYOUT_DEVICE = "cpu"            # e.g. 'cuda:0' or 'cpu'
+LAYOUT_NUM_THREADS = None        # torch CPU threads for layout inference (None = torch default)
+LAYOUT_BATCH_MAX_WAIT = 0.05     # Seconds to wait for pages from other documents before running a batch
+
+# Multi-resolution OCR (--multires): low-DPI layout pass, high-DPI crops of text regions only
+MULTIRES_LAYOUT_DPI = 100
+MULTIRES_REGION_PAD_PT = 4       # Padding around detected regions, in PDF points
+MULTIRES_SKIP_CLASSES = (3,)     # doclayout_yolo classes not sent to OCR (3 = figure)
+
+# On-disk caches
+CACHE_DIR = "cache"
+OCR_CACHE_PATH = f"{CACHE_DIR}/ocr_cache.sqlite"
+OCR_CACHE_MAX_BYTES = 512 * 1024 * 1024
+LAYOUT_CACHE_PATH = f"{CACHE_DIR}/layout_cache.sqlite"   # Table regions per page
+LAYOUT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+SCHEMA_CACHE_PATH = f"{CACHE_DIR}/schema_cache.sqlite"   # Compiled schemas, keyed by schema md5
+SCHEMA_CACHE_MAX_BYTES = 256 * 1024 * 1024
+LLM_CACHE_PATH = f"{CACHE_DIR}/llm_cache.sqlite"         # LLM responses, keyed by model hash + messages + sampling
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+REGEX_GUIDANCE_CACHE_PATH = f"{CACHE_DIR}/regex_guidance.sqlite"   # pair_regex per attribute, keyed by its details
+REGEX_GUIDANCE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Model server (python model_server.py): keeps OCR, layout and LLM models loaded between runs
+MODEL_SERVER_SOCKET = f"{CACHE_DIR}/model_server.sock"   # Unix domain socket clients connect to
+MODEL_SERVER_KEY_PATH = f"{CACHE_DIR}/model_server.key"  # Auth key, readable by the owner only
+
+# Staged pipeline (--pipeline)
+PIPELINE_QUEUE_SIZE = 2          # Documents waiting in front of each stage
+PIPELINE_STAGE_WORKERS = {       # Threads per stage; extract threads share the OCR batcher
+    "extract": 2,
+    "match": 1,
+    "layout": 2,                 # >1 lets pages of two documents share a layout batch
+    "tables": 1,
+}
+
+# LLM-generated pair_regex patterns (regex guidance)
+PAIR_REGEX_MAX_LENGTH = 500      # Longer patterns are quarantined
+PAIR_REGEX_PROBE_CHARS = 20000   # Size of the synthetic text each pattern is timed on when loaded
+PAIR_REGEX_TIME_BUDGET = 0.25    # CPU seconds per pattern per PAIR_REGEX_PROBE_CHARS of text; patterns that need more are quarantined
+PAIR_REGEX_WALL_FACTOR = 4       # A scan is cut off after this many budgets of wall-clock time (threads share the GIL)
@@ -0,0 +1,81 @@
+import bisect
+import logging
+from helper import lower_preserving_length, ocr_fold
+
+logger = logging.getLogger(__name__)
+
+# Between pages: neither whitespace nor a word character, so neither term
+# matching nor "\s*"-style key-value patterns can run from one page into the next
+PAGE_SEPARATOR = "\x00"
+# Between the text boxes of one page, as before
+LINE_SEPARATOR = " "
+
+
+class FullText(str):
+    """
+    Lowercased text of all OCR boxes of a document, boxes joined by a space
+    and pages by PAGE_SEPARATOR.
+
+    It is a plain str to every consumer, plus a map from character offset to
+    the (page, line index) of the OCR box it came from, so any substring or
+    regex hit can be traced back to its box in O(log n). Lowercasing keeps
+    every box's length, so offsets inside a box are offsets into its text.
+    """
+
+    def __new__(cls, text, line_starts=(), line_pages=(), line_indices=()):
+        obj = super().__new__(cls, text)
+        obj.line_starts = list(line_starts)     # offset of each box's first character
+        obj.line_pages = list(line_pages)
+        obj.line_indices = list(line_indices)
+        obj._folded = None
+        return obj
+
+    @classmethod
+    def from_ocr_results(cls, ocr_results):
+        page_texts = []
+        line_starts, line_pages, line_indices = [], [], []
+        offset = 0
+        for page_idx, result_group in enumerate(ocr_results):
+            texts = result_group[0]["rec_texts"] if result_group else []
+            for line_idx, txt in enumerate(texts):
+                line_starts.append(offset)
+                line_pages.append(page_idx)
+                line_indices.append(line_idx)
+                offset += len(txt) + len(LINE_SEPARATOR)
+            page_text = LINE_SEPARATOR.join(texts)
+            offset += len(PAGE_SEPARATOR) - (len(LINE_SEPARATOR) if texts else 0)
+            page_texts.append(lower_preserving_length(page_text))
+        return cls(PAGE_SEPARATOR.join(page_texts), line_starts, line_pages, line_indices)
+
+    @property
+    def folded(self):
+        """`ocr_fold` of the text, computed on first use."""
+        if self._folded is None:
+            self._folded = ocr_fold(str(self))
+        return self._folded
+
+    def locate(self, offset):
+        """
+        (page index, line index) of the OCR box containing `offset`; offsets on
+        a separator belong to the box before it. None before the first box.
+        """
+        pos = bisect.bisect_right(self.line_starts, offset) - 1
+        if pos < 0:
+            return None
+        return self.line_pages[pos], self.line_indices[pos]
+
+    def locate_span(self, start, end):
+        """(page index, line index) of every OCR box that the span [start, end) touches."""
+        first = max(bisect.bisect_right(self.line_starts, start) - 1, 0)
+        last = bisect.bisect_left(self.line_starts, end)
+        return [(self.line_pages[i], self.line_indices[i]) for i in range(first, last)]
+
+
+def lowered(text):
+    """`text` lowercased without changing its length; a FullText already is."""
+    return text if isinstance(text, FullText) else lower_preserving_length(text)
+
+
+def folded(text):
+    """OCR-folded lowercase `text`, cached on a FullText."""
+    return text.folded if isinstance(text, FullText) else ocr_fold(lowered(text))
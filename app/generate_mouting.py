@@ -1,8 +1,11 @@
 import logging
 import re
 import json
+import time
+import threading
 from  input_handler import load_attribute_schema
-from  model_loader import get_llm_instance
+from  model_loader import get_llm_instance, get_llm_model_path, chat_completion
+from  llm_cache import get_llm_cache, model_file_hash, llm_cache_key, get_cached_response, put_cached_response
 
 def build_mounting_prompt(product_type_set):
     prompt = f'''
@@ -41,6 +44,7 @@ Each key must be the original product type.
 Each value must be either:
 
 - a single mounting word
+- a list of mounting words
 
 Do not include explanations, comments, markdown, or any text outside the JSON object.
 Return ONLY valid JSON.
@@ -50,11 +54,58 @@ Use double quotes for all keys and string values.
 '''
     return prompt
 
+def mounting_response_schema(product_type_set):
+    """
+    JSON schema of the mounting lookup response: a mounting word or a list
+    of them per product type, all of them required, nothing else.
+    """
+    product_types = sorted(product_type_set)
+    mounting = {"anyOf": [{"type": "string"}, {"type": "array", "items": {"type": "string"}}]}
+    return {
+        "type": "object",
+        "properties": {pt: mounting for pt in product_types},
+        "required": product_types,
+        "additionalProperties": False,
+    }
+
+
+# Sampling parameters of every completion; also part of the LLM cache key
+LLM_SAMPLING = {
+    "temperature": 0.9,
+    "max_tokens": 4096,
+    "top_p": 10,
+}
+
+# Generation counters for this process (see llm_stats)
+_llm_stats = {
+    "completions": 0,           # model runs
+    "cache_hits": 0,            # responses served from the LLM cache
+    "prompt_tokens": 0,
+    "prompt_tokens_reused": 0,  # of those, restored from the KV (prefix) cache instead of evaluated
+    "completion_tokens": 0,
+    "truncated": 0,             # completions cut off at max_tokens
+    "json_requests": 0,         # get_valid_json calls
+    "json_attempts": 0,         # generations they needed
+    "json_failures": 0,         # calls that gave up
+}
+_llm_stats_lock = threading.Lock()
+
+def _count(**increments):
+    with _llm_stats_lock:
+        for name, n in increments.items():
+            _llm_stats[name] += n
+
+def llm_stats():
+    """Copy of the generation counters of this process."""
+    with _llm_stats_lock:
+        return dict(_llm_stats)
 
-def generate_llm_response(prompt, use_gpu=False):
-    llm = get_llm_instance(use_gpu)
-    response =  llm.create_chat_completion(
-    messages=[
+def add_llm_stats(stats):
+    """Adds counters from another process (a worker's llm_stats()) to this one's."""
+    _count(**{name: n for name, n in stats.items() if name in _llm_stats})
+
+def build_llm_messages(prompt):
+    return [
         # {
             # "role": "system",
             # # "content": "You are a helpful assistant that outputs in JSON format. Output only valid JSON. Ensure all keys are quoted, no duplicate keys exist, and arrays contain uniform types.",
@@ -76,13 +127,82 @@ def generate_llm_response(prompt, use_gpu=False):
             """
             },
         {"role": "user", "content": prompt},
-    ],
-    temperature=0.9,
-    max_tokens=4096,
-    top_p=10,
+    ]
+
+def generate_llm_response(prompt, use_gpu=False, use_cache=True, refresh=False, pool=None, response_schema=None,
+                          parse=None):
+    """
+    Chat completion for `prompt`. With the LLM cache enabled, a response
+    cached for the same model file, messages and sampling parameters is
+    returned without running the model. Responses cut off at max_tokens,
+    or rejected by `parse`, are not cached.
+
+    Args:
+        prompt (str): User message
+        use_gpu (bool): Use the GPU model
+        use_cache (bool): Read and write the LLM response cache
+        refresh (bool): Skip the cached response (e.g. it failed to parse)
+            and replace it with a new one
+        pool (LlamaPool): Generate on a context from this pool instead of
+            the global instance (for concurrent calls)
+        response_schema (dict): JSON schema the response must follow;
+            llama.cpp turns it into a grammar, so sampling can only produce
+            JSON of that shape
+        parse (callable): Applied to the response content; its ValueError
+            propagates and the response is not cached
+
+    Returns:
+        str: Response content, or parse(content) when `parse` is given
+    """
+    if parse is None:
+        parse = lambda content: content
+
+    messages = build_llm_messages(prompt)
+    params = dict(LLM_SAMPLING)
+    if response_schema is not None:
+        params["response_format"] = {"type": "json_object", "schema": response_schema}
+
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        key = llm_cache_key(model_file_hash(get_llm_model_path(use_gpu), cache), messages, params)
+        if not refresh:
+            content = get_cached_response(cache, key)
+            if content is not None:
+                logging.info("LLM response served from cache")
+                _count(cache_hits=1)
+                return parse(content)
+
+    start = time.perf_counter()
+    if pool is None:
+        llm = get_llm_instance(use_gpu)
+        response = chat_completion(llm, messages=messages, **params)
+    else:
+        with pool.acquire() as llm:
+            response = chat_completion(llm, messages=messages, **params)
+    elapsed = time.perf_counter() - start
+
+    choice = response["choices"][0]
+    content = choice["message"]['content']
+    usage = response.get("usage") or {}
+    truncated = choice.get("finish_reason") == "length"
+    _count(
+        completions=1,
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        prompt_tokens_reused=usage.get("prompt_tokens_reused", 0),
+        completion_tokens=usage.get("completion_tokens", 0),
+        truncated=int(truncated),
+    )
+    logging.info(
+        f"LLM completion: {usage.get('prompt_tokens', '?')} prompt "
+        f"({usage.get('prompt_tokens_reused', '?')} reused) + "
+        f"{usage.get('completion_tokens', '?')} generated token(s) in {elapsed:.1f}s"
     )
-    content = response["choices"][0]["message"]['content']
-    return content
+    if truncated:
+        logging.warning(f"LLM completion stopped at max_tokens={params['max_tokens']}; output is likely incomplete")
+    result = parse(content)
+    if cache is not None and not truncated:
+        put_cached_response(cache, key, content, usage)
+    return result
 
 def load_schema_and_derive_product_types(schema_path):
     logging.info(f"Loading schema from {schema_path}...")
@@ -121,31 +241,40 @@ def remove_think_block(text: str) -> str:
         return text
     return THINK_BLOCK_RE.sub("", text).strip()
 
-def get_valid_json(prompt, initial_response=None, max_retries=3, use_gpu=False):
+def parse_json_response(text):
+    """fix_and_load_json on an LLM response, without its <think> block."""
+    return fix_and_load_json(remove_think_block(text))
+
+def get_valid_json(prompt, initial_response=None, max_retries=3, use_gpu=False, response_schema=None, pool=None):
     """
     Validates an initial LLM response and regenerates only if necessary.
     Automatically removes <think>...</think> blocks before parsing.
+
+    With `response_schema`, generation is constrained to that JSON shape
+    (see generate_llm_response), so the first attempt normally parses.
     """
+    _count(json_requests=1)
 
     if initial_response is not None:
         try:
-            cleaned = remove_think_block(initial_response)
-            return fix_and_load_json(cleaned)
+            return parse_json_response(initial_response)
         except ValueError:
             logging.info("Initial response is invalid JSON; regenerating...")
 
     for attempt in range(max_retries):
         logging.info(f"LLM JSON generation attempt {attempt + 1}/{max_retries}")
-        response = generate_llm_response(prompt, use_gpu)
-
-        cleaned = remove_think_block(response)
-
+        _count(json_attempts=1)
         try:
-            return fix_and_load_json(cleaned)
-        except ValueError:
+            # Only responses that parse are cached; a retry must not get
+            # an older cached response back
+            return generate_llm_response(
+                prompt, use_gpu, refresh=attempt > 0, pool=pool, response_schema=response_schema,
+                parse=parse_json_response,
+            )
+        except ValueError as e:
             logging.warning(
-                f"Attempt {attempt + 1} failed: invalid JSON. Retrying..."
+                f"Attempt {attempt + 1} failed: {e}. Retrying..."
             )
 
+    _count(json_failures=1)
     raise RuntimeError("Failed to get valid JSON after multiple attempts")
-
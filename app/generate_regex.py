@@ -80,7 +80,30 @@ You are a JSON-only regex generator. Follow these rules EXACTLY:
     return Regex_prompt
 
 import re
+import json
+import hashlib
 from collections import defaultdict
+from config import REGEX_GUIDANCE_CACHE_PATH, REGEX_GUIDANCE_CACHE_MAX_BYTES
+from cache_store import LRUCacheStore
+
+def regex_response_schema(attribute_names):
+    """
+    JSON schema of a regex guidance response: every attribute of the group
+    maps to {"pair_regex": string or null}, nothing else.
+    """
+    names = list(attribute_names)
+    entry = {
+        "type": "object",
+        "properties": {"pair_regex": {"anyOf": [{"type": "string"}, {"type": "null"}]}},
+        "required": ["pair_regex"],
+        "additionalProperties": False,
+    }
+    return {
+        "type": "object",
+        "properties": {name: entry for name in names},
+        "required": names,
+        "additionalProperties": False,
+    }
 
 def normalize_text(text):
     if not text:
@@ -95,46 +118,102 @@ def prefix_key(text, prefix_len=4):
     """
     tokens = text.split()
     return " ".join(tokens[:prefix_len])
-from collections import defaultdict
+from collections import defaultdict, Counter
 from difflib import SequenceMatcher
+import numpy as np
 
 def sentence_similarity(a, b):
     return SequenceMatcher(None, a, b).ratio()
 
+def _char_count_matrix(sentences):
+    """(n_sentences, n_distinct_chars) int32 character counts of each sentence."""
+    alphabet = {ch: i for i, ch in enumerate(sorted({ch for s in sentences for ch in s}))}
+    counts = np.zeros((len(sentences), max(len(alphabet), 1)), dtype=np.int32)
+    for row, sentence in enumerate(sentences):
+        for ch, n in Counter(sentence).items():
+            counts[row, alphabet[ch]] = n
+    return counts
+
+def _char_positions(sentence):
+    """{char: bitmask of the positions where it occurs in `sentence`}."""
+    positions = {}
+    for i, ch in enumerate(sentence):
+        positions[ch] = positions.get(ch, 0) | (1 << i)
+    return positions
+
+def _lcs_length(a, b_positions, b_length):
+    """
+    Length of the longest common subsequence of `a` and a sentence b, given
+    as `_char_positions(b)` and its length (bit-parallel, one step per
+    character of `a`).
+    """
+    mask = (1 << b_length) - 1
+    v = mask
+    for ch in a:
+        u = v & b_positions.get(ch, 0)
+        v = ((v + u) | (v - u)) & mask
+    return b_length - bin(v).count("1")
+
 def group_schema_by_sentence_closeness(normalized_schema, threshold=0.5):
     """
     Groups attributes by how close their formatting sentences are.
+
+    Each group starts at the first ungrouped attribute (in schema order) and
+    takes every later ungrouped attribute whose sentence has a
+    SequenceMatcher ratio >= `threshold` with it. To avoid scoring all
+    pairs, identical sentences are handled once (their ratio is 1.0, so
+    they always end up together), and a pair is only scored when three
+    upper bounds of its ratio reach the threshold, from cheapest to
+    tightest: from the two lengths and from the characters they share
+    (SequenceMatcher's real_quick_ratio and quick_ratio, vectorized), then
+    from their longest common subsequence (the matching blocks are one).
+    The groups are the same as with the full pairwise comparison.
     """
+    names = list(normalized_schema)
+    if threshold > 1:   # no ratio exceeds 1.0
+        return [{name: normalized_schema[name]} for name in names]
 
-    items = []
-    for name, details in normalized_schema.items():
-        instr = details.get("Expected Output Formatting", "")
-        items.append({
-            "name": name,
-            "details": details,
-            "text": normalize_text(instr)
-        })
+    # Distinct sentences in order of first use, with the attributes using each
+    sentence_ids = {}
+    members = []
+    for idx, name in enumerate(names):
+        text = normalize_text(normalized_schema[name].get("Expected Output Formatting", ""))
+        sid = sentence_ids.setdefault(text, len(sentence_ids))
+        if sid == len(members):
+            members.append([])
+        members[sid].append(idx)
+    sentences = list(sentence_ids)
 
-    groups = []
-    visited = set()
+    lengths = np.array([len(s) for s in sentences], dtype=np.int64)
+    counts = _char_count_matrix(sentences)
+    ungrouped = np.ones(len(sentences), dtype=bool)
+    positions = [None] * len(sentences)     # _char_positions, built when first needed
 
-    for i, base in enumerate(items):
-        if i in visited:
+    groups = []
+    for base in range(len(sentences)):
+        if not ungrouped[base]:
             continue
+        ungrouped[base] = False
 
-        group = {base["name"]: base["details"]}
-        visited.add(i)
+        candidates = np.flatnonzero(ungrouped[base + 1:]) + base + 1
+        totals = lengths[base] + lengths[candidates]
+        # Same float expression as SequenceMatcher.ratio(), so no rounding differences
+        candidates = candidates[2.0 * np.minimum(lengths[base], lengths[candidates]) / totals >= threshold]
+        shared = np.minimum(counts[candidates], counts[base]).sum(axis=1)
+        candidates = candidates[2.0 * shared / (lengths[base] + lengths[candidates]) >= threshold]
 
-        for j in range(i + 1, len(items)):
-            if j in visited:
+        joined = members[base]
+        for other in candidates.tolist():
+            if positions[other] is None:
+                positions[other] = _char_positions(sentences[other])
+            lcs = _lcs_length(sentences[base], positions[other], len(sentences[other]))
+            if 2.0 * lcs / (len(sentences[base]) + len(sentences[other])) < threshold:
                 continue
+            if sentence_similarity(sentences[base], sentences[other]) >= threshold:
+                ungrouped[other] = False
+                joined = joined + members[other]
 
-            sim = sentence_similarity(base["text"], items[j]["text"])
-            if sim >= threshold:
-                group[items[j]["name"]] = items[j]["details"]
-                visited.add(j)
-
-        groups.append(group)
+        groups.append({names[idx]: normalized_schema[names[idx]] for idx in sorted(joined)})
 
     return groups
 
@@ -157,4 +236,44 @@ def clean_guidance(guidance_list):
     ]
 
 # Usage:
-# cleaned_guidance = clean_guidance(guidance)
\ No newline at end of file
+# cleaned_guidance = clean_guidance(guidance)
+
+
+# Per-attribute regex guidance cache
+
+_regex_guidance_cache = None
+
+# Part of every guidance key, so editing the prompt regenerates the guidance
+REGEX_PROMPT_HASH = hashlib.md5(build_regex_prompt("").encode("utf-8")).hexdigest()
+
+
+def get_regex_guidance_cache():
+    """
+    Returns the global on-disk cache of pair_regex guidance per attribute,
+    creating it if necessary.
+    """
+    global _regex_guidance_cache
+    if _regex_guidance_cache is None:
+        _regex_guidance_cache = LRUCacheStore(REGEX_GUIDANCE_CACHE_PATH, REGEX_GUIDANCE_CACHE_MAX_BYTES, name="regex_guidance")
+    return _regex_guidance_cache
+
+
+def attribute_guidance_key(name, details):
+    """
+    Cache key of one attribute's guidance: a hash of its name and the
+    details the prompt shows (formatting text, values; see clean_guidance).
+    """
+    shown = clean_guidance([{name: details}])[0][name]
+    payload = json.dumps([REGEX_PROMPT_HASH, name, shown], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_cached_attribute_guidance(cache, name, details):
+    """Cached {"pair_regex": ...} of an attribute, or None."""
+    payload = cache.get(attribute_guidance_key(name, details))
+    return json.loads(payload.decode("utf-8")) if payload is not None else None
+
+
+def put_cached_attribute_guidance(cache, name, details, guidance):
+    cache.put(attribute_guidance_key(name, details), json.dumps(guidance, ensure_ascii=False).encode("utf-8"))
+
@@ -1,5 +1,19 @@
 import logging
 import itertools
+import hashlib
+
+# Common OCR confusions: character -> characters it may have been read as
+OCR_CONFUSIONS = {
+    '0': ['0', 'o', 'O'],
+    '1': ['1', 'l', 'I', 'i'],
+    'i': ['i', 'l', '1', 'I'],
+    'l': ['l', 'i', '1', 'I'],
+    '5': ['5', 'S', 's'],
+    '8': ['8', 'B'],
+    '9': ['9', 'g', 'q'],
+    '2': ['2', 'Z', 'z'],
+    '6': ['6', 'G', 'b']
+}
 
 def generate_ocr_variants(term):
     """
@@ -10,24 +24,11 @@ def generate_ocr_variants(term):
     original_lower = term.lower()
     variants = {original_lower}
 
-    # Map common OCR confusions
-    ocr_map = {
-        '0': ['0', 'o', 'O'],
-        '1': ['1', 'l', 'I', 'i'],
-        'i': ['i', 'l', '1', 'I'],
-        'l': ['l', 'i', '1', 'I'],
-        '5': ['5', 'S', 's'],
-        '8': ['8', 'B'],
-        '9': ['9', 'g', 'q'],
-        '2': ['2', 'Z', 'z'],
-        '6': ['6', 'G', 'b']
-    }
-
     # Build character options using lowercase base
     chars_options = []
     for c in term:
         c_lower = c.lower()
-        replacements = ocr_map.get(c_lower, [c_lower])
+        replacements = OCR_CONFUSIONS.get(c_lower, [c_lower])
         # Ensure all choices are lowercase to avoid case-related duplication
         chars_options.append([r.lower() for r in replacements])
 
@@ -48,3 +49,89 @@ def generate_ocr_variants(term):
     return variant_list
 
 
+def _confusion_classes(confusions):
+    """
+    Merge characters that may stand in for each other (transitively) into
+    classes; returns {char: class representative}.
+    """
+    parent = {}
+
+    def find(c):
+        parent.setdefault(c, c)
+        while parent[c] != c:
+            parent[c] = parent[parent[c]]
+            c = parent[c]
+        return c
+
+    for c, replacements in confusions.items():
+        for r in replacements:
+            a, b = find(c), find(r.lower())
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+    return {c: find(c) for c in parent}
+
+# Lowercased text -> confusion class, e.g. 'o' -> '0', 'l'/'i' -> '1', 's' -> '5'
+_OCR_FOLD_TABLE = str.maketrans({c: rep for c, rep in _confusion_classes(OCR_CONFUSIONS).items() if c != rep})
+
+def lower_preserving_length(text):
+    """
+    Lowercase `text` without changing its length, so offsets into the result
+    are offsets into `text`. Characters whose lowercase form is longer
+    (e.g. 'İ') keep only its first character.
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c.lower()[0] for c in text)
+
+def ocr_fold(text_lower):
+    """
+    Map lowercased text onto OCR confusion classes ('0'/'o', '1'/'l'/'i', ...).
+    Same length as the input. Two strings that are OCR variants of each
+    other fold to the same string; the reverse does not always hold (the
+    confusion map is not symmetric), so folded matches are candidates to
+    check with `ocr_match_at`.
+    """
+    return text_lower.translate(_OCR_FOLD_TABLE)
+
+def ocr_char_options(term):
+    """
+    Per position of `term`, the set of lowercase characters an OCR'd text
+    may show there; exactly the choices `generate_ocr_variants` expands.
+    """
+    options = []
+    for c in str(term):
+        c_lower = c.lower()
+        if c_lower in OCR_CONFUSIONS:
+            options.append(frozenset(r.lower() for r in OCR_CONFUSIONS[c_lower]))
+        else:
+            options.extend(frozenset(ch) for ch in c_lower)
+    return tuple(options)
+
+def ocr_fold_term(term):
+    """Folded form of `term`, aligned with `ocr_char_options(term)`."""
+    return ocr_fold("".join(c.lower() for c in str(term)))
+
+def ocr_match_at(options, text_lower, start):
+    """
+    True if `text_lower[start:]` begins with an OCR variant of the term
+    whose `ocr_char_options` are `options`.
+    """
+    if start + len(options) > len(text_lower):
+        return False
+    for offset, allowed in enumerate(options):
+        if text_lower[start + offset] not in allowed:
+            return False
+    return True
+
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    Hex sha256 of a file's content, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,23 +1,183 @@
 import logging
 import os
 import json
+import threading
+from collections import OrderedDict
 import fitz
+import numpy as np
 from PIL import Image
 import json
 import logging
+from config import RENDER_DPI, PAGE_CACHE_SIZE
 
-def convert_pdf_with_pymupdf(pdf_path):
-    doc = fitz.open(pdf_path)
+# MuPDF is not thread-safe, not even across separate documents, and the
+# pipeline renders and extracts pages of several PDFs from different stage
+# threads. Every fitz call (open, load_page, get_text, get_pixmap, close)
+# and every release of a fitz object happens while holding this lock.
+MUPDF_LOCK = threading.RLock()
+
+class _PixmapBuffer:
+    """
+    Exposes a fitz.Pixmap's sample buffer through the NumPy array interface.
+    Arrays created from it keep this object (and so the pixmap) alive.
+    """
+
+    def __init__(self, pixmap):
+        self.pixmap = pixmap
+        self.__array_interface__ = {
+            "shape": (pixmap.height, pixmap.width, pixmap.n),
+            "typestr": "|u1",
+            "data": (pixmap.samples_ptr, False),
+            "strides": (pixmap.stride, pixmap.n, 1),
+            "version": 3,
+        }
+
+def pixmap_to_ndarray(pixmap, channel_order="BGR"):
+    """
+    Contiguous HxWxC uint8 array of the pixmap's samples, made with one copy
+    straight from the pixmap buffer (no bytes / PIL intermediates). The
+    array does not reference the pixmap, which can be dropped right away.
+
+    PaddleOCR and doclayout_yolo both treat ndarray input as BGR (OpenCV
+    convention), so "BGR" reverses the RGB samples into BGR order; "RGB"
+    keeps them as-is. (Before, OCR was given the RGB array of a PIL image,
+    i.e. red and blue swapped from what PaddleOCR expects.) A contiguous
+    array is what cv2, Paddle and ultralytics preprocessing work on, so they
+    don't make another copy of a negative-stride view.
+    """
+    if pixmap.alpha or pixmap.n != 3:
+        raise ValueError(f"Expected an RGB pixmap without alpha, got n={pixmap.n}, alpha={pixmap.alpha}")
+    arr = np.asarray(_PixmapBuffer(pixmap))
+    if channel_order == "BGR":
+        return np.ascontiguousarray(arr[:, :, ::-1])
+    if channel_order == "RGB":
+        return arr.copy()
+    raise ValueError(f"Unsupported channel order: {channel_order}")
+
+class PdfPageSource:
+    """
+    Indexable, lazily rendered view of a PDF's pages.
+
+    Pages are rasterized on access and only the `cache_size` most recently
+    used renders are kept, so memory is bounded by a few pages instead of the
+    whole document. Each page is an HxWx3 uint8 NumPy array copied once from
+    the pixmap buffer (BGR by default, which is what PaddleOCR and
+    doclayout_yolo expect; see pixmap_to_ndarray). The underlying fitz.Document stays open (for text-layer extraction) until
+    `close()` is called or the context manager exits.
+    """
+
+    def __init__(self, pdf_path, dpi=RENDER_DPI, cache_size=PAGE_CACHE_SIZE, channel_order="BGR"):
+        self.pdf_path = pdf_path
+        self.dpi = dpi
+        self.cache_size = cache_size
+        self.channel_order = channel_order
+        with MUPDF_LOCK:
+            self.doc = fitz.open(pdf_path)
+            self._n_pages = len(self.doc)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()    # the page cache
+
+    def __len__(self):
+        return self._n_pages
+
+    def __getitem__(self, page_idx):
+        if not isinstance(page_idx, int):
+            raise TypeError("PdfPageSource indices must be integers")
+        if page_idx < 0:
+            page_idx += len(self)
+        if not 0 <= page_idx < len(self):
+            raise IndexError(f"page index {page_idx} out of range")
+
+        with self._lock:
+            if page_idx in self._cache:
+                self._cache.move_to_end(page_idx)
+                return self._cache[page_idx]
+
+            img = self._render(page_idx)
+            if self.cache_size > 0:
+                self._cache[page_idx] = img
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return img
+
+    def __iter__(self):
+        for page_idx in range(len(self)):
+            yield self[page_idx]
+
+    def _render(self, page_idx):
+        return self.render(page_idx)[0]
+
+    def select(self, page_indices):
+        """Lazy sequence over the given pages, rendered when indexed."""
+        return _PageSelection(self, list(page_indices))
+
+    def page(self, page_idx):
+        """
+        The fitz.Page for `page_idx` (text layer, geometry). Use it, and let
+        it go, while holding MUPDF_LOCK.
+        """
+        with MUPDF_LOCK:
+            return self.doc.load_page(page_idx)
+
+    def render(self, page_idx, dpi=None, clip=None):
+        """
+        Render (part of) a page without touching the page cache.
+
+        Args:
+            dpi: defaults to the source DPI
+            clip: optional fitz.Rect in page points (rotated page space)
+
+        Returns:
+            tuple: (image, (x0, y0)) where (x0, y0) is the pixel origin of the
+                   image within the full page rendered at the same DPI.
+        """
+        with MUPDF_LOCK:
+            pixmap = self.doc.load_page(page_idx).get_pixmap(dpi=dpi or self.dpi, clip=clip)
+            img, origin = pixmap_to_ndarray(pixmap, self.channel_order), (pixmap.x, pixmap.y)
+            del pixmap
+        return img, origin
+
+    def close(self):
+        self._cache.clear()
+        with MUPDF_LOCK:
+            if not self.doc.is_closed:
+                self.doc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class _PageSelection:
+    def __init__(self, source, page_indices):
+        self.source = source
+        self.page_indices = page_indices
+
+    def __len__(self):
+        return len(self.page_indices)
+
+    def __getitem__(self, idx):
+        return self.source[self.page_indices[idx]]
+
+def convert_pdf_with_pymupdf(pdf_path, dpi=RENDER_DPI):
+    """
+    Render every page to a PIL image. Holds the whole document in memory;
+    prefer PdfPageSource for the pipeline.
+    """
     images = []
-    for page_number in range(len(doc)):
-        page = doc.load_page(page_number)
-        pixmap = page.get_pixmap(dpi=300)
+    with MUPDF_LOCK:
+        doc = fitz.open(pdf_path)
+        for page_number in range(len(doc)):
+            page = doc.load_page(page_number)
+            pixmap = page.get_pixmap(dpi=dpi)
 
-        # Convert pixmap to a PIL Image object
-        img = Image.frombytes("RGB", [pixmap.width, pixmap.height], pixmap.samples)
-        images.append(img)
+            # Convert pixmap to a PIL Image object
+            img = Image.frombytes("RGB", [pixmap.width, pixmap.height], pixmap.samples)
+            images.append(img)
+            del page, pixmap
 
-    doc.close()
+        doc.close()
     return images
 
 def load_attribute_schema(file_path):
@@ -38,16 +198,24 @@ def load_attribute_schema(file_path):
         logging.error(f"Unexpected error loading schema from {file_path}: {e}")
         raise
 
-def get_attribute_info_by_key(search_key, schema):
+def get_attribute_info_by_key(search_key, schema, index=None):
     """
     Look up an attribute by normalized key (case-insensitive, stripped).
     Returns dict with 'data_type', 'values' (normalized), and 'product_types',
     or None if not found.
+
+    Pass `index` (from compiled_schema.build_attribute_index(schema)) when
+    looking up many keys in the same schema, to avoid a scan per call.
     """
     search_key_norm = search_key.strip().lower()
     logging.debug(f"Searching for attribute key: '{search_key}' (normalized: '{search_key_norm}')")
 
-    for orig_key, attr in schema.items():
+    if index is not None:
+        candidates = [(index[search_key_norm], schema[index[search_key_norm]])] if search_key_norm in index else []
+    else:
+        candidates = schema.items()
+
+    for orig_key, attr in candidates:
         if orig_key.strip().lower() == search_key_norm:
             logging.debug(f"Match found for key: '{search_key}' → original key: '{orig_key}'")
             result = {
@@ -78,14 +246,24 @@ def save_llm_output(response, output_dir="final_result", base_name="output"):
     return response
 
 
+def write_json_atomic(path, data, indent=2):
+    """
+    Write JSON to a temp file next to `path` and rename it into place, so
+    concurrent readers and writers never see a partially written file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
 def save_final_result(final_result, output_dir="final_result", base_name="output"):
     output_path = os.path.join(output_dir, f"final_result_{base_name}.json")
     
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
     
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(final_result, f, indent=2, ensure_ascii=False)
+    write_json_atomic(output_path, final_result)
     
     logging.info(f"Final result saved to: {output_path}")
     
@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from config import LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES
+from cache_store import LRUCacheStore
+from helper import file_sha256
+
+logger = logging.getLogger(__name__)
+
+# Bump when the key derivation or the stored payload changes
+LLM_CACHE_VERSION = 1
+
+_llm_cache = None
+_llm_cache_enabled = True
+_model_hashes = {}      # (path, size, mtime) -> sha256, for this process
+_model_hash_lock = threading.Lock()
+
+
+def set_llm_cache_enabled(enabled):
+    """Turns the LLM response cache on or off for this process (e.g. --no-llm-cache)."""
+    global _llm_cache_enabled
+    _llm_cache_enabled = bool(enabled)
+
+
+def get_llm_cache():
+    """
+    Returns the global on-disk LLM response cache, creating it if necessary,
+    or None when it is disabled.
+    """
+    global _llm_cache
+    if not _llm_cache_enabled:
+        return None
+    if _llm_cache is None:
+        _llm_cache = LRUCacheStore(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, name="llm_cache")
+    return _llm_cache
+
+
+def model_file_hash(model_path, cache=None):
+    """
+    sha256 of the model file, so cache entries follow the weights rather
+    than the file name. Hashing a multi-GB GGUF takes seconds, so the hash
+    is kept per (path, size, mtime): in memory, and in `cache` for later runs.
+    """
+    stat = os.stat(model_path)
+    memo_key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns)
+    with _model_hash_lock:
+        digest = _model_hashes.get(memo_key)
+        if digest is not None:
+            return digest
+
+        store_key = "model-sha256:{}:{}:{}".format(*memo_key)
+        payload = cache.get(store_key) if cache is not None else None
+        if payload is not None:
+            digest = payload.decode("ascii")
+        else:
+            start = time.perf_counter()
+            digest = file_sha256(model_path)
+            logger.info(f"Hashed {os.path.basename(model_path)} in {time.perf_counter() - start:.1f}s")
+            if cache is not None:
+                cache.put(store_key, digest.encode("ascii"))
+        _model_hashes[memo_key] = digest
+        return digest
+
+
+def llm_cache_key(model_hash, messages, params):
+    """
+    Content address of one chat completion: the model weights, the full
+    message list and the sampling parameters.
+    """
+    request = json.dumps(
+        {"model": model_hash, "messages": messages, "params": params},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+    )
+    return f"v{LLM_CACHE_VERSION}:{hashlib.sha256(request.encode('utf-8')).hexdigest()}"
+
+
+def get_cached_response(cache, key):
+    """Cached response text for `key`, or None."""
+    payload = cache.get(key)
+    if payload is None:
+        return None
+    try:
+        return json.loads(payload.decode("utf-8"))["content"]
+    except (ValueError, KeyError) as e:
+        logger.warning(f"Ignoring unreadable cached LLM response {key}: {e}")
+        return None
+
+
+def put_cached_response(cache, key, content, usage=None):
+    record = {"content": content, "usage": usage, "created": time.time()}
+    cache.put(key, json.dumps(record, ensure_ascii=False).encode("utf-8"))
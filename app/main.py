@@ -2,17 +2,102 @@ import argparse
 import glob
 import os
 import shutil
-from process_lighting_spec_sheet import process_lighting_spec_sheet
+from process_lighting_spec_sheet import (
+    process_lighting_spec_sheet,
+    prepare_schema_artifacts,
+    new_document_job,
+    DOCUMENT_STAGES,
+)
 from model_loader import get_ocr_instance
+from ocr import get_ocr_cache, make_ocr_batcher
+from table_handler import get_layout_cache
+from llm_cache import get_llm_cache, set_llm_cache_enabled
+from model_server import set_model_server_enabled
+from generate_mouting import llm_stats, add_llm_stats
+from config import OCR_BATCH_SIZE, OCR_BATCH_MAX_WAIT, PIPELINE_QUEUE_SIZE, PIPELINE_STAGE_WORKERS
+from worker_pool import run_documents_in_workers, merge_cache_stats
+from pipeline import Pipeline, Stage
+
+def move_processed_pdf(pdf_path, is_hit, success_dir, not_found_dir):
+    filename = os.path.basename(pdf_path)
+    if is_hit:
+        dest = os.path.join(success_dir, filename)
+        print(f"✅ Success: moving {filename} to success folder")
+    else:
+        dest = os.path.join(not_found_dir, filename)
+        print(f"❌ No match: moving {filename} to not_found folder")
+
+    # Move original PDF
+    shutil.move(pdf_path, dest)
+
+def print_llm_stats(cache_stats=None):
+    """LLM counters of this process (workers' merged in), and `cache_stats` or this process's LLM cache stats."""
+    stats = llm_stats()
+    if stats["completions"] or stats["cache_hits"]:
+        print(
+            f"\n🤖 LLM: {stats['completions']} completion(s), {stats['completion_tokens']} token(s) generated "
+            f"({stats['prompt_tokens']} prompt, {stats['prompt_tokens_reused']} of them reused from the KV cache "
+            f"instead of evaluated), {stats['cache_hits']} served from cache; "
+            f"JSON: {stats['json_attempts']} attempt(s) for {stats['json_requests']} request(s), "
+            f"{stats['json_failures']} failed"
+        )
+    if cache_stats is None:
+        llm_cache = get_llm_cache()
+        cache_stats = llm_cache.stats() if llm_cache is not None else None
+    if cache_stats is not None and (cache_stats["hits"] or cache_stats["misses"]):
+        stats = cache_stats
+        print(
+            f"🤖 LLM cache: {stats['hits']} hit(s), {stats['misses']} miss(es), "
+            f"{stats['entries']} entr{'y' if stats['entries'] == 1 else 'ies'} / {stats['bytes'] / 1e6:.1f} MB stored"
+        )
+
+def print_run_stats(ocr_stats, ocr_cache_stats=None, layout_cache_stats=None):
+    """
+    OCR throughput and cache counters. `ocr_stats` is an InferenceBatcher's
+    stats(), or the merged stats of the worker processes (their pages/sec
+    in predict is the mean per worker; wall is for the whole run).
+    """
+    if ocr_stats["items"]:
+        print(
+            f"\n🔠 OCR: {ocr_stats['items']} image(s) in {ocr_stats['batches']} batch(es), "
+            f"{ocr_stats['items'] / max(ocr_stats['busy_time'], 1e-9):.2f} pages/sec in predict, "
+            f"{ocr_stats['items_per_sec']:.2f} pages/sec wall"
+        )
+
+    if ocr_cache_stats is not None:
+        print(
+            f"\n🗂️ OCR cache: {ocr_cache_stats['hits']} hit(s), {ocr_cache_stats['misses']} miss(es), "
+            f"{ocr_cache_stats['entries']} page(s) / {ocr_cache_stats['bytes'] / 1e6:.1f} MB stored"
+        )
+
+    if layout_cache_stats is not None:
+        print(
+            f"\n📐 Layout cache: {layout_cache_stats['hits']} hit(s), {layout_cache_stats['misses']} miss(es), "
+            f"{layout_cache_stats['entries']} page(s) stored"
+        )
 
 def main():
     parser = argparse.ArgumentParser(description="Extract structured lighting specs from PDF spec sheets.")
     parser.add_argument("--gpu", action="store_true", help="Use GPU (handled internally by model loader)")
     parser.add_argument("--input", required=True, type=str, help="Path to folder containing input PDF files")
     parser.add_argument("--schema", required=True, type=str, help="Path to schema JSON file")
+    parser.add_argument("--force-ocr", action="store_true", help="Ignore the PDF text layer and OCR every page")
+    parser.add_argument("--no-ocr-cache", action="store_true", help="Do not read or write the on-disk OCR cache")
+    parser.add_argument("--no-layout-cache", action="store_true", help="Do not read or write the on-disk table-region cache")
+    parser.add_argument("--no-llm-cache", action="store_true", help="Do not read or write the on-disk LLM response cache")
+    parser.add_argument("--no-model-server", action="store_true", help="Load models in this process even if a model server (model_server.py) is running")
+    parser.add_argument("--multires", action="store_true", help="OCR only text regions found by a low-DPI layout pass")
+    parser.add_argument("--ocr-batch-size", type=int, default=OCR_BATCH_SIZE, help="Page images per OCR predict call")
+    parser.add_argument("--ocr-max-wait", type=float, default=OCR_BATCH_MAX_WAIT, help="Seconds to wait for a full OCR batch")
+    parser.add_argument("--workers", type=int, default=1, help="Process PDFs in N worker processes")
+    parser.add_argument("--no-preload", action="store_true", help="With --workers, start workers as fresh interpreters instead of forking them from a process that has the model libraries imported")
+    parser.add_argument("--pipeline", action="store_true", help="Overlap OCR, matching and layout of consecutive PDFs in a staged pipeline")
 
     args = parser.parse_args()
 
+    set_llm_cache_enabled(not args.no_llm_cache)
+    set_model_server_enabled(not args.no_model_server)
+
     input_pdf_folder = args.input
     schema_path = args.schema
 
@@ -41,34 +126,128 @@ def main():
     os.makedirs(not_found_dir, exist_ok=True)
 
     print(f"📄 Found {len(pdf_paths)} PDF(s) to process.\n")
+
+    if args.workers > 1:
+        # Schema-level LLM outputs are shared by all documents: build them once
+        # here so workers only ever read those cache files.
+        prepare_schema_artifacts(schema_path, output_dir=output_dir, use_gpu=args.gpu)
+
+        def on_result(pdf_path, is_hit, error):
+            if error is not None:
+                print(f"⚠️ Error processing {pdf_path}: {error}")
+                return
+            try:
+                move_processed_pdf(pdf_path, is_hit, success_dir, not_found_dir)
+            except Exception as e:
+                print(f"⚠️ Error moving {pdf_path}: {e}")
+
+        print(f"🧵 Processing with {args.workers} worker process(es)")
+        totals = run_documents_in_workers(
+            pdf_paths,
+            schema_path,
+            args.workers,
+            on_result,
+            process_kwargs={
+                "output_dir": output_dir,
+                "use_gpu": args.gpu,
+                "use_text_layer": not args.force_ocr,
+                "multires": args.multires,
+            },
+            worker_options={
+                "no_ocr_cache": args.no_ocr_cache,
+                "no_layout_cache": args.no_layout_cache,
+                "no_llm_cache": args.no_llm_cache,
+                "no_model_server": args.no_model_server,
+                "ocr_batch_size": args.ocr_batch_size,
+                "ocr_max_wait": args.ocr_max_wait,
+            },
+            preload=not args.no_preload,
+        )
+        print(
+            f"\n📄 {totals['documents']} document(s) in {totals['elapsed']:.1f}s "
+            f"({totals['documents'] / max(totals['elapsed'], 1e-9) * 60:.1f} per minute)"
+        )
+        if "ocr" in totals:
+            ocr_stats = dict(totals["ocr"], items_per_sec=totals["ocr"]["items"] / max(totals["elapsed"], 1e-9))
+            print_run_stats(ocr_stats, totals["ocr_cache"], totals["layout_cache"])
+            add_llm_stats(totals["llm"])
+        llm_cache = get_llm_cache()
+        print_llm_stats(merge_cache_stats(llm_cache.stats() if llm_cache is not None else None, totals.get("llm_cache")))
+        print("\n✨ All done!")
+        return
+
     ocr_engine = get_ocr_instance()
-    # Process each PDF
-    for pdf_path in pdf_paths:
-        try:
-            print(f"\n--- Processing: {os.path.basename(pdf_path)} ---")
-            is_hit = process_lighting_spec_sheet(
-                pdf_path,
-                schema_path,
-                ocr_engine,
-                output_dir=output_dir,
-                use_gpu=args.gpu
-            )
+    ocr_cache = None if args.no_ocr_cache else get_ocr_cache()
+    layout_cache = None if args.no_layout_cache else get_layout_cache()
+    ocr_batcher = make_ocr_batcher(ocr_engine, batch_size=args.ocr_batch_size, max_wait=args.ocr_max_wait)
+    process_kwargs = {
+        "output_dir": output_dir,
+        "use_gpu": args.gpu,
+        "use_text_layer": not args.force_ocr,
+        "ocr_cache": ocr_cache,
+        "multires": args.multires,
+        "ocr_batcher": ocr_batcher,
+        "layout_cache": layout_cache,
+    }
 
-            filename = os.path.basename(pdf_path)
-            if is_hit:
-                dest = os.path.join(success_dir, filename)
-                print(f"✅ Success: moving {filename} to success folder")
-            else:
-                dest = os.path.join(not_found_dir, filename)
-                print(f"❌ No match: moving {filename} to not_found folder")
+    if args.pipeline:
+        prepare_schema_artifacts(schema_path, output_dir=output_dir, use_gpu=args.gpu)
 
-            # Move original PDF
-            shutil.move(pdf_path, dest)
+        def on_done(job):
+            try:
+                move_processed_pdf(job["pdf_path"], job["success"], success_dir, not_found_dir)
+            except Exception as e:
+                print(f"⚠️ Error moving {job['pdf_path']}: {e}")
 
-        except Exception as e:
-            print(f"⚠️ Error processing {pdf_path}: {e}")
-            # Optionally move to an error folder (not implemented here)
+        def on_error(job, stage_name, exc):
+            if "pages" in job:
+                job["pages"].close()
+            print(f"⚠️ Error processing {job['pdf_path']} ({stage_name} stage): {exc}")
 
+        pipeline = Pipeline(
+            [
+                Stage(name, fn, workers=PIPELINE_STAGE_WORKERS.get(name, 1), queue_size=PIPELINE_QUEUE_SIZE)
+                for name, fn in DOCUMENT_STAGES
+            ],
+            on_done=on_done,
+            on_error=on_error,
+        ).start()
+        for pdf_path in pdf_paths:
+            pipeline.submit(new_document_job(pdf_path, schema_path, ocr_engine, **process_kwargs))
+        pipeline.close()
+
+        print("\n🧮 Pipeline stages:")
+        for name, st in pipeline.stats().items():
+            print(
+                f"   {name:<8} {st['items']} done, {st['errors']} failed, "
+                f"queue depth mean {st['mean_queue_depth']:.1f} / max {st['max_queue_depth']}, "
+                f"utilization {st['utilization']:.0%}"
+            )
+    else:
+        # Process each PDF
+        for pdf_path in pdf_paths:
+            try:
+                print(f"\n--- Processing: {os.path.basename(pdf_path)} ---")
+                is_hit = process_lighting_spec_sheet(
+                    pdf_path,
+                    schema_path,
+                    ocr_engine,
+                    **process_kwargs
+                )
+
+                move_processed_pdf(pdf_path, is_hit, success_dir, not_found_dir)
+
+            except Exception as e:
+                print(f"⚠️ Error processing {pdf_path}: {e}")
+                # Optionally move to an error folder (not implemented here)
+
+    ocr_batcher.close()
+    print_run_stats(
+        ocr_batcher.stats(),
+        ocr_cache.stats() if ocr_cache is not None else None,
+        layout_cache.stats() if layout_cache is not None else None,
+    )
+    print_llm_stats()
     print("\n✨ All done!")
 
 if __name__ == "__main__":
@@ -0,0 +1,323 @@
+import re
+import logging
+from collections import deque
+from functools import lru_cache
+from helper import ocr_fold, ocr_fold_term, ocr_char_options, ocr_match_at
+from full_text import lowered, folded
+
+logger = logging.getLogger(__name__)
+
+
+class AhoCorasick:
+    """
+    Multi-pattern substring matcher (Aho-Corasick automaton).
+
+    Built once from (pattern, payload) pairs; `find_all(text)` then reports
+    the payloads of every pattern occurring in `text` in a single pass,
+    however many patterns there are. Several patterns may share a payload
+    and one pattern may carry several payloads.
+    """
+
+    def __init__(self, patterns):
+        self._goto = [{}]      # state -> {char: next state}
+        self._fail = [0]       # state -> longest proper suffix state
+        self._out = [set()]    # state -> payloads of patterns ending here
+        self.n_patterns = 0
+
+        for pattern, payload in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(set())
+                state = nxt
+            self._out[state].add(payload)
+            self.n_patterns += 1
+
+        self._build_fail_links()
+        # Frozen outputs: tuples iterate faster in the search loop
+        self._out = [tuple(out) for out in self._out]
+
+    def _build_fail_links(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        pending = deque(goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, nxt in goto[state].items():
+                pending.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] |= out[fail[nxt]]
+
+    @property
+    def n_states(self):
+        return len(self._goto)
+
+    def iter_matches(self, text):
+        """
+        Yields (end_index, payload) for every pattern occurrence in `text`;
+        end_index is exclusive.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        for payload in out[0]:  # empty patterns match everywhere
+            yield 0, payload
+        state = 0
+        for idx, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for payload in out[state]:
+                yield idx + 1, payload
+
+    def find_all(self, text):
+        """Set of payloads whose patterns occur anywhere in `text`."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set(out[0])
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+WORD_RE = re.compile(r"\b\w+\b")
+
+# Delimiters allowed between a key and its value, optionally followed by whitespace
+KEY_VALUE_DELIMITERS = ":-–—="
+
+
+class TermMatcher:
+    """
+    Finds OCR variants of many terms at once without expanding them.
+
+    Terms and text are folded onto OCR confusion classes (see `ocr_fold`),
+    so every term is a single automaton pattern. Each folded hit is then
+    checked character by character against the term's allowed characters,
+    which gives exactly the hits of the `generate_ocr_variants` expansion.
+    Folding keeps lengths, so offsets are offsets into the original text.
+    """
+
+    def __init__(self, terms):
+        self.terms = terms
+        self.options = {term: ocr_char_options(term) for term in terms}
+        self.automaton = AhoCorasick((ocr_fold_term(term), term) for term in terms)
+
+    def iter_matches(self, text_lower, folded=None):
+        """
+        Yields (start, end, term) for every occurrence of an OCR variant of a
+        term in `text_lower` (text from `lower_preserving_length`).
+        """
+        if folded is None:
+            folded = ocr_fold(text_lower)
+        for end, term in self.automaton.iter_matches(folded):
+            options = self.options[term]
+            start = end - len(options)
+            if ocr_match_at(options, text_lower, start):
+                yield start, end, term
+
+    def find_all(self, text_lower, folded=None):
+        """Set of terms with at least one OCR variant in `text_lower`."""
+        found = set()
+        for _, _, term in self.iter_matches(text_lower, folded):
+            found.add(term)
+        return found
+
+
+@lru_cache(maxsize=32)
+def compile_term_matcher(terms):
+    """
+    TermMatcher over every term in `terms`. Cached per terms tuple, so a
+    schema or mounting lookup is compiled once and reused for every
+    document.
+
+    Args:
+        terms (tuple): Hashable tuple of search terms (strings)
+
+    Returns:
+        TermMatcher whose matches report the original terms
+    """
+    matcher = TermMatcher(terms)
+    logger.debug(f"Compiled term matcher: {len(terms)} term(s), {matcher.automaton.n_states} state(s)")
+    return matcher
+
+
+def _term_tuple(terms):
+    return tuple(sorted({str(t) for t in terms}))
+
+
+def find_terms(big_text, terms):
+    """
+    Terms from `terms` with at least one OCR variant in `big_text`, in one
+    pass over the folded text (cached when `big_text` is a FullText).
+
+    Args:
+        big_text (str): Text to search
+        terms (iterable): Search terms; non-strings are matched by str()
+
+    Returns:
+        set of matched terms (as strings)
+    """
+    terms = _term_tuple(terms)
+    if not terms:
+        return set()
+    return compile_term_matcher(terms).find_all(lowered(big_text), folded(big_text))
+
+
+def iter_term_matches(big_text, terms):
+    """
+    Like `find_terms`, but yields every (start, end, term) occurrence with
+    offsets into `big_text` (resolve them to OCR boxes with
+    `FullText.locate_span`).
+    """
+    terms = _term_tuple(terms)
+    if not terms:
+        return iter(())
+    return compile_term_matcher(terms).iter_matches(lowered(big_text), folded(big_text))
+
+
+def key_value_starts(text_lower, key_end):
+    """
+    Positions where a value may start after a key ending at `key_end`:
+    after an optional delimiter (':', '-', en/em dash, '=') and any
+    whitespace. At most two, with and without the delimiter.
+    """
+    if key_end < len(text_lower) and text_lower[key_end] in KEY_VALUE_DELIMITERS:
+        candidates = (key_end + 1, key_end)
+    else:
+        candidates = (key_end,)
+
+    starts = []
+    for pos in candidates:
+        while pos < len(text_lower) and text_lower[pos].isspace():
+            pos += 1
+        starts.append(pos)
+    return starts
+
+
+class KeyValueMatcher:
+    """
+    "<key><delimiter?><whitespace*><value>" search for one key and all of
+    its values, OCR-tolerant on the value side.
+
+    The values are compiled into one trie over their folded forms. A scan
+    finds each occurrence of the (lowercased, literal) key, then walks the
+    trie from the at most two positions where a value may start, so every
+    value is tried at once instead of one regex per value and variant.
+    """
+
+    def __init__(self, key, values):
+        self.key = key.strip().lower()
+        self.trie = {}          # folded char -> child node; None -> values ending here
+        self.options = {}       # value -> ocr_char_options of its cleaned form
+        self.n_values = 0
+
+        for value in values:
+            value_clean = str(value).strip()
+            if not value_clean:
+                continue
+            node = self.trie
+            for ch in ocr_fold_term(value_clean):
+                node = node.setdefault(ch, {})
+            node.setdefault(None, []).append(value)
+            self.options[value] = ocr_char_options(value_clean)
+            self.n_values += 1
+
+    def search(self, text_lower, folded=None, stop_at_first=False):
+        """
+        Values found right after the key in `text_lower` (text from
+        `lower_preserving_length`; `folded` is its `ocr_fold`, pass it when
+        scanning the same text for many keys).
+
+        Returns:
+            dict: {value: (key_start, value_start, value_end)} for the first
+            occurrence of each matched value, offsets into the text
+        """
+        hits = {}
+        if not self.key or not self.n_values:
+            return hits
+        if folded is None:
+            folded = ocr_fold(text_lower)
+
+        text_len = len(text_lower)
+        key_start = text_lower.find(self.key)
+        while key_start != -1:
+            for value_start in key_value_starts(text_lower, key_start + len(self.key)):
+                node, pos = self.trie, value_start
+                while node is not None:
+                    for value in node.get(None, ()):
+                        if value not in hits and ocr_match_at(self.options[value], text_lower, value_start):
+                            hits[value] = (key_start, value_start, pos)
+                            if stop_at_first:
+                                return hits
+                    node = node.get(folded[pos]) if pos < text_len else None
+                    pos += 1
+            if len(hits) == self.n_values:
+                break
+            key_start = text_lower.find(self.key, key_start + 1)
+        return hits
+
+
+@lru_cache(maxsize=4096)
+def _compile_key_value_matcher(key, values):
+    return KeyValueMatcher(key, values)
+
+
+def compile_key_value_matcher(key, values):
+    """
+    KeyValueMatcher for `key` and `values`, cached per (key, values) so the
+    matchers for a schema are built once and reused for every document.
+    """
+    return _compile_key_value_matcher(key, tuple(values))
+
+
+class KeyTokenIndex:
+    """
+    Hash index of keys as lowercase word tuples, for finding keys as exact
+    word sequences in a line of text.
+
+    Keys are bucketed by first word and word count, so a line is matched by
+    looking up, at each word, only the n-grams that some key starting with
+    that word could form: O(words) per line instead of O(keys x words).
+    """
+
+    def __init__(self, keys):
+        self.keys = {}          # word tuple -> (position, original key)
+        self.lengths = {}       # first word -> word counts of keys starting with it
+        self.match_empty = None
+
+        for key in keys:
+            words = tuple(WORD_RE.findall(key.lower()))
+            # Same word tuple twice: the first key keeps its position, the last one wins
+            position = self.keys[words][0] if words in self.keys else len(self.keys)
+            self.keys[words] = (position, key)
+
+        for words, entry in self.keys.items():
+            if words:
+                self.lengths.setdefault(words[0], set()).add(len(words))
+            else:
+                self.match_empty = entry   # a key without words matches every line
+        self.lengths = {first: sorted(counts) for first, counts in self.lengths.items()}
+
+    def find(self, text):
+        """Keys whose words occur consecutively in `text`, in key order."""
+        words = WORD_RE.findall(text.lower())
+        found = {self.match_empty} if self.match_empty else set()
+        keys, lengths = self.keys, self.lengths
+        n_words = len(words)
+        for i, word in enumerate(words):
+            for count in lengths.get(word, ()):
+                if i + count > n_words:
+                    break
+                entry = keys.get(tuple(words[i:i + count]))
+                if entry is not None:
+                    found.add(entry)
+        return [key for _, key in sorted(found)]
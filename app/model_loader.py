@@ -1,11 +1,20 @@
 import os
+import queue
 import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
 from huggingface_hub import hf_hub_download
-from llama_cpp import Llama
+import llama_cpp
+from llama_cpp import Llama, LlamaRAMCache
 from paddleocr import PaddleOCR
+from doclayout_yolo import YOLOv10
+from model_server import get_model_server, RemoteOcr, RemoteLayoutModel, RemoteLlama
 from config import (
     LLM_FILENAME, LLM_REPO_ID,
-    LLM_FILENAME_GPU, LLM_REPO_ID_GPU  # Import GPU versions
+    LLM_FILENAME_GPU, LLM_REPO_ID_GPU,  # Import GPU versions
+    LAYOUT_IMGSZ, LAYOUT_CONF, LAYOUT_DEVICE, LAYOUT_NUM_THREADS,
+    LLM_PREFIX_CACHE_BYTES,
 )
 # from unsloth import FastLanguageModel
 
@@ -16,7 +25,9 @@ logger = logging.getLogger(__name__)
 
 # Global variable to hold the OCR instance
 _ocr_instance = None
+_layout_model = None
 llm = None
+_llm_paths = {}     # use_gpu -> local GGUF path
 def get_yolo_model_path():
     """
     Returns the path to the YOLO model, downloading it if necessary.
@@ -45,6 +56,48 @@ def get_yolo_model_path():
 
     return model_path
 
+# Layout predict settings; also part of the layout cache key.
+LAYOUT_SETTINGS = {
+    "model": "doclayout_yolo_docstructbench_imgsz1280_2501.pt",
+    "imgsz": LAYOUT_IMGSZ,
+    "conf": LAYOUT_CONF,
+    "device": LAYOUT_DEVICE,
+}
+
+def load_layout_model(warmup=True):
+    """
+    Loads the doclayout_yolo model in this process (and runs one warmup
+    prediction so the first real page doesn't pay for graph setup).
+    """
+    if LAYOUT_NUM_THREADS:
+        import torch
+        torch.set_num_threads(LAYOUT_NUM_THREADS)
+    logger.info("Initializing doclayout_yolo model...")
+    model = YOLOv10(get_yolo_model_path())
+    if warmup:
+        model.predict(
+            np.full((LAYOUT_IMGSZ, LAYOUT_IMGSZ, 3), 255, dtype=np.uint8),
+            imgsz=LAYOUT_SETTINGS["imgsz"],
+            conf=LAYOUT_SETTINGS["conf"],
+            device=LAYOUT_SETTINGS["device"],
+            verbose=False,
+        )
+    return model
+
+def get_layout_model(warmup=True):
+    """
+    Returns the global doclayout_yolo model: a proxy to the running model
+    server, or the model loaded in this process if there is none.
+    """
+    global _layout_model
+    if _layout_model is None:
+        server = get_model_server()
+        if server is not None and server.serves("layout"):
+            _layout_model = RemoteLayoutModel(server, lambda: load_layout_model(warmup))
+        else:
+            _layout_model = load_layout_model(warmup)
+    return _layout_model
+
 # qwen_model_instance = None
 # tokenizer_instance = None
     # global qwen_model_instance, tokenizer_instance
@@ -82,38 +135,171 @@ def get_qwen_model_path(use_gpu=False):
     logger.info(f"Model downloaded to: {local_file_path}")
     return local_file_path
 
-def get_llm_instance(use_gpu=False):
-    global llm
+def get_llm_model_path(use_gpu=False):
+    """
+    Local path of the Qwen GGUF file, resolved (and downloaded) once per
+    process.
+    """
+    if use_gpu not in _llm_paths:
+        _llm_paths[use_gpu] = get_qwen_model_path(use_gpu)
+    return _llm_paths[use_gpu]
+
+def create_llm(use_gpu=False):
+    """
+    A new Llama context over the Qwen model: a proxy to the running model
+    server when it serves the same (CPU/GPU) model, else loaded in this
+    process. The GGUF file is mmapped, so on CPU further contexts share the
+    weights and only add their own KV cache.
+    """
+    server = get_model_server()
+    if server is not None and server.serves("llm") and server.info.get("use_gpu") == use_gpu:
+        return RemoteLlama(server, lambda: load_llm(use_gpu))
+    return load_llm(use_gpu)
+
+def load_llm(use_gpu=False):
+    """
+    Loads a Llama context over the Qwen model in this process. llama-cpp
+    keeps the KV state of the last prompt in the context, so a prompt that
+    starts like the previous one only evaluates the rest. With
+    LLM_PREFIX_CACHE_BYTES set, a RAM cache of saved states extends that to
+    any earlier prompt (e.g. mounting and regex prompts interleaving).
+    """
     if use_gpu:
         n_gpu = -1
     else:
         n_gpu = 0
-    if llm is None:
-        llm_path = get_qwen_model_path(use_gpu)
-        llm = Llama(
-        model_path=llm_path,
-        n_gpu_layers=n_gpu,         # Offload all possible layers to the GPU
-        n_batch=512,             # Process up to 512 tokens in parallel
-        n_ctx=8192,             # Context window size
-        verbose=False            # Set to True to see detailed loading information
+    llm_path = get_llm_model_path(use_gpu)
+    instance = Llama(
+    model_path=llm_path,
+    n_gpu_layers=n_gpu,         # Offload all possible layers to the GPU
+    n_batch=512,             # Process up to 512 tokens in parallel
+    n_ctx=8192,             # Context window size
+    verbose=False            # Set to True to see detailed loading information
+    )
+    if LLM_PREFIX_CACHE_BYTES:
+        instance.set_cache(PrefixStateCache(capacity_bytes=LLM_PREFIX_CACHE_BYTES))
+    return instance
+
+class PrefixStateCache(LlamaRAMCache):
+    """
+    LlamaRAMCache whose capacity also covers the logits and token ids each
+    saved state carries: LlamaRAMCache only counts the llama.cpp state
+    buffer, while save_state() adds a copy of up to n_batch x n_vocab
+    float32 scores (~297 MiB for Qwen3), so the real footprint could reach
+    several times capacity_bytes.
+    """
+
+    @property
+    def cache_size(self):
+        return sum(
+            state.llama_state_size + state.scores.nbytes + state.input_ids.nbytes
+            for state in self.cache_state.values()
         )
+
+def _reset_prompt_eval_count(instance):
+    if hasattr(llama_cpp, "llama_perf_context_reset"):
+        llama_cpp.llama_perf_context_reset(instance.ctx)
+    elif hasattr(llama_cpp, "llama_reset_timings"):     # llama-cpp-python < 0.3
+        llama_cpp.llama_reset_timings(instance.ctx)
+
+def _prompt_eval_count(instance):
+    """Prompt tokens evaluated on the context since the last reset, or None if the binding can't tell."""
+    if hasattr(llama_cpp, "llama_perf_context"):
+        return llama_cpp.llama_perf_context(instance.ctx).n_p_eval
+    if hasattr(llama_cpp, "llama_get_timings"):
+        return llama_cpp.llama_get_timings(instance.ctx).n_p_eval
+    return None
+
+def chat_completion(instance, **kwargs):
+    """
+    instance.create_chat_completion(**kwargs), with
+    usage["prompt_tokens_reused"]: prompt tokens whose KV state was already
+    in the context or its prefix cache, so they were not evaluated. Calls
+    through the model server get it from the server.
+
+    The caller must hold the context (one thread per context).
+    """
+    if isinstance(instance, RemoteLlama):
+        return instance.create_chat_completion(**kwargs)
+    _reset_prompt_eval_count(instance)
+    response = instance.create_chat_completion(**kwargs)
+    evaluated = _prompt_eval_count(instance)
+    usage = response.get("usage")
+    if evaluated is not None and usage:
+        usage["prompt_tokens_reused"] = max(0, usage.get("prompt_tokens", 0) - evaluated)
+    return response
+
+def get_llm_instance(use_gpu=False):
+    global llm
+    if llm is None:
+        llm = create_llm(use_gpu)
     return llm
 
+class LlamaPool:
+    """
+    Up to `size` Llama contexts for concurrent generation, one thread per
+    context at a time. The first is the global instance; the others are
+    created only when every existing context is busy. llama.cpp releases
+    the GIL while decoding, so threads using different contexts run in
+    parallel.
+    """
+
+    def __init__(self, size, use_gpu=False):
+        self.size = max(1, size)
+        self.use_gpu = use_gpu
+        self._free = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        try:
+            instance = self._free.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                index = self._created if self._created < self.size else None
+                if index is not None:
+                    self._created += 1
+            if index is None:
+                instance = self._free.get()
+            elif index == 0:
+                instance = get_llm_instance(self.use_gpu)
+            else:
+                logger.info(f"Creating llama context {index + 1}/{self.size}...")
+                instance = create_llm(self.use_gpu)
+        try:
+            yield instance
+        finally:
+            self._free.put(instance)
+
+# PaddleOCR settings; also part of the OCR cache key, so any change here
+# invalidates cached OCR results.
+OCR_SETTINGS = {
+    "lang": "en",
+    "text_detection_model_name": "PP-OCRv5_mobile_det",
+    "text_recognition_model_name": "PP-OCRv5_mobile_rec",
+    "use_doc_orientation_classify": False,
+    "use_doc_unwarping": False,
+    "use_textline_orientation": False,
+    # "text_det_limit_side_len": 640,
+    "text_recognition_batch_size": 16,
+}
+
 def get_ocr_instance():
     """
-    Returns the global OCR instance, initializing it if necessary.
+    Returns the global OCR instance, initializing it if necessary: a proxy
+    to the running model server, or PaddleOCR loaded in this process.
     """
     global _ocr_instance
     if _ocr_instance is None:
-        logger.info("Initializing PaddleOCR model...")
-        _ocr_instance = PaddleOCR(
-            lang="en",
-            text_detection_model_name="PP-OCRv5_mobile_det",
-            text_recognition_model_name="PP-OCRv5_mobile_rec",
-            use_doc_orientation_classify=False,
-            use_doc_unwarping=False,
-            use_textline_orientation=False,
-            # text_det_limit_side_len=640,
-            text_recognition_batch_size=16,
-        )
-    return _ocr_instance
\ No newline at end of file
+        server = get_model_server()
+        if server is not None and server.serves("ocr"):
+            _ocr_instance = RemoteOcr(server, load_ocr)
+        else:
+            _ocr_instance = load_ocr()
+    return _ocr_instance
+
+def load_ocr():
+    """Loads PaddleOCR in this process."""
+    logger.info("Initializing PaddleOCR model...")
+    return PaddleOCR(**OCR_SETTINGS)
\ No newline at end of file
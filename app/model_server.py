@@ -0,0 +1,391 @@
+import os
+import sys
+import time
+import signal
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Listener, Client
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from config import MODEL_SERVER_SOCKET, MODEL_SERVER_KEY_PATH, LLM_PARALLEL_CONTEXTS
+from ocr_page import OcrPage
+
+logger = logging.getLogger(__name__)
+
+# Bump when requests or replies change shape
+MODEL_SERVER_PROTOCOL = 2
+
+_client = None
+_client_pid = None
+_client_enabled = True
+_client_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# Client side
+
+
+def set_model_server_enabled(enabled):
+    """Turns use of a running model server on or off for this process (e.g. --no-model-server)."""
+    global _client_enabled, _client
+    with _client_lock:
+        _client_enabled = bool(enabled)
+        _client = None
+
+
+class ModelServerClient:
+    """
+    Connection details of a running model server. Every call opens its own
+    connection, so one client can be used from several threads and from
+    forked worker processes.
+    """
+
+    def __init__(self, address, authkey, info):
+        self.address = address
+        self.authkey = authkey
+        self.info = info        # reply to "ping": pid, loaded models, protocol
+
+    def call(self, method, *args, **kwargs):
+        with Client(self.address, family="AF_UNIX", authkey=self.authkey) as conn:
+            conn.send((method, args, kwargs))
+            status, result = conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Model server {method} failed: {result}")
+        return result
+
+    def serves(self, model):
+        return bool(self.info.get("models", {}).get(model))
+
+
+def _read_authkey(path=MODEL_SERVER_KEY_PATH):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def get_model_server():
+    """
+    ModelServerClient for the model server listening on MODEL_SERVER_SOCKET,
+    or None if none is running (or use is disabled). Checked once per
+    process.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if not _client_enabled:
+            return None
+        if _client_pid == os.getpid():
+            return _client
+        _client, _client_pid = None, os.getpid()
+        if not os.path.exists(MODEL_SERVER_SOCKET):
+            return None
+        try:
+            client = ModelServerClient(MODEL_SERVER_SOCKET, _read_authkey(), {})
+            client.info = client.call("ping")
+        except Exception as e:
+            logger.info(f"Model server at {MODEL_SERVER_SOCKET} not usable ({e}); loading models in-process")
+            return None
+        if client.info.get("protocol") != MODEL_SERVER_PROTOCOL:
+            logger.warning(f"Model server speaks protocol {client.info.get('protocol')}, expected {MODEL_SERVER_PROTOCOL}; not using it")
+            return None
+        logger.info(f"Using model server at {MODEL_SERVER_SOCKET} (pid {client.info['pid']})")
+        _client = client
+        return _client
+
+
+# ---------------------------------------------------------------------------
+# Page images in shared memory
+#
+# A 300 dpi page is about 25 MB. Pickled over the socket it would be
+# serialized, pushed through the kernel and unpickled for every call, so
+# images are instead copied once into a shared memory block by the client,
+# and once out of it by the server; only the block name and array layout
+# travel over the socket.
+
+
+@contextmanager
+def shared_images(images):
+    """
+    Copies `images` (ndarrays) into one shared memory block for the duration
+    of the `with`; yields the descriptor the server passes to `read_shared_images`.
+    """
+    arrays = [np.ascontiguousarray(img) for img in images]
+    block = SharedMemory(create=True, size=max(1, sum(a.nbytes for a in arrays)))
+    try:
+        layout, offset = [], 0
+        for a in arrays:
+            np.ndarray(a.shape, a.dtype, buffer=block.buf, offset=offset)[...] = a
+            layout.append((a.shape, a.dtype.str, offset))
+            offset += a.nbytes
+        yield {"name": block.name, "pid": os.getpid(), "arrays": layout}
+    finally:
+        block.close()
+        block.unlink()
+
+
+def read_shared_images(descriptor):
+    """Copies of the images a client put in shared memory (see `shared_images`)."""
+    try:
+        block = SharedMemory(name=descriptor["name"], track=False)     # Python 3.13+
+    except TypeError:
+        block = SharedMemory(name=descriptor["name"])
+        if descriptor["pid"] != os.getpid():
+            # The client owns (and unlinks) the block; the server's resource
+            # tracker must not unlink it again or warn about it at exit
+            resource_tracker.unregister(block._name, "shared_memory")
+    try:
+        return [
+            np.ndarray(shape, np.dtype(dtype), buffer=block.buf, offset=offset).copy()
+            for shape, dtype, offset in descriptor["arrays"]
+        ]
+    finally:
+        block.close()
+
+
+def _as_bgr(image):
+    """ndarrays pass through (BGR, as YOLO assumes); PIL images are converted from RGB."""
+    if isinstance(image, np.ndarray):
+        return image
+    return np.asarray(image.convert("RGB"))[:, :, ::-1]
+
+
+def _layout_settings(imgsz=None, conf=None, device=None):
+    """predict() arguments for the layout model, LAYOUT_SETTINGS where not given."""
+    from model_loader import LAYOUT_SETTINGS
+    return {
+        "imgsz": LAYOUT_SETTINGS["imgsz"] if imgsz is None else imgsz,
+        "conf": LAYOUT_SETTINGS["conf"] if conf is None else conf,
+        "device": LAYOUT_SETTINGS["device"] if device is None else device,
+    }
+
+
+class _RemoteModel:
+    """
+    Proxy for one model held by the model server. If the server goes away,
+    the model is loaded in-process with `fallback()` and used from then on.
+    """
+
+    def __init__(self, client, fallback):
+        self._client = client
+        self._fallback = fallback
+        self._local = None
+        self._lock = threading.Lock()
+
+    def _call(self, remote, local):
+        """remote() against the server; local(model) on the in-process fallback."""
+        if self._local is None:
+            try:
+                return remote()
+            except (OSError, EOFError) as e:
+                logger.warning(f"Model server unreachable ({e}); loading the model in-process")
+                with self._lock:
+                    if self._local is None:
+                        self._local = self._fallback()
+        return local(self._local)
+
+
+class RemoteOcr(_RemoteModel):
+    """PaddleOCR stand-in: predict() returns one OcrPage per image."""
+
+    def predict(self, images):
+        if not isinstance(images, list):
+            images = [images]
+        return self._call(
+            lambda: [OcrPage.from_bytes(payload) for payload in self._remote_predict(images)],
+            lambda model: model.predict(images),
+        )
+
+    def _remote_predict(self, images):
+        with shared_images(images) as descriptor:
+            return self._client.call("ocr_predict", descriptor)
+
+
+class LayoutSummary:
+    """Layout result of one page as sent by the server; summary() as on a doclayout_yolo result."""
+
+    def __init__(self, detections):
+        self.detections = detections
+
+    def summary(self):
+        return self.detections
+
+
+class RemoteLayoutModel(_RemoteModel):
+    """doclayout_yolo stand-in: predict() returns one LayoutSummary per image."""
+
+    def predict(self, images, imgsz=None, conf=None, device=None, verbose=False):
+        if not isinstance(images, list):
+            images = [images]
+        return self._call(
+            lambda: [LayoutSummary(s) for s in self._remote_predict(images, imgsz, conf)],
+            lambda model: model.predict(images, verbose=verbose, **_layout_settings(imgsz, conf, device)),
+        )
+
+    def _remote_predict(self, images, imgsz, conf):
+        with shared_images([_as_bgr(img) for img in images]) as descriptor:
+            return self._client.call("layout_predict", descriptor, imgsz=imgsz, conf=conf)
+
+
+class RemoteLlama(_RemoteModel):
+    """llama_cpp.Llama stand-in for create_chat_completion."""
+
+    def create_chat_completion(self, **kwargs):
+        return self._call(
+            lambda: self._client.call("llm_chat", **kwargs),
+            lambda model: _local_chat_completion(model, **kwargs),
+        )
+
+
+def _local_chat_completion(model, **kwargs):
+    from model_loader import chat_completion
+    return chat_completion(model, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# Server side
+
+
+class ModelServer:
+    """
+    Holds PaddleOCR, the layout model and a pool of llama contexts, and
+    answers (method, args, kwargs) requests from clients over a Unix domain
+    socket, one thread per connection. OCR and layout calls are serialized
+    per model; LLM calls run on up to `llm_contexts` contexts at once.
+    """
+
+    def __init__(self, use_gpu=False, load_llm=True, llm_contexts=LLM_PARALLEL_CONTEXTS):
+        import model_loader
+        self.model_loader = model_loader
+        self.use_gpu = use_gpu
+        self.ocr = model_loader.get_ocr_instance()
+        self.layout = model_loader.get_layout_model()
+        self.llm_pool = model_loader.LlamaPool(1 if use_gpu else llm_contexts, use_gpu) if load_llm else None
+        if self.llm_pool is not None:
+            with self.llm_pool.acquire():    # load the first context now
+                pass
+        self._ocr_lock = threading.Lock()
+        self._layout_lock = threading.Lock()
+        self.requests = {}
+        self._requests_lock = threading.Lock()
+        self.started = time.time()
+
+    def ping(self):
+        return {
+            "protocol": MODEL_SERVER_PROTOCOL,
+            "pid": os.getpid(),
+            "uptime": time.time() - self.started,
+            "models": {"ocr": True, "layout": True, "llm": self.llm_pool is not None},
+            "use_gpu": self.use_gpu,
+            "requests": self.request_counts(),
+        }
+
+    def request_counts(self):
+        with self._requests_lock:
+            return dict(self.requests)
+
+    def ocr_predict(self, images):
+        """OcrPage bytes per image; `images` is a `shared_images` descriptor."""
+        from ocr import compact_ocr_page
+        images = read_shared_images(images)
+        with self._ocr_lock:
+            results = self.ocr.predict(images)
+        return [compact_ocr_page(res).to_bytes() for res in results]
+
+    def layout_predict(self, images, imgsz=None, conf=None):
+        """summary() per image; `images` is a `shared_images` descriptor."""
+        images = read_shared_images(images)
+        with self._layout_lock:
+            results = self.layout.predict(images, verbose=False, **_layout_settings(imgsz, conf))
+        return [res.summary() for res in results]
+
+    def llm_chat(self, **kwargs):
+        if self.llm_pool is None:
+            raise RuntimeError("this server was started without the LLM")
+        with self.llm_pool.acquire() as llm:
+            return self.model_loader.chat_completion(llm, **kwargs)
+
+    METHODS = ("ping", "ocr_predict", "layout_predict", "llm_chat")
+
+    def handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except EOFError:
+                    return
+                with self._requests_lock:
+                    self.requests[method] = self.requests.get(method, 0) + 1
+                try:
+                    if method not in self.METHODS:
+                        raise ValueError(f"unknown method {method!r}")
+                    reply = ("ok", getattr(self, method)(*args, **kwargs))
+                except Exception as e:
+                    logger.error(f"{method} failed: {e}", exc_info=True)
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                conn.send(reply)
+
+    def serve(self, address=MODEL_SERVER_SOCKET, key_path=MODEL_SERVER_KEY_PATH):
+        os.makedirs(os.path.dirname(address) or ".", exist_ok=True)
+        authkey = os.urandom(32)
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(authkey)
+
+        old_umask = os.umask(0o177)     # socket file readable/writable by the owner only
+        try:
+            listener = Listener(address, family="AF_UNIX", authkey=authkey)
+        finally:
+            os.umask(old_umask)
+
+        logger.info(f"Model server listening on {address} (pid {os.getpid()})")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:     # failed handshake, e.g. wrong key
+                    logger.warning(f"Rejected connection: {e}")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            for path in (address, key_path):
+                if os.path.exists(path):
+                    os.unlink(path)
+
+
+def _server_running(address):
+    try:
+        ModelServerClient(address, _read_authkey(), {}).call("ping")
+        return True
+    except Exception:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep OCR, layout and LLM models loaded and serve them over a Unix socket.")
+    parser.add_argument("--gpu", action="store_true", help="Load the GPU LLM (clients must also run with --gpu to use it)")
+    parser.add_argument("--no-llm", action="store_true", help="Serve OCR and layout only")
+    parser.add_argument("--llm-contexts", type=int, default=LLM_PARALLEL_CONTEXTS, help="Concurrent llama contexts (CPU)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if os.path.exists(MODEL_SERVER_SOCKET):
+        if _server_running(MODEL_SERVER_SOCKET):
+            sys.exit(f"A model server is already running on {MODEL_SERVER_SOCKET}")
+        os.unlink(MODEL_SERVER_SOCKET)   # left over from a server that did not shut down cleanly
+
+    # The server loads real models; it must never try to connect to itself
+    set_model_server_enabled(False)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    server = ModelServer(use_gpu=args.gpu, load_llm=not args.no_llm, llm_contexts=args.llm_contexts)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,355 @@
 from paddleocr import PaddleOCR
 
+import json
+import hashlib
+import logging
+import fitz
 import numpy as np
+from config import (
+    RENDER_DPI, TEXT_LAYER_MIN_CHARS, TEXT_LAYER_MAX_GARBAGE_RATIO,
+    OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES, LAYOUT_PAGE_CHUNK,
+    OCR_BATCH_SIZE, OCR_BATCH_MAX_WAIT,
+    MULTIRES_LAYOUT_DPI, MULTIRES_REGION_PAD_PT, MULTIRES_SKIP_CLASSES,
+)
+from cache_store import LRUCacheStore
+from batcher import InferenceBatcher
+from model_loader import OCR_SETTINGS
+from table_handler import detect_layout_pages
+from spatial_index import poly_to_bbox, first_intersecting
+from ocr_page import OcrPage
+from input_handler import MUPDF_LOCK
+from full_text import FullText
+
+# Bump when the serialized page layout or the page pixels OCR sees change
+OCR_CACHE_VERSION = 3
+
+_ocr_cache = None
+
+def get_ocr_cache():
+    """
+    Returns the global on-disk OCR result cache, creating it if necessary.
+    """
+    global _ocr_cache
+    if _ocr_cache is None:
+        _ocr_cache = LRUCacheStore(OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES, name="ocr_cache")
+    return _ocr_cache
+
+def ocr_cache_key(pdf_hash, page_idx, dpi=RENDER_DPI, mode="full"):
+    """
+    Cache key for one rendered page: PDF content, page, DPI, OCR mode
+    ("full" page or the multi-resolution settings) and the PaddleOCR settings.
+    """
+    key_data = {
+        "version": OCR_CACHE_VERSION,
+        "pdf": pdf_hash,
+        "page": page_idx,
+        "dpi": dpi,
+        "mode": mode,
+        "ocr": OCR_SETTINGS,
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+def empty_ocr_page():
+    return OcrPage.empty()
+
+def compact_ocr_page(res):
+    """
+    Keep only the fields downstream code uses from a PaddleOCR page result,
+    as an OcrPage, dropping the input image and intermediate maps it
+    carries around.
+    """
+    if isinstance(res, OcrPage):    # already compact, e.g. from the model server
+        return res
+    return OcrPage.from_lists(
+        res.get("rec_texts", []),
+        res.get("rec_polys", []),
+        [float(s) for s in res.get("rec_scores", [])],
+    )
+
+def serialize_ocr_page(page):
+    return page.to_bytes()
+
+def deserialize_ocr_page(payload):
+    return OcrPage.from_bytes(payload)
+
+def make_ocr_batcher(ocr, batch_size=OCR_BATCH_SIZE, max_wait=OCR_BATCH_MAX_WAIT):
+    """
+    InferenceBatcher that sends page images to `ocr.predict` in batches and
+    returns one compact page result per image.
+    """
+    def predict_batch(images):
+        return [compact_ocr_page(res) for res in ocr.predict([np.asarray(img) for img in images])]
 
-def get_ocr_object_per_page(images,ocr):
-  ocr_results =[]
-  for image in images:
-    np_img = np.asarray(image)
-    res = ocr.predict(np_img)
-    if res:
-      ocr_results.append(res)
-  return ocr_results
+    return InferenceBatcher(predict_batch, batch_size=batch_size, max_wait=max_wait, name="ocr_batcher")
+
+def get_ocr_object_per_page(images, ocr, cache=None, cache_keys=None, batcher=None):
+    """
+    OCR each image, one `[page_result]` per image.
+
+    When `cache` and `cache_keys` (one key per image) are given, cached pages
+    are returned without running OCR and new results are stored. When a
+    `batcher` (see make_ocr_batcher) is given, the remaining images go
+    through it instead of one `ocr.predict` call each.
+    """
+    pages = [None] * len(images)
+    keys = [None] * len(images)
+    pending = []
+    # Images are only indexed when they need OCR, so lazy page sequences
+    # (PdfPageSource.select) are not rendered for cache hits.
+    for idx in range(len(images)):
+        if cache is not None and cache_keys is not None:
+            keys[idx] = cache_keys[idx]
+            payload = cache.get(keys[idx])
+            if payload is not None:
+                pages[idx] = deserialize_ocr_page(payload)
+                continue
+        pending.append(idx)
+
+    if batcher is not None:
+        futures = [(idx, batcher.submit(images[idx])) for idx in pending]
+        for idx, future in futures:
+            pages[idx] = future.result()
+    else:
+        for idx in pending:
+            np_img = np.asarray(images[idx])
+            res = ocr.predict(np_img)
+            pages[idx] = compact_ocr_page(res[0]) if res else empty_ocr_page()
+
+    for idx in pending:
+        if keys[idx] is not None:
+            cache.put(keys[idx], serialize_ocr_page(pages[idx]))
+    return [[page] for page in pages]
+
+def extract_text_layer_page(page, dpi=RENDER_DPI, gap_factor=1.0):
+    """
+    Build an OCR-shaped result for one page from the PDF's native text layer.
+
+    Words are grouped by their PyMuPDF (block, line) and a line is split again
+    wherever the horizontal gap between two words exceeds `gap_factor` times the
+    line height, so table cells come out as separate boxes like PaddleOCR does.
+
+    Args:
+        page: fitz.Page (fitz calls on it are made under MUPDF_LOCK)
+        dpi: resolution the page images are rendered at; polygons are returned
+             in pixel coordinates of that rendering (rotation included)
+        gap_factor: word gap (in line heights) that starts a new text box
+
+    Returns:
+        OcrPage (scores are 1.0)
+    """
+    scale = dpi / 72
+    with MUPDF_LOCK:
+        matrix = page.rotation_matrix * fitz.Matrix(scale, scale)
+        words = page.get_text("words", sort=True)
+
+    segments = []
+    current = None
+    for x0, y0, x1, y1, word, block_no, line_no, _ in words:
+        line_id = (block_no, line_no)
+        if current is not None and current["line"] == line_id:
+            line_height = max(current["y1"] - current["y0"], y1 - y0, 1)
+            if x0 - current["x1"] <= gap_factor * line_height:
+                current["words"].append(word)
+                current["x0"] = min(current["x0"], x0)
+                current["y0"] = min(current["y0"], y0)
+                current["x1"] = max(current["x1"], x1)
+                current["y1"] = max(current["y1"], y1)
+                continue
+        current = {"line": line_id, "words": [word], "x0": x0, "y0": y0, "x1": x1, "y1": y1}
+        segments.append(current)
+
+    texts, polys = [], []
+    for seg in segments:
+        rect = fitz.Rect(seg["x0"], seg["y0"], seg["x1"], seg["y1"]) * matrix
+        poly = np.array(
+            [[rect.x0, rect.y0], [rect.x1, rect.y0], [rect.x1, rect.y1], [rect.x0, rect.y1]]
+        ).round().astype(np.int32)
+        texts.append(" ".join(seg["words"]))
+        polys.append(poly)
+    return OcrPage.from_lists(texts, polys)
+
+def is_usable_text_layer(page_result, min_chars=TEXT_LAYER_MIN_CHARS, max_garbage_ratio=TEXT_LAYER_MAX_GARBAGE_RATIO):
+    """
+    A text layer is usable when it has enough characters and is not mostly
+    glyphs PyMuPDF could not map to unicode (broken fonts, vectorized text).
+    """
+    text = page_result.text
+    n_chars = len("".join(text.split()))
+    if n_chars < min_chars:
+        return False
+    return text.count("\ufffd") / n_chars <= max_garbage_ratio
+
+def merge_rects(rects, pad=0):
+    """
+    Pad rectangles and union any that overlap, until none do.
+    """
+    rects = [fitz.Rect(r) + (-pad, -pad, pad, pad) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        for rect in rects:
+            for i, other in enumerate(out):
+                if other.intersects(rect):
+                    out[i] = other | rect
+                    merged = True
+                    break
+            else:
+                out.append(rect)
+        rects = out
+    return rects
+
+def multires_mode_key(layout_dpi=MULTIRES_LAYOUT_DPI):
+    return f"multires:{layout_dpi}:{MULTIRES_REGION_PAD_PT}:{sorted(MULTIRES_SKIP_CLASSES)}"
+
+def get_ocr_object_multires(pages, page_indices, ocr, layout_dpi=MULTIRES_LAYOUT_DPI, ocr_cache=None, pdf_hash=None, batcher=None):
+    """
+    OCR pages by region instead of as a whole.
+
+    Each page is rendered once at `layout_dpi` for layout detection. Every
+    detected region except the classes in MULTIRES_SKIP_CLASSES (figures) is
+    padded, overlapping regions are merged, and each merged region is
+    re-rendered at `pages.dpi` through a clip rectangle and OCR'd. Polygons
+    are shifted by the clip origin, so results are in the same full-page
+    pixel space as `get_ocr_object_per_page` on `pages[page_idx]`. Pages
+    with no text regions get an empty result without running OCR.
+
+    Returns:
+        list of OcrPage results, aligned with `page_indices`
+    """
+    mode = multires_mode_key(layout_dpi)
+    results = {}
+    todo = []
+    for page_idx in page_indices:
+        payload = ocr_cache.get(ocr_cache_key(pdf_hash, page_idx, pages.dpi, mode)) if ocr_cache is not None and pdf_hash else None
+        if payload is not None:
+            results[page_idx] = deserialize_ocr_page(payload)
+        else:
+            todo.append(page_idx)
+
+    to_points = 72 / layout_dpi
+    for chunk_start in range(0, len(todo), LAYOUT_PAGE_CHUNK):
+        chunk = todo[chunk_start:chunk_start + LAYOUT_PAGE_CHUNK]
+        layout_results = detect_layout_pages([pages.render(page_idx, dpi=layout_dpi)[0] for page_idx in chunk])
+
+        for page_idx, res in zip(chunk, layout_results):
+            with MUPDF_LOCK:
+                page_rect = pages.page(page_idx).rect
+            rects = [
+                fitz.Rect(det["box"]["x1"], det["box"]["y1"], det["box"]["x2"], det["box"]["y2"]) * to_points
+                for det in res.summary()
+                if det["class"] not in MULTIRES_SKIP_CLASSES
+            ]
+            rects = [r & page_rect for r in merge_rects(rects, MULTIRES_REGION_PAD_PT)]
+            rects = [r for r in rects if not r.is_empty]
+
+            crops = [pages.render(page_idx, clip=r) for r in rects]
+            region_results = get_ocr_object_per_page([img for img, _ in crops], ocr, batcher=batcher)
+
+            # Shift region boxes into full-page pixels and order them top to bottom
+            texts, polys, scores = [], [], []
+            for (_, (x0, y0)), region in zip(crops, region_results):
+                region = region[0]
+                texts.extend(region.texts)
+                polys.append(region.polys + np.array([x0, y0], dtype=np.int32))
+                scores.append(region.scores)
+            polys = np.concatenate(polys) if polys else np.zeros((0, 4, 2), dtype=np.int32)
+            order = np.lexsort((polys[:, :, 0].min(axis=1), polys[:, :, 1].min(axis=1)))
+            page_result = OcrPage.from_lists(
+                [texts[i] for i in order],
+                polys[order],
+                np.concatenate(scores)[order] if scores else [],
+            )
+
+            logging.debug(f"    page {page_idx + 1}: OCR'd {len(rects)} region(s) at {pages.dpi} dpi")
+            if ocr_cache is not None and pdf_hash:
+                ocr_cache.put(ocr_cache_key(pdf_hash, page_idx, pages.dpi, mode), serialize_ocr_page(page_result))
+            results[page_idx] = page_result
+
+    return [results[page_idx] for page_idx in page_indices]
+
+def get_ocr_results_with_text_layer(pages, ocr, use_text_layer=True, ocr_cache=None, pdf_hash=None, multires=False, batcher=None):
+    """
+    Per-page OCR results, taken from the PDF text layer where it is usable and
+    from PaddleOCR otherwise. Results keep the `ocr_results[i][0]` shape of
+    `get_ocr_object_per_page` and stay aligned with the pages of `pages`.
+
+    Args:
+        pages: PdfPageSource; only pages that need OCR are rasterized
+        ocr: PaddleOCR instance
+        use_text_layer: False to OCR every page
+        ocr_cache / pdf_hash: look OCR'd pages up in the on-disk cache
+        multires: OCR only the text regions found by a low-DPI layout pass
+                  (see get_ocr_object_multires) instead of full pages
+        batcher: optional OCR InferenceBatcher; pages are then submitted
+                 `batcher.batch_size` at a time
+
+    Returns:
+        tuple: (ocr_results, page_report) where page_report holds one
+               {'page', 'source', 'lines'} dict per page; 'source' is
+               'text_layer', 'ocr' or 'ocr_multires'.
+    """
+    page_results = {}
+    sources = {}
+    ocr_pages = []
+
+    for page_idx in range(len(pages)):
+        page_result = None
+        if use_text_layer:
+            with MUPDF_LOCK:
+                page_result = extract_text_layer_page(pages.page(page_idx), pages.dpi)
+        if page_result is not None and is_usable_text_layer(page_result):
+            page_results[page_idx] = page_result
+            sources[page_idx] = "text_layer"
+        else:
+            ocr_pages.append(page_idx)
+
+    if multires:
+        multires_results = get_ocr_object_multires(
+            pages, ocr_pages, ocr, ocr_cache=ocr_cache, pdf_hash=pdf_hash, batcher=batcher
+        )
+        for page_idx, page_result in zip(ocr_pages, multires_results):
+            page_results[page_idx] = page_result
+            sources[page_idx] = "ocr_multires"
+    else:
+        # Only a batch worth of rendered pages is alive at a time
+        chunk_size = batcher.batch_size if batcher is not None else 1
+        for chunk_start in range(0, len(ocr_pages), chunk_size):
+            chunk = ocr_pages[chunk_start:chunk_start + chunk_size]
+            cache_keys = [ocr_cache_key(pdf_hash, page_idx, pages.dpi) for page_idx in chunk] if pdf_hash else None
+            res = get_ocr_object_per_page(
+                pages.select(chunk), ocr,
+                cache=ocr_cache, cache_keys=cache_keys, batcher=batcher
+            )
+            for page_idx, page_res in zip(chunk, res):
+                page_results[page_idx] = page_res[0]
+                sources[page_idx] = "ocr"
+
+    ocr_results = []
+    page_report = []
+    for page_idx in range(len(pages)):
+        page_result = page_results[page_idx]
+        ocr_results.append([page_result])
+        page_report.append({
+            "page": page_idx,
+            "source": sources[page_idx],
+            "lines": len(page_result),
+        })
+        logging.info(f"    page {page_idx + 1}: {sources[page_idx]} ({len(page_result)} text boxes)")
+
+    return ocr_results, page_report
 
 import logging
 import json
 import re
 
 def build_full_ocr_text(ocr_results):
-    big_text = ''
-    for i in range(len(ocr_results)):
-        rec_texts = ocr_results[i][0]['rec_texts']
-        big_text += " ".join(rec_texts).lower()
-    logging.debug(f"Built full OCR text (length: {len(big_text)} characters)")
+    """
+    Lowercased text of all pages as a FullText: boxes joined by spaces, pages
+    by PAGE_SEPARATOR, with an offset -> (page, line) map back to the boxes.
+    """
+    big_text = FullText.from_ocr_results(ocr_results)
+    logging.debug(f"Built full OCR text (length: {len(big_text)} characters, {len(big_text.line_starts)} boxes)")
     return big_text
 
 def filter_ocr_key_hit_by_value_matched(ocr_key_hit, value_matched):
@@ -55,38 +384,32 @@ def filter_ocr_keys_by_regions(ocr_key_hits, regions_by_page):
         with an extra field 'stop_y' = region['y2']
     """
 
-    def poly_to_bbox(poly):
-        xs = [p[0] for p in poly]
-        ys = [p[1] for p in poly]
-        return min(xs), min(ys), max(xs), max(ys)
-
-    def boxes_intersect(a, b):
-        return not (
-            a[2] < b[0] or
-            a[0] > b[2] or
-            a[3] < b[1] or
-            a[1] > b[3]
-        )
-
     filtered = []
 
+    hits_by_page = {}
     for hit in ocr_key_hits:
         page_idx = hit.get("ocr_result_index")
-        poly = hit.get("bbox")
-        if poly is None or page_idx not in regions_by_page:
+        if hit.get("bbox") is None or page_idx not in regions_by_page:
             continue
+        hits_by_page.setdefault(page_idx, []).append(hit)
 
-        key_box = poly_to_bbox(poly)
-
-        # check if overlaps any region on this page
-        for region in regions_by_page[page_idx]:
-            region_box = (region['x1'], region['y1'], region['x2'], region['y2'])
-            if boxes_intersect(key_box, region_box):
-                # add stop_y to the hit
-                hit_copy = hit.copy()
-                hit_copy['stop_y'] = region['y2']
-                filtered.append(hit_copy)
-                break  # one match is enough
+    # First region on the page (in list order) each key overlaps, as one mask per page
+    first_region = {}
+    for page_idx, hits in hits_by_page.items():
+        regions = regions_by_page[page_idx]
+        region_boxes = [(r['x1'], r['y1'], r['x2'], r['y2']) for r in regions]
+        key_boxes = [poly_to_bbox(hit["bbox"]) for hit in hits]
+        for hit, region_idx in zip(hits, first_intersecting(key_boxes, region_boxes).tolist()):
+            if region_idx >= 0:
+                first_region[id(hit)] = regions[region_idx]
+
+    for hit in ocr_key_hits:
+        region = first_region.get(id(hit))
+        if region is not None:
+            # add stop_y to the hit
+            hit_copy = hit.copy()
+            hit_copy['stop_y'] = region['y2']
+            filtered.append(hit_copy)
 
     return filtered
   
@@ -0,0 +1,109 @@
+import io
+import numpy as np
+from spatial_index import GridIndex, polys_to_bboxes
+
+
+def _as_quad(poly):
+    """(4, 2) int32 polygon; other point counts become their bounding rectangle."""
+    poly = np.asarray(poly, dtype=np.int32).reshape(-1, 2)
+    if len(poly) == 4:
+        return poly
+    (x1, y1), (x2, y2) = poly.min(axis=0), poly.max(axis=0)
+    return np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.int32)
+
+
+class OcrPage:
+    """
+    Columnar OCR result for one page.
+
+    Texts live in one joined string with (N + 1) character offsets, next to
+    (N, 4, 2) int32 polygons, (N, 4) float32 bounding boxes and (N,) float32
+    scores, instead of N small Python objects per field. Reading
+    page["rec_texts"] / ["rec_polys"] / ["rec_scores"] (or .get) still works
+    like the PaddleOCR dict; len(page) is the number of text boxes.
+    """
+
+    __slots__ = ("text", "offsets", "polys", "bboxes", "scores", "_grid")
+
+    FIELDS = ("rec_texts", "rec_polys", "rec_scores")
+
+    def __init__(self, text, offsets, polys, scores):
+        self.text = text
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.polys = np.asarray(polys, dtype=np.int32).reshape(-1, 4, 2)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.bboxes = polys_to_bboxes(self.polys)
+        self._grid = None
+
+    @classmethod
+    def from_lists(cls, texts, polys, scores=None):
+        texts = [str(t) for t in texts]
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(t) for t in texts], dtype=np.int64)
+        polys = [_as_quad(p) for p in polys]
+        polys = np.stack(polys) if polys else np.zeros((0, 4, 2), dtype=np.int32)
+        if scores is None:
+            scores = np.ones(len(texts), dtype=np.float32)
+        return cls("".join(texts), offsets, polys, scores)
+
+    @classmethod
+    def empty(cls):
+        return cls.from_lists([], [], [])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def text_at(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def texts(self):
+        offsets = self.offsets.tolist()
+        return [self.text[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    # dict-style access, as on a PaddleOCR page result
+    def __getitem__(self, key):
+        if key == "rec_texts":
+            return self.texts
+        if key == "rec_polys":
+            return self.polys
+        if key == "rec_scores":
+            return self.scores
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self.FIELDS else default
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def keys(self):
+        return self.FIELDS
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the page (text counted at 1 byte/char)."""
+        return len(self.text) + self.offsets.nbytes + self.polys.nbytes + self.bboxes.nbytes + self.scores.nbytes
+
+    def grid_index(self):
+        """GridIndex over the page's boxes, built on first use."""
+        if self._grid is None:
+            self._grid = GridIndex(self.bboxes)
+        return self._grid
+
+    def to_bytes(self):
+        """npz bytes: utf-8 text, character offsets, polygons and scores (no pickled objects)."""
+        buf = io.BytesIO()
+        np.savez_compressed(
+            buf,
+            text=np.frombuffer(self.text.encode("utf-8"), dtype=np.uint8),
+            offsets=self.offsets,
+            polys=self.polys,
+            scores=self.scores,
+        )
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload):
+        with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+            return cls(data["text"].tobytes().decode("utf-8"), data["offsets"], data["polys"], data["scores"])
@@ -0,0 +1,432 @@
+import re
+import time
+import logging
+import threading
+from functools import lru_cache
+import regex
+from config import PAIR_REGEX_MAX_LENGTH, PAIR_REGEX_PROBE_CHARS, PAIR_REGEX_TIME_BUDGET, PAIR_REGEX_WALL_FACTOR
+from full_text import lowered
+
+try:    # Python 3.11+
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+logger = logging.getLogger(__name__)
+
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+_POSSESSIVE_REPEAT = getattr(sre_constants, "POSSESSIVE_REPEAT", None)
+_ATOMIC_GROUP = getattr(sre_constants, "ATOMIC_GROUP", None)
+
+
+def _children(op, av):
+    """Sub-patterns nested directly under one parsed regex item."""
+    if op in _REPEATS or op == _POSSESSIVE_REPEAT:
+        return [av[2]]
+    if op == sre_constants.SUBPATTERN:
+        return [av[3]]
+    if op == sre_constants.BRANCH:
+        return av[1]
+    if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return [av[1]]
+    if op == _ATOMIC_GROUP:
+        return [av]
+    if op == sre_constants.GROUPREF_EXISTS:
+        return [sub for sub in av[1:] if sub is not None]
+    return []
+
+
+def _is_unbounded_repeat(op, av):
+    return op in _REPEATS and av[1] == sre_constants.MAXREPEAT
+
+
+def _contains_unbounded_repeat(sub):
+    return any(
+        _is_unbounded_repeat(op, av) or any(_contains_unbounded_repeat(child) for child in _children(op, av))
+        for op, av in sub
+    )
+
+
+# First characters are worked out over Latin-1, which covers the spec sheet keys and units
+_CHARS = frozenset(range(256))
+
+
+def _category_chars(category):
+    name = str(category)
+    if "DIGIT" in name:
+        chars = {c for c in _CHARS if chr(c).isdigit()}
+    elif "SPACE" in name:
+        chars = {c for c in _CHARS if chr(c).isspace()}
+    elif "WORD" in name:
+        chars = {c for c in _CHARS if chr(c).isalnum() or c == ord("_")}
+    elif "LINEBREAK" in name:
+        chars = {ord("\n")}
+    else:
+        return set(_CHARS)
+    return set(_CHARS - chars) if "NOT_" in name else chars
+
+
+def _set_chars(items):
+    """Characters matched by a parsed character class ("[...]")."""
+    chars, negate = set(), False
+    for op, av in items:
+        if op == sre_constants.NEGATE:
+            negate = True
+        elif op == sre_constants.LITERAL:
+            chars.add(av)
+        elif op == sre_constants.RANGE:
+            chars.update(range(av[0], min(av[1], 255) + 1))
+        elif op == sre_constants.CATEGORY:
+            chars |= _category_chars(av)
+        else:
+            return set(_CHARS)
+    return set(_CHARS - chars) if negate else chars
+
+
+def _first_chars(sub):
+    """
+    (characters a parsed (sub)pattern can start with, whether it can match
+    the empty string), case-insensitively. Errs on the side of more
+    characters and nullable.
+    """
+    first = set()
+    for op, av in sub:
+        if op == sre_constants.LITERAL:
+            chars, nullable = {av}, False
+        elif op == sre_constants.NOT_LITERAL:
+            chars, nullable = set(_CHARS - {av}), False
+        elif op == sre_constants.ANY:
+            chars, nullable = set(_CHARS), False
+        elif op == sre_constants.IN:
+            chars, nullable = _set_chars(av), False
+        elif op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            chars, nullable = set(), True
+        elif op == sre_constants.SUBPATTERN:
+            chars, nullable = _first_chars(av[3])
+        elif op == _ATOMIC_GROUP:
+            chars, nullable = _first_chars(av)
+        elif op in _REPEATS or op == _POSSESSIVE_REPEAT:
+            chars, nullable = _first_chars(av[2])
+            nullable = nullable or av[0] == 0
+        elif op == sre_constants.BRANCH:
+            chars, nullable = set(), False
+            for alternative in av[1]:
+                alt_chars, alt_nullable = _first_chars(alternative)
+                chars |= alt_chars
+                nullable = nullable or alt_nullable
+        else:
+            chars, nullable = set(_CHARS), True
+        first |= chars
+        if not nullable:
+            break
+    else:
+        nullable = True
+    for c in list(first):
+        first.update(ord(x) for x in (chr(c).lower(), chr(c).upper()) if len(x) == 1 and ord(x) < 256)
+    return first, nullable
+
+
+def _is_ambiguous_branch(op, av):
+    """
+    An alternation where more than one alternative can match at the same
+    position: two alternatives share a first character, or one can match
+    the empty string ("(a|aa)" parses as "a(|a)").
+    """
+    if op != sre_constants.BRANCH:
+        return False
+    seen = set()
+    for alternative in av[1]:
+        chars, nullable = _first_chars(alternative)
+        if nullable or chars & seen:
+            return True
+        seen |= chars
+    return False
+
+
+def _contains_ambiguous_branch(sub):
+    return any(
+        _is_ambiguous_branch(op, av) or any(_contains_ambiguous_branch(child) for child in _children(op, av))
+        for op, av in sub
+    )
+
+
+def complexity_issue(parsed):
+    """
+    Reason why a parsed pattern may backtrack catastrophically, or None:
+    an unbounded repeat around another unbounded repeat (e.g. "(\\w+\\s*)+")
+    or around an ambiguous alternation (e.g. "(a|aa)*"), or a backreference.
+    """
+    for op, av in parsed:
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            return "backreference"
+        children = _children(op, av)
+        if _is_unbounded_repeat(op, av) and any(_contains_unbounded_repeat(child) for child in children):
+            return "nested unbounded repeat"
+        if _is_unbounded_repeat(op, av) and any(_contains_ambiguous_branch(child) for child in children):
+            return "ambiguous alternation under unbounded repeat"
+        for child in children:
+            issue = complexity_issue(child)
+            if issue:
+                return issue
+    return None
+
+
+def required_literal(parsed):
+    """
+    Literal the pattern must match at top level, lowercased, and whether the
+    pattern starts with it (after zero-width anchors such as "\\b"): the
+    leading literal run when there is one of two or more characters,
+    otherwise the longest literal run. ("", False) if there is none, or if
+    it is not ASCII (lowercasing could then change its length).
+    """
+    runs, current = [], []
+    for op, av in parsed:
+        if op == sre_constants.LITERAL:
+            current.append(chr(av))
+            continue
+        if current:
+            runs.append("".join(current))
+            current = []
+        if op != sre_constants.AT:
+            runs.append("")     # anything but an anchor ends the leading run
+    if current:
+        runs.append("".join(current))
+
+    items = list(parsed)
+    n_anchors = next((i for i, (op, _) in enumerate(items) if op != sre_constants.AT), len(items))
+    starts_with_literal = n_anchors < len(items) and items[n_anchors][0] == sre_constants.LITERAL
+    leading = runs[0] if starts_with_literal and runs else ""
+    if not "".join(runs).isascii():
+        return "", False
+    if len(leading) >= 2:
+        return leading.lower(), True
+    return max(runs, key=len, default="").lower(), False
+
+
+class PairRegex:
+    """
+    One validated, precompiled `pair_regex`, compiled case-insensitively
+    with the `regex` engine, whose matching can be stopped by a timeout
+    (the stdlib `re` runs a catastrophic pattern to the end).
+
+    `literal` is a literal the pattern requires (normally the attribute
+    key, see `required_literal`): when the lowercased text lacks it, the pattern cannot
+    match and is not run. When the pattern starts with it (`anchored`),
+    the pattern is only tried where the literal occurs instead of at every
+    offset, which gives the same matches as `findall`.
+    """
+
+    def __init__(self, source, compiled, literal="", anchored=False):
+        self.source = source
+        self.regex = compiled
+        self.literal = literal
+        self.anchored = anchored
+
+    def _result(self, match):
+        # Same shape as re.findall: whole match, the only group, or all groups
+        if self.regex.groups == 0:
+            return match.group(0)
+        if self.regex.groups == 1:
+            return match.group(1)
+        return match.groups()
+
+    def findall(self, text, text_lower=None, deadline=None):
+        """
+        `re.findall` of the pattern in `text`. `text_lower` is `text` from
+        `lower_preserving_length` (computed when missing).
+
+        Returns:
+            (matches, completed): completed is False when `deadline`
+            (a time.perf_counter() value) passed before the scan finished;
+            matches then holds what was found until then
+        """
+        if self.literal:
+            if text_lower is None:
+                text_lower = lowered(text)
+            pos = text_lower.find(self.literal)
+            if pos == -1:
+                return [], True
+
+        if not (self.literal and self.anchored):
+            try:
+                return self.regex.findall(text, timeout=_remaining(deadline)), True
+            except TimeoutError:
+                return [], False
+
+        matches = []
+        while pos != -1:
+            try:
+                match = self.regex.match(text, pos, timeout=_remaining(deadline))
+            except TimeoutError:
+                return matches, False
+            if match:
+                matches.append(self._result(match))
+                pos = match.end()
+            else:
+                pos += 1
+            if deadline is not None and time.perf_counter() > deadline:
+                return matches, False
+            pos = text_lower.find(self.literal, pos)
+        return matches, True
+
+    def bounded_findall(self, text, text_lower=None):
+        """
+        `findall` within the time budget for a text of this length (see
+        `pair_regex_budget`). The scan is cut off after
+        PAIR_REGEX_WALL_FACTOR budgets of wall-clock time; it only counts as
+        too slow when this thread also spent the whole budget in CPU time,
+        so a scan delayed by other threads holding the GIL is not.
+
+        Returns:
+            (matches, completed, too_slow)
+        """
+        budget = pair_regex_budget(len(text))
+        cpu_start = time.thread_time()
+        matches, completed = self.findall(text, text_lower, deadline=time.perf_counter() + budget * PAIR_REGEX_WALL_FACTOR)
+        too_slow = not completed and time.thread_time() - cpu_start >= budget
+        return matches, completed, too_slow
+
+
+def pair_regex_budget(n_chars):
+    """
+    CPU seconds a pattern may take on a text of `n_chars` characters:
+    PAIR_REGEX_TIME_BUDGET per PAIR_REGEX_PROBE_CHARS, and never less than
+    PAIR_REGEX_TIME_BUDGET.
+    """
+    return PAIR_REGEX_TIME_BUDGET * max(1.0, n_chars / PAIR_REGEX_PROBE_CHARS)
+
+
+def _remaining(deadline):
+    """Timeout for one `regex` call: seconds left until `deadline`, or None for no limit."""
+    if deadline is None:
+        return None
+    return max(deadline - time.perf_counter(), 0.0)
+
+
+def _probe_text(literal):
+    """Synthetic text with long runs of one character class, around `literal`."""
+    unit = f"{literal or 'key'} : 12.5 w 3000k aaaa-bbbb 1/2in "
+    runs = " ".join(ch * 200 for ch in "a1 :-.")
+    text = f"{unit * 4}{runs} {literal} {runs}"
+    return (text * (PAIR_REGEX_PROBE_CHARS // len(text) + 1))[:PAIR_REGEX_PROBE_CHARS]
+
+
+def compile_pair_regex(source):
+    """
+    Validates and compiles one LLM-generated pattern.
+
+    Args:
+        source (str): Regex source from the guidance cache
+
+    Returns:
+        PairRegex
+
+    Raises:
+        ValueError: with the reason when the pattern is invalid, too long,
+        structurally prone to catastrophic backtracking, or does not finish
+        a synthetic probe text within PAIR_REGEX_TIME_BUDGET
+    """
+    if not isinstance(source, str):
+        raise ValueError(f"pattern is a {type(source).__name__}, not a string")
+    if len(source) > PAIR_REGEX_MAX_LENGTH:
+        raise ValueError(f"pattern longer than {PAIR_REGEX_MAX_LENGTH} characters")
+    try:
+        parsed = sre_parse.parse(source, re.IGNORECASE)
+        compiled = regex.compile(source, regex.IGNORECASE)
+    except (re.error, regex.error) as e:
+        raise ValueError(f"invalid regex: {e}") from None
+
+    issue = complexity_issue(parsed)
+    if issue:
+        raise ValueError(issue)
+
+    literal, anchored = required_literal(parsed)
+    pair_regex = PairRegex(source, compiled, literal, anchored)
+
+    # The timeout stops the probe itself, so a pattern the structural check
+    # missed costs at most PAIR_REGEX_WALL_FACTOR budgets here
+    probe = _probe_text(literal)
+    _, completed, too_slow = pair_regex.bounded_findall(probe, probe)
+    if too_slow:
+        raise ValueError(f"did not finish a {len(probe)}-character probe text in {PAIR_REGEX_TIME_BUDGET}s of CPU time")
+    if not completed:
+        logger.warning(f"Probe of regex {source!r:.120} was cut off by a busy machine, not by the pattern; keeping it")
+    return pair_regex
+
+
+class RegexGuidance:
+    """
+    `pair_regex` guidance ({attribute: {"pair_regex": str or None}}) with
+    every pattern validated and compiled once.
+
+    Patterns that fail validation, or later run past PAIR_REGEX_TIME_BUDGET
+    on a document, are quarantined: logged once with the reason and never
+    run again. `quarantined` maps attribute -> reason.
+    """
+
+    def __init__(self, guidance):
+        self.patterns = {}
+        self.quarantined = {}
+        self._lock = threading.Lock()
+
+        for attr, info in (guidance or {}).items():
+            if not isinstance(info, dict):
+                self.quarantine(attr, f"malformed guidance entry: {info!r:.80}")
+                continue
+            source = info.get("pair_regex")
+            if not source:
+                continue
+            try:
+                self.patterns[attr] = compile_pair_regex(source)
+            except ValueError as e:
+                self.quarantine(attr, f"{e} ({source!r:.120})")
+
+        logger.info(
+            f"Compiled {len(self.patterns)} pair_regex pattern(s), "
+            f"{len(self.quarantined)} quarantined"
+        )
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def get(self, attr):
+        """PairRegex for `attr`, or None (no pattern, or quarantined)."""
+        return self.patterns.get(attr)
+
+    def quarantine(self, attr, reason):
+        with self._lock:
+            self.patterns.pop(attr, None)
+            self.quarantined[attr] = reason
+        logger.warning(f"Quarantined pair_regex for '{attr}': {reason}")
+
+    def findall(self, attr, text, text_lower=None):
+        """
+        Matches of the attribute's pattern in `text` (as re.findall), [] when
+        it has none. A scan that is cut off keeps the matches found so far;
+        the pattern is quarantined only when it was cut off after using its
+        whole CPU budget for the text (see PairRegex.bounded_findall).
+        """
+        pair_regex = self.get(attr)
+        if pair_regex is None:
+            return []
+        matches, completed, too_slow = pair_regex.bounded_findall(text, text_lower)
+        budget = pair_regex_budget(len(text))
+        if too_slow:
+            self.quarantine(attr, f"used more than {budget:.2f}s of CPU time on a {len(text)}-character text")
+        elif not completed:
+            logger.warning(
+                f"pair_regex for '{attr}' was cut off on a busy machine after "
+                f"{budget * PAIR_REGEX_WALL_FACTOR:.2f}s; partial matches only, pattern kept"
+            )
+        return matches
+
+
+@lru_cache(maxsize=256)
+def cached_pair_regex(source):
+    """compile_pair_regex(source), or None with the reason logged, compiled once per pattern."""
+    try:
+        return compile_pair_regex(source)
+    except ValueError as e:
+        logger.warning(f"Rejected regex {source!r:.120}: {e}")
+        return None
@@ -0,0 +1,138 @@
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Stage:
+    """
+    One pipeline stage: `fn(item) -> item`, run by `workers` threads that
+    read from a bounded input queue of size `queue_size`.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=2):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.items = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        self.queue.put(item)
+        depth = self.queue.qsize()
+        with self._lock:
+            self.depth_samples += 1
+            self.depth_total += depth
+            self.max_depth = max(self.max_depth, depth)
+
+
+class Pipeline:
+    """
+    Runs items through a chain of stages, each on its own threads, with
+    bounded queues in between. While one item is in a later stage the next
+    item can already be in an earlier one; a full queue blocks the stage
+    feeding it, so at most a few items are in flight per stage.
+
+    `on_done(item)` is called with the output of the last stage and
+    `on_error(item, stage_name, exc)` when a stage raises; the item is then
+    dropped. Both are called from pipeline threads.
+    """
+
+    def __init__(self, stages, on_done=None, on_error=None):
+        self.stages = stages
+        self.on_done = on_done or (lambda item: None)
+        self.on_error = on_error or (lambda item, stage_name, exc: None)
+        self._started = None
+        self._finished = None
+        self._threads = []
+        self._alive = {}
+        self._alive_lock = threading.Lock()
+
+    def start(self):
+        self._started = time.perf_counter()
+        for idx, stage in enumerate(self.stages):
+            self._alive[idx] = stage.workers
+            for n in range(stage.workers):
+                t = threading.Thread(target=self._run_stage, args=(idx,), name=f"{stage.name}-{n}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def submit(self, item):
+        """Feed an item into the first stage; blocks while its queue is full."""
+        self.stages[0].put(item)
+
+    def close(self):
+        """Signal that no more items come, then wait for everything to drain."""
+        for _ in range(self.stages[0].workers):
+            self.stages[0].queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._finished = time.perf_counter()
+
+    def _run_stage(self, idx):
+        stage = self.stages[idx]
+        next_stage = self.stages[idx + 1] if idx + 1 < len(self.stages) else None
+
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                break
+
+            start = time.perf_counter()
+            try:
+                out = stage.fn(item)
+            except Exception as e:
+                logger.error(f"Pipeline stage '{stage.name}' failed: {e}", exc_info=True)
+                with stage._lock:
+                    stage.errors += 1
+                    stage.busy_time += time.perf_counter() - start
+                self.on_error(item, stage.name, e)
+                continue
+            with stage._lock:
+                stage.items += 1
+                stage.busy_time += time.perf_counter() - start
+
+            if next_stage is not None:
+                next_stage.put(out)
+            else:
+                self.on_done(out)
+
+        # Last worker of this stage out stops the next stage
+        with self._alive_lock:
+            self._alive[idx] -= 1
+            last = self._alive[idx] == 0
+        if last and next_stage is not None:
+            for _ in range(next_stage.workers):
+                next_stage.queue.put(_STOP)
+
+    def stats(self):
+        """
+        Per-stage counters: items done, errors, mean/max input queue depth
+        (sampled on every put) and utilization = busy time / (wall time x workers).
+        """
+        end = self._finished or time.perf_counter()
+        wall = end - self._started if self._started else 0.0
+        out = {}
+        for stage in self.stages:
+            with stage._lock:
+                out[stage.name] = {
+                    "items": stage.items,
+                    "errors": stage.errors,
+                    "queue_depth": stage.queue.qsize(),
+                    "mean_queue_depth": stage.depth_total / stage.depth_samples if stage.depth_samples else 0.0,
+                    "max_queue_depth": stage.max_depth,
+                    "busy_time": stage.busy_time,
+                    "utilization": stage.busy_time / (wall * stage.workers) if wall > 0 else 0.0,
+                }
+        return out
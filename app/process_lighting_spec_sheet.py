@@ -1,14 +1,14 @@
 import os
 import logging
+import threading
 import json
-from  model_loader import get_qwen_model_path, get_yolo_model_path
-from  input_handler import convert_pdf_with_pymupdf
-from  ocr import get_ocr_object_per_page
+from  input_handler import PdfPageSource
+from  ocr import get_ocr_results_with_text_layer
 from  generate_mouting import (
     build_mounting_prompt,
-    get_valid_json,
-    load_schema_and_derive_product_types,)
-from  input_handler import save_final_result, merge_match_results
+    mounting_response_schema,
+    get_valid_json,)
+from  input_handler import save_final_result, merge_match_results, write_json_atomic
 from  ocr import build_full_ocr_text, filter_ocr_key_hit_by_value_matched, filter_ocr_keys_by_regions, match_values_for_keys
 from  serching import (
     match_product_types_via_lookup,
@@ -20,27 +20,30 @@ from  serching import (
 from  table_handler import (
     detect_table_regions_for_key_hits,
     extract_candidate_rows_for_keys,)
-from  generate_mouting import generate_llm_response
-from  generate_regex import build_regex_prompt, group_schema_by_sentence_closeness, clean_guidance
+from  generate_regex import (
+    build_regex_prompt,
+    regex_response_schema,
+    group_schema_by_sentence_closeness,
+    clean_guidance,
+    get_regex_guidance_cache,
+    get_cached_attribute_guidance,
+    put_cached_attribute_guidance,)
 import hashlib
-from generate_mouting import remove_think_block
-
-def process_lighting_spec_sheet(pdf_path, schema_path, ocr_engine, output_dir="final_result", use_gpu=False):
-    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-    logging.info(f"📄 Processing spec sheet: {base_name}.pdf")
-
-    # Step 1: PDF to images
-    logging.info("  → Converting PDF to images...")
-    images = convert_pdf_with_pymupdf(pdf_path)
-
-    # Step 2: OCR
-    logging.info("  → Running OCR on all pages...")
-    ocr_results = get_ocr_object_per_page(images, ocr_engine)
-
-    # Step 3: Load schema & derive product types
-    logging.info("  → Loading attribute schema and deriving product types...")
-    schema, product_type_set = load_schema_and_derive_product_types(schema_path)
-
+from helper import file_sha256
+from compiled_schema import load_compiled_schema
+from pair_regex import RegexGuidance
+from model_loader import LlamaPool
+from config import LLM_PARALLEL_CONTEXTS
+from concurrent.futures import ThreadPoolExecutor
+
+_regex_guidance = {}        # (output_dir, schema hash) -> RegexGuidance, for this process
+_regex_guidance_lock = threading.Lock()
+
+def load_or_generate_mounting_lookup(product_type_set, output_dir="final_result", use_gpu=False):
+    """
+    Product type -> mounting lookup, read from `llm_output.json` in
+    `output_dir` and completed with the LLM for product types it lacks.
+    """
     llm_output_path = os.path.join(output_dir, "llm_output.json")
     lookup = {}
 
@@ -69,7 +72,8 @@ def process_lighting_spec_sheet(pdf_path, schema_path, ocr_engine, output_dir="f
 
                 new_entries = get_valid_json(
                     prompt=prompt,
-                    use_gpu=use_gpu
+                    use_gpu=use_gpu,
+                    response_schema=mounting_response_schema(missing_product_types)
                 )
 
                 if not isinstance(new_entries, dict):
@@ -79,8 +83,7 @@ def process_lighting_spec_sheet(pdf_path, schema_path, ocr_engine, output_dir="f
                 lookup.update(new_entries)
 
                 # Save updated lookup
-                with open(llm_output_path, "w", encoding="utf-8") as f:
-                    json.dump(lookup, f, indent=2)
+                write_json_atomic(llm_output_path, lookup)
 
                 logging.info("  → Lookup updated and saved.")
     else:
@@ -91,42 +94,68 @@ def process_lighting_spec_sheet(pdf_path, schema_path, ocr_engine, output_dir="f
 
         lookup = get_valid_json(
             prompt=prompt,
-            use_gpu=use_gpu
+            use_gpu=use_gpu,
+            response_schema=mounting_response_schema(product_type_set)
         )
 
         if not isinstance(lookup, dict):
             raise ValueError("LLM output must be a dict of product_type -> mounting")
 
-        with open(llm_output_path, "w", encoding="utf-8") as f:
-            json.dump(lookup, f, indent=2)
+        write_json_atomic(llm_output_path, lookup)
 
         logging.info("  → Full lookup generated and saved.")
 
+    return lookup
 
-    # Step 5: Build full OCR text
-    logging.info("  → Building full OCR text...")
-    big_text = build_full_ocr_text(ocr_results)
+def generate_regex_guidance(schema, use_gpu=False):
+    """
+    Asks the LLM for `pair_regex` guidance for every attribute of `schema`,
+    one prompt per group of attributes with similar formatting text. The
+    groups are generated concurrently on a pool of llama contexts.
 
-    # Step 6: Match product types
-    logging.info("  → Matching product types from OCR text...")
-    matched_product_types = match_product_types_via_lookup(big_text, lookup)
+    Returns:
+        dict: {attribute: {"pair_regex": ...}} merged from all responses
+    """
+    guidance = group_schema_by_sentence_closeness(schema)
+    guidance_strip = clean_guidance(guidance)
 
-    # Step 7: First split by product type
-    logging.info("  → Filtering schema by matched product types...")
-    matched, not_matched = split_schema_by_product_type_match(schema, matched_product_types)
+    n_contexts = 1 if use_gpu else LLM_PARALLEL_CONTEXTS
+    pool = LlamaPool(min(n_contexts, len(guidance_strip)), use_gpu)
 
-    # Step 8: OCR key matching
-    logging.info("  → Detecting attribute keys in OCR results...")
-    matched_keys, ocr_key_hit = find_key_hits_from_ocr(matched.keys(), ocr_results)
+    def generate(g):
+        regex_prompt = build_regex_prompt(g)
+        try:
+            return get_valid_json(regex_prompt, use_gpu=use_gpu, response_schema=regex_response_schema(g), pool=pool)
+        except RuntimeError as e:
+            logging.warning(f"⚠️ Warning: No valid regex guidance for {sorted(g)}: {e}")
+            return {}
 
-    # Step 9: Refine by key hits
-    logging.info("  → Refining by detected keys...")
-    key_matched, key_not_matched = refine_by_key_hits(matched, not_matched, matched_keys)
+    with ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix="regex-guidance") as executor:
+        regex_withkey = list(executor.map(generate, guidance_strip))
 
-    # >>> NEW: Handle regex guidance caching <<<
+    # Merge responses into one dict
+    regex_withkey_dict = {}
+    for r in regex_withkey:
+        if not isinstance(r, dict):
+            raise TypeError(f"Unexpected LLM response type: {type(r)}")
+        regex_withkey_dict.update(r)
+    return regex_withkey_dict
+
+def load_or_generate_regex_guidance(schema, schema_path, output_dir="final_result", use_gpu=False, schema_hash=None):
+    """
+    LLM-generated `pair_regex` guidance per attribute, cached in `output_dir`
+    under the md5 of the schema file (`schema_hash`, e.g. CompiledSchema.content_hash).
+
+    Without that file, guidance is taken per attribute from the regex
+    guidance cache (keyed by the attribute's details), and only new or
+    changed attributes are sent to the LLM. Patterns RegexGuidance
+    quarantines are cached like the others, so each schema version asks
+    the LLM once, also with several worker processes.
+    """
     # Create a stable cache key from the schema file content (or path)
-    with open(schema_path, 'rb') as f:
-        schema_hash = hashlib.md5(f.read()).hexdigest()
+    if schema_hash is None:
+        with open(schema_path, 'rb') as f:
+            schema_hash = hashlib.md5(f.read()).hexdigest()
     regex_cache_path = os.path.join(output_dir, f"regex_guidance_{schema_hash}.json")
 
     regex_withkey_dict = {}
@@ -136,59 +165,176 @@ def process_lighting_spec_sheet(pdf_path, schema_path, ocr_engine, output_dir="f
         with open(regex_cache_path, "r", encoding="utf-8") as f:
             regex_withkey_dict = json.load(f)
     else:
-        logging.info("  → Generating regex guidance from schema (first run)...")
-        guidance = group_schema_by_sentence_closeness(schema)
-        guidance_strip = clean_guidance(guidance)
-        regex_withkey = []
-
-        for g in guidance_strip:
-            regex_prompt = build_regex_prompt(g)
-            # ⚠️ Fix typo: 'modelq' → 'model'
-            response = generate_llm_response(regex_prompt, use_gpu)
-            response = remove_think_block(response)   
-            regex_withkey.append(response)
-
-        # Merge responses into one dict
-        regex_withkey_dict = {}
-        for r in regex_withkey:
-            if isinstance(r, str):
-                try:
-                    parsed = json.loads(r)
-                except json.JSONDecodeError as e:
-                    logging.warning(f"⚠️ Warning: Failed to parse LLM regex response as JSON: {r[:200]}... Error: {e}")
-                    continue
-                regex_withkey_dict.update(parsed)
-            elif isinstance(r, dict):
-                regex_withkey_dict.update(r)
+        guidance_cache = get_regex_guidance_cache()
+        missing = {}
+        for attr, details in schema.items():
+            cached = get_cached_attribute_guidance(guidance_cache, attr, details)
+            if cached is None:
+                missing[attr] = details
             else:
-                raise TypeError(f"Unexpected LLM response type: {type(r)}")
+                regex_withkey_dict[attr] = cached
+        logging.info(
+            f"  → Regex guidance: {len(regex_withkey_dict)} attribute(s) cached, "
+            f"{len(missing)} new or changed to generate..."
+        )
+
+        if missing:
+            generated = generate_regex_guidance(missing, use_gpu)
+            for attr, guidance in generated.items():
+                if attr in missing:
+                    put_cached_attribute_guidance(guidance_cache, attr, missing[attr], guidance)
+            not_returned = len(set(missing) - set(generated))
+            if not_returned:
+                logging.warning(f"  → LLM returned no regex guidance for {not_returned} attribute(s)")
+            regex_withkey_dict.update(generated)
 
         # Save to cache
-        os.makedirs(output_dir, exist_ok=True)
-        with open(regex_cache_path, "w", encoding="utf-8") as f:
-            json.dump(regex_withkey_dict, f, indent=2)
+        write_json_atomic(regex_cache_path, regex_withkey_dict)
         logging.info(f"  → Regex guidance cached to: {os.path.basename(regex_cache_path)}")
-    # <<< END of regex guidance block >>>    
+
+    return regex_withkey_dict
+
+def load_regex_guidance(schema, schema_path, output_dir="final_result", use_gpu=False, schema_hash=None):
+    """
+    `load_or_generate_regex_guidance` with every pattern validated and
+    compiled (see RegexGuidance), once per guidance file and process.
+    """
+    if schema_hash is None:
+        with open(schema_path, 'rb') as f:
+            schema_hash = hashlib.md5(f.read()).hexdigest()
+    memo_key = (os.path.abspath(output_dir), schema_hash)
+    with _regex_guidance_lock:
+        regex_guidance = _regex_guidance.get(memo_key)
+        if regex_guidance is None:
+            regex_withkey_dict = load_or_generate_regex_guidance(schema, schema_path, output_dir, use_gpu, schema_hash=schema_hash)
+            regex_guidance = RegexGuidance(regex_withkey_dict)
+            _regex_guidance[memo_key] = regex_guidance
+    return regex_guidance
+
+def prepare_schema_artifacts(schema_path, output_dir="final_result", use_gpu=False):
+    """
+    Build the per-schema LLM artifacts (mounting lookup, regex guidance) once,
+    before documents are processed in parallel, so workers only read the caches.
+    """
+    compiled = load_compiled_schema(schema_path)
+    load_or_generate_mounting_lookup(set(compiled.product_types), output_dir, use_gpu)
+    load_regex_guidance(compiled.schema, schema_path, output_dir, use_gpu, schema_hash=compiled.content_hash)
+
+def new_document_job(pdf_path, schema_path, ocr_engine, output_dir="final_result", use_gpu=False, use_text_layer=True, ocr_cache=None, multires=False, ocr_batcher=None, layout_cache=None):
+    """
+    Per-document state passed from stage to stage (see DOCUMENT_STAGES).
+    """
+    return {
+        "pdf_path": pdf_path,
+        "base_name": os.path.splitext(os.path.basename(pdf_path))[0],
+        "schema_path": schema_path,
+        "ocr_engine": ocr_engine,
+        "output_dir": output_dir,
+        "use_gpu": use_gpu,
+        "use_text_layer": use_text_layer,
+        "ocr_cache": ocr_cache,
+        "multires": multires,
+        "ocr_batcher": ocr_batcher,
+        "layout_cache": layout_cache,
+    }
+
+def run_text_extraction_stage(job):
+    logging.info(f"📄 Processing spec sheet: {job['base_name']}.pdf")
+
+    # Step 1: Open the PDF; pages are rasterized on demand
+    logging.info("  → Opening PDF...")
+    job["pages"] = PdfPageSource(job["pdf_path"])
+
+    # Step 2: Text layer, OCR only where the PDF has no usable text layer
+    logging.info("  → Extracting text (PDF text layer, OCR fallback)...")
+    use_cache = job["ocr_cache"] is not None or job["layout_cache"] is not None
+    job["pdf_hash"] = file_sha256(job["pdf_path"]) if use_cache else None
+    job["ocr_results"], job["page_report"] = get_ocr_results_with_text_layer(
+        job["pages"], job["ocr_engine"], use_text_layer=job["use_text_layer"],
+        ocr_cache=job["ocr_cache"], pdf_hash=job["pdf_hash"], multires=job["multires"], batcher=job["ocr_batcher"]
+    )
+    n_ocr_pages = sum(1 for p in job["page_report"] if p["source"] != "text_layer")
+    logging.info(f"  → {len(job['page_report']) - n_ocr_pages} page(s) from text layer, {n_ocr_pages} page(s) OCR'd")
+    return job
+
+def run_matching_stage(job):
+    schema_path, output_dir, use_gpu = job["schema_path"], job["output_dir"], job["use_gpu"]
+    ocr_results = job["ocr_results"]
+
+    # Step 3: Load schema & derive product types (compiled once per run)
+    logging.info("  → Loading attribute schema and deriving product types...")
+    compiled = load_compiled_schema(schema_path)
+    schema, product_type_set = compiled.schema, set(compiled.product_types)
+
+    # Step 4: Product type -> mounting lookup (LLM, cached)
+    lookup = load_or_generate_mounting_lookup(product_type_set, output_dir, use_gpu)
+
+    # Step 5: Build full OCR text
+    logging.info("  → Building full OCR text...")
+    big_text = build_full_ocr_text(ocr_results)
+
+    # Step 6: Match product types
+    logging.info("  → Matching product types from OCR text...")
+    matched_product_types = match_product_types_via_lookup(big_text, lookup)
+
+    # Step 7: First split by product type
+    logging.info("  → Filtering schema by matched product types...")
+    matched, not_matched = split_schema_by_product_type_match(schema, matched_product_types, compiled)
+
+    # Step 8: OCR key matching
+    logging.info("  → Detecting attribute keys in OCR results...")
+    matched_keys, ocr_key_hit = find_key_hits_from_ocr(matched.keys(), ocr_results)
+
+    # Step 9: Refine by key hits
+    logging.info("  → Refining by detected keys...")
+    key_matched, key_not_matched = refine_by_key_hits(matched, not_matched, matched_keys)
+
+    # Regex guidance per attribute (LLM, cached per schema; patterns validated and compiled once)
+    regex_guidance = load_regex_guidance(schema, schema_path, output_dir, use_gpu, schema_hash=compiled.content_hash)
 
     # -----------------------------------------------------------------------------------
     # Step 10: Refine by value hits
     logging.info("  → Checking for matching values in text...")
-    value_matched, value_not_matched = refine_by_value_hits(key_matched, key_not_matched, big_text, schema)
+    value_matched, value_not_matched = refine_by_value_hits(key_matched, key_not_matched, big_text, compiled)
 
     # Step 11: Refine by key-value pair logic
     logging.info("  → Validating key-value co-occurrence...")
-    final_value_matched, final_value_not_matched = refine_by_key_value_pair_matching(value_matched, value_not_matched, big_text, regex_withkey_dict)
-
+    final_value_matched, final_value_not_matched = refine_by_key_value_pair_matching(value_matched, value_not_matched, big_text, regex_guidance)
+
+    job.update({
+        "ocr_key_hit": ocr_key_hit,
+        "value_matched": value_matched,
+        "value_not_matched": value_not_matched,
+        "final_value_matched": final_value_matched,
+        "final_value_not_matched": final_value_not_matched,
+    })
+    return job
+
+def run_layout_stage(job):
     # Step 12: Table-based key-value extraction
     logging.info("  → Extracting key-value pairs from detected tables...")
-    layout_model = get_yolo_model_path()
-    filter_ocr_key_hit = filter_ocr_key_hit_by_value_matched(ocr_key_hit, value_matched)
+    filter_ocr_key_hit = filter_ocr_key_hit_by_value_matched(job["ocr_key_hit"], job["value_matched"])
+
+    try:
+        regions_by_page = detect_table_regions_for_key_hits(
+            filter_ocr_key_hit, job["ocr_key_hit"], job["value_matched"], job["pages"],
+            layout_cache=job["layout_cache"], pdf_hash=job["pdf_hash"]
+        )
+    finally:
+        job["pages"].close()
 
-    regions_by_page = detect_table_regions_for_key_hits(filter_ocr_key_hit, ocr_key_hit, value_matched, layout_model, images)
+    job["filter_ocr_key_hit"] = filter_ocr_key_hit
+    job["regions_by_page"] = regions_by_page
+    return job
 
-    filtered_keys = filter_ocr_keys_by_regions(filter_ocr_key_hit, regions_by_page)
+def run_table_matching_stage(job):
+    base_name = job["base_name"]
+    value_matched, value_not_matched = job["value_matched"], job["value_not_matched"]
+    final_value_matched, final_value_not_matched = job["final_value_matched"], job["final_value_not_matched"]
 
-    pages, row_for_key_data = extract_candidate_rows_for_keys(filtered_keys, ocr_results)
+    filtered_keys = filter_ocr_keys_by_regions(job["filter_ocr_key_hit"], job["regions_by_page"])
+
+    pages, row_for_key_data = extract_candidate_rows_for_keys(filtered_keys, job["ocr_results"])
 
     table_value_matched, table_value_not_matched = match_values_for_keys(
     row_for_key_data,
@@ -204,7 +350,7 @@ def process_lighting_spec_sheet(pdf_path, schema_path, ocr_engine, output_dir="f
     )
 
     final_result = final_matched | final_not_matched
-    save_final_result(final_result, output_dir=output_dir, base_name=base_name)
+    save_final_result(final_result, output_dir=job["output_dir"], base_name=base_name)
 
 
     success = bool(final_value_matched)
@@ -213,5 +359,27 @@ def process_lighting_spec_sheet(pdf_path, schema_path, ocr_engine, output_dir="f
     else:
         logging.info(f"❌ NO MATCH: No valid key-value pairs found in '{base_name}.pdf'")
 
-    return success
-
+    job["success"] = success
+    return job
+
+# rasterize + OCR -> lookup + matching -> YOLO -> table matching
+DOCUMENT_STAGES = [
+    ("extract", run_text_extraction_stage),
+    ("match", run_matching_stage),
+    ("layout", run_layout_stage),
+    ("tables", run_table_matching_stage),
+]
+
+def process_lighting_spec_sheet(pdf_path, schema_path, ocr_engine, output_dir="final_result", use_gpu=False, use_text_layer=True, ocr_cache=None, multires=False, ocr_batcher=None, layout_cache=None):
+    job = new_document_job(
+        pdf_path, schema_path, ocr_engine, output_dir=output_dir, use_gpu=use_gpu,
+        use_text_layer=use_text_layer, ocr_cache=ocr_cache, multires=multires, ocr_batcher=ocr_batcher,
+        layout_cache=layout_cache
+    )
+    try:
+        for _, stage in DOCUMENT_STAGES:
+            job = stage(job)
+    finally:
+        if "pages" in job:
+            job["pages"].close()
+    return job["success"]
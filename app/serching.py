@@ -1,7 +1,10 @@
 import logging
 import re
-from  helper import generate_ocr_variants
+from  full_text import lowered, folded
+from  matcher import find_terms, compile_key_value_matcher, KeyTokenIndex
 from  input_handler import get_attribute_info_by_key
+from  compiled_schema import CompiledSchema, build_attribute_index
+from  pair_regex import RegexGuidance, cached_pair_regex
 
 def matches_key_value_pair(big_text: str, key: str, value) -> bool:
     """
@@ -21,35 +24,15 @@ def matches_key_value_pair(big_text: str, key: str, value) -> bool:
     if isinstance(value, str):
         value = [value]
 
-    # Normalize big_text once
-    big_text_lower = big_text.lower()
-
-    # Escape and clean the key once
-    key_clean = key.strip().lower()
-    if not key_clean:
+    if not key.strip():
         logging.debug("Key is empty after cleaning – skipping match check.")
         return False
-    key_esc = re.escape(key_clean)
-
-    # Common delimiters between key and value
-    delimiters = r"[:\-\–\—=]?\s*"
-
-    for val in value:
-        val_clean = str(val).strip()
-        if not val_clean:
-            continue
-
-        # Generate OCR-friendly variants for the value
-        ocr_variants = generate_ocr_variants(val_clean)
-        logging.debug(f"Generated {len(ocr_variants)} OCR variants for value '{val_clean}': {ocr_variants}")
 
-        for variant in ocr_variants:
-            val_esc = re.escape(variant.lower())
-            pattern = rf"{key_esc}{delimiters}{val_esc}"
-            
-            if re.search(pattern, big_text_lower, re.IGNORECASE):
-                logging.debug(f"✅ Match found! Pattern '{pattern}' detected in text.")
-                return True
+    matcher = compile_key_value_matcher(key, value)
+    hits = matcher.search(lowered(big_text), folded(big_text), stop_at_first=True)
+    if hits:
+        logging.debug(f"✅ Match found for key '{key}': {hits}")
+        return True
 
     logging.debug(f"❌ No match found for key '{key}' with any of the provided values or their OCR variants.")
     return False
@@ -60,79 +43,47 @@ def find_hits(big_text: str, search_terms):
     including OCR-tolerant variants.
     Returns a list of original terms that had at least one matching variant in the text.
     """
-    big_text_lower = big_text.lower()
-    hits = []
+    if isinstance(search_terms, str):
+        search_terms = [search_terms]
     total_terms = len(search_terms)
 
     logging.debug(f"Searching for {total_terms} term(s) in OCR text (length: {len(big_text)})")
 
-    for term in search_terms:
-        term_hits = False
-        for variant in generate_ocr_variants(term):
-            if variant in big_text_lower:
-                hits.append(term)
-                term_hits = True
-                logging.debug(f"✅ Match found for term '{term}' via variant '{variant}'")
-                break  # stop after first successful variant
-
-        if not term_hits:
-            logging.debug(f"❌ No match found for term: '{term}'")
+    # One pass of the compiled variant automaton over the text
+    found = find_terms(big_text, search_terms)
+    hits = [term for term in search_terms if str(term) in found]
 
     logging.debug(f"Total hits found: {len(hits)} / {total_terms}")
     return hits
 
 
-def find_key_hits_from_ocr(keys, ocr_results):
-    """
-    keys: iterable of attribute keys (strings)
-    ocr_results: OCR output list
-
-    returns: set of original keys that had an exact word hit
-    """
-    logging.debug(f"Searching for {len(keys)} key(s) in OCR results...")
-
-    # Normalize keys: tuple of words -> original key
-    normalized_key_map = {
-        tuple(re.findall(r"\b\w+\b", key.lower())): key
-        for key in keys
-    }
-    matched_keys = set()
-
-    for result_group in ocr_results:
-        if not result_group:
-            continue
-        ocr_result = result_group[0]
-        rec_texts = ocr_result.get("rec_texts", [])
-        for txt in rec_texts:
-            words = re.findall(r"\b\w+\b", txt.lower())
-            for key_words, orig_key in normalized_key_map.items():
-                key_len = len(key_words)
-                # sliding window exact match
-                for i in range(len(words) - key_len + 1):
-                    if tuple(words[i:i + key_len]) == key_words:
-                        if orig_key not in matched_keys:
-                            logging.debug(f"✅ Matched key: '{orig_key}' in OCR text: '{txt}'")
-                        matched_keys.add(orig_key)
-                        break
-
-    logging.debug(f"Key search complete. Found {len(matched_keys)} matching key(s): {sorted(matched_keys)}")
-    return matched_keys
-
 def match_product_types_via_lookup(big_text, lookup):
     logging.debug(f"Matching product types against {len(lookup)} lookup entries...")
+    # A lookup value is a single mounting word or a list of them
+    terms_by_ptype = {
+        ptype: [val] if isinstance(val, str) else list(val)
+        for ptype, val in lookup.items()
+    }
+    found = find_terms(big_text, [t for terms in terms_by_ptype.values() for t in terms])
     matched_product_types = {
         ptype
-        for ptype, val in lookup.items()
-        if find_hits(big_text, val)
+        for ptype, terms in terms_by_ptype.items()
+        if any(str(t) in found for t in terms)
     }
     logging.debug(f"Matched {len(matched_product_types)} product type(s): {sorted(matched_product_types)}")
     return matched_product_types
 
 
-def split_schema_by_product_type_match(schema, matched_product_types):
+def split_schema_by_product_type_match(schema, matched_product_types, compiled=None):
+    """
+    Split attributes into those with at least one matched product type and
+    the rest. With `compiled` (the CompiledSchema of `schema`), the test is
+    one bitmask AND per attribute.
+    """
     logging.info(f"Filtering schema by {len(matched_product_types)} matched product type(s)...")
     matched = {}
     not_matched = {}
+    matched_mask = compiled.product_type_mask(matched_product_types) if compiled is not None else None
 
     for attr_name, attr_obj in schema.items():
         original_product_types = attr_obj.get("product_types", [])
@@ -144,7 +95,10 @@ def split_schema_by_product_type_match(schema, matched_product_types):
         new_obj = attr_obj.copy()
         new_obj["product_types"] = product_type_status
 
-        has_match = any(product_type_status.values())
+        if matched_mask is not None and attr_name in compiled.attribute_masks:
+            has_match = bool(compiled.attribute_masks[attr_name] & matched_mask)
+        else:
+            has_match = any(product_type_status.values())
 
         if has_match:
             matched[attr_name] = new_obj
@@ -157,12 +111,21 @@ def split_schema_by_product_type_match(schema, matched_product_types):
 
 
 def find_key_hits_from_ocr(keys, ocr_results):
+    """
+    Find attribute keys as exact word sequences in the OCR lines.
+
+    Args:
+        keys: iterable of attribute keys (strings)
+        ocr_results: OCR output list
+
+    Returns:
+        (set of matched keys, list of hit records): one record per key and
+        OCR line, {"key", "text", "bbox", "ocr_result_index", "text_index"},
+        ordered by page, line, then key order
+    """
     logging.debug(f"Searching for {len(keys)} keys in OCR results using exact word matching...")
 
-    normalized_key_map = {
-        tuple(re.findall(r"\b\w+\b", key.lower())): key
-        for key in keys
-    }
+    key_index = KeyTokenIndex(keys)
 
     matched_keys = set()
     ocr_key_hit = []
@@ -176,24 +139,17 @@ def find_key_hits_from_ocr(keys, ocr_results):
         rec_polys = ocr_result.get("rec_polys", [])
 
         for txt_idx, txt in enumerate(rec_texts):
-            words = re.findall(r"\b\w+\b", txt.lower())
-
-            for key_words, orig_key in normalized_key_map.items():
-                key_len = len(key_words)
-
-                for i in range(len(words) - key_len + 1):
-                    if tuple(words[i:i + key_len]) == key_words:
-                        if orig_key not in matched_keys:
-                            logging.debug(f"✅ Key matched: '{orig_key}' in OCR text: '{txt}'")
-                        matched_keys.add(orig_key)
-                        ocr_key_hit.append({
-                            "key": orig_key,
-                            "text": txt,
-                            "bbox": rec_polys[txt_idx],
-                            "ocr_result_index": ocr_idx,
-                            "text_index": txt_idx
-                        })
-                        break
+            for orig_key in key_index.find(txt):
+                if orig_key not in matched_keys:
+                    logging.debug(f"✅ Key matched: '{orig_key}' in OCR text: '{txt}'")
+                matched_keys.add(orig_key)
+                ocr_key_hit.append({
+                    "key": orig_key,
+                    "text": txt,
+                    "bbox": rec_polys[txt_idx],
+                    "ocr_result_index": ocr_idx,
+                    "text_index": txt_idx
+                })
 
     logging.debug(f"Key search complete: {len(matched_keys)} unique key(s) matched.")
     return matched_keys, ocr_key_hit
@@ -222,16 +178,21 @@ def refine_by_value_hits(key_matched, key_not_matched, big_text, schema):
     # Keep the original not_matched keys as they were
     value_not_matched = key_not_matched.copy()
 
+    # One automaton over every (normalized) value in the schema, shared by all documents
+    if isinstance(schema, CompiledSchema):
+        all_values = schema.all_values
+    else:
+        all_values = [v.strip().lower() for attr in schema.values() for v in attr.get("values", [])]
+    found = find_terms(big_text, all_values)
+
+    key_index = build_attribute_index(key_matched)
     for key in key_matched:
-        attr = get_attribute_info_by_key(key, key_matched)
+        attr = get_attribute_info_by_key(key, key_matched, index=key_index)
         values = attr.get("values", [])
 
-        # Identify hits in the text
-        hits = set(v.lower() for v in find_hits(big_text, values))
-
         # Map every value to True or False
         value_map = {
-            v: str(v).lower() in hits
+            v: str(v) in found
             for v in values
         }
 
@@ -246,19 +207,27 @@ def search_regex_in_text(regex_string: str, big_text: str):
     if not regex_string:
         return []
 
-    try:
-        # Added re.IGNORECASE because your text is lowercase ("input watts")
-        pattern = re.compile(regex_string, re.IGNORECASE)
-        matches = pattern.findall(big_text)
-        return matches
-    except re.error as e:
-        print(f"Invalid regex: {e}")
+    # Validated and compiled once per pattern; invalid or too slow patterns are logged and skipped
+    pair_regex = cached_pair_regex(regex_string)
+    if pair_regex is None:
         return []
+    matches, completed, _ = pair_regex.bounded_findall(big_text)
+    if not completed:
+        logging.warning(f"Regex {regex_string!r:.120} was cut off on a {len(big_text)}-character text; partial matches only")
+    return matches
 
 def refine_by_key_value_pair_matching(value_matched, value_not_matched, big_text, regex_withkey):
     final_value_matched = {}
     final_value_not_matched = value_not_matched.copy()
-    print(value_matched)
+    logging.debug(f"Values matched before key-value refinement: {value_matched}")
+
+    # Patterns precompiled when the guidance was loaded; a plain dict is compiled here
+    regex_guidance = regex_withkey if isinstance(regex_withkey, RegexGuidance) else RegexGuidance(regex_withkey)
+
+    # Lowercase and fold the text once for all keys (a FullText already is)
+    big_text_lower = lowered(big_text)
+    big_text_folded = folded(big_text)
+
     for attr_name, attr_obj in value_matched.items():
         key = attr_obj.get("norm_key") or attr_obj.get("original_key")
         key_org = attr_obj.get("original_key")
@@ -266,31 +235,22 @@ def refine_by_key_value_pair_matching(value_matched, value_not_matched, big_text
         new_values = {}
         any_value_hit = False
 
-        # Step 1: Check existing key-value pair hits
+        # Step 1: Check existing key-value pair hits, one scan per key
+        pair_hits = compile_key_value_matcher(key, values).search(big_text_lower, big_text_folded)
         for value, is_hit in values.items():
-            if is_hit and matches_key_value_pair(big_text, key, value):
+            if is_hit and value in pair_hits:
                 new_values[value] = True
                 any_value_hit = True
-                print(f"✅ Matched key-value pair: {key} -> {value}")
+                logging.debug(f"Matched key-value pair: {key} -> {value}")
             else:
                 new_values[value] = False
 
         # Step 2: Additional regex-based matching from regex_withkey
-
-        regex_info = regex_withkey.get(key_org, {})
-        print(key)
-        regex_pattern = regex_info.get("pair_regex")
-        if regex_pattern:
-            # print(f"🔍 Searching for regex pattern: {regex_pattern}")
-            matches_from_regex = search_regex_in_text(regex_pattern, big_text)
-            print(f"🔍 Found matches: {matches_from_regex}")
-            # for match in matches_from_regex:
-            #     # If the matched value exists in values, mark it True
-            #     print(new_values)
-            #     # if match in new_values:
-            #     new_values[match] = True
-            #     any_value_hit = True
-            #     print(f"🔹 Regex matched key-value: {key} -> {match}")
+        logging.debug(f"Refining key: {key}")
+        pair_regex = regex_guidance.get(key_org)
+        if pair_regex is not None:
+            matches_from_regex = regex_guidance.findall(key_org, big_text, big_text_lower)
+            logging.debug(f"Regex matches for {key_org}: {matches_from_regex}")
             for match in matches_from_regex:
                 # 1. Remove key_org from the match (case-insensitive)
                 # 2. .strip(" :-") removes leading/trailing colons, dashes, or spaces
@@ -300,7 +260,6 @@ def refine_by_key_value_pair_matching(value_matched, value_not_matched, big_text
                 if cleaned_val: # Only add if there's something left after stripping
                     new_values[cleaned_val] = True
                     any_value_hit = True
-                    # print(f"🔹 Regex matched & cleaned: {key_org} -> {cleaned_val}")
 
         # Save the updated values back to the attribute
         new_attr = attr_obj.copy()
@@ -0,0 +1,167 @@
+import math
+from collections import defaultdict
+import numpy as np
+
+
+def poly_to_bbox(poly):
+    """Axis-aligned (x1, y1, x2, y2) of a polygon given as a sequence of (x, y) points."""
+    xs = [p[0] for p in poly]
+    ys = [p[1] for p in poly]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def boxes_intersect(a, b):
+    """True if boxes (x1, y1, x2, y2) overlap or touch."""
+    return not (
+        a[2] < b[0] or
+        a[0] > b[2] or
+        a[3] < b[1] or
+        a[1] > b[3]
+    )
+
+
+def polys_to_bboxes(polys):
+    """
+    (N, 4) float32 [x1, y1, x2, y2] boxes of (N, K, 2) polygons.
+    """
+    polys = np.asarray(polys)
+    if polys.size == 0:
+        return np.zeros((0, 4), dtype=np.float32)
+    return np.concatenate([polys.min(axis=1), polys.max(axis=1)], axis=1).astype(np.float32)
+
+
+def horizontal_overlap_ratios(bboxes, box):
+    """
+    Width of the horizontal overlap of every box in `bboxes` with `box`,
+    as a fraction of the width of `box`.
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64)
+    overlap = np.minimum(bboxes[:, 2], box[2]) - np.maximum(bboxes[:, 0], box[0])
+    return np.maximum(overlap, 0) / (box[2] - box[0])
+
+
+def vertical_order(bboxes, ids):
+    """`ids` sorted top to bottom by their box's y1, ties kept in id order."""
+    ids = np.asarray(ids, dtype=np.int64)
+    return ids[np.lexsort((ids, np.asarray(bboxes)[ids, 1]))]
+
+
+def intersects_mask(bboxes, rect):
+    """Boolean mask of the boxes in `bboxes` that overlap or touch `rect`."""
+    bboxes = np.asarray(bboxes, dtype=np.float64)
+    return ~(
+        (bboxes[:, 2] < rect[0]) |
+        (bboxes[:, 0] > rect[2]) |
+        (bboxes[:, 3] < rect[1]) |
+        (bboxes[:, 1] > rect[3])
+    )
+
+
+def first_intersecting(bboxes, regions):
+    """
+    For every box in `bboxes`, the index of the first region in `regions`
+    (both (N, 4) arrays) it overlaps or touches, or -1.
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    regions = np.asarray(regions, dtype=np.float64).reshape(-1, 4)
+    if not len(bboxes) or not len(regions):
+        return np.full(len(bboxes), -1, dtype=np.int64)
+    b = bboxes[:, None, :]
+    r = regions[None, :, :]
+    mask = ~(
+        (b[..., 2] < r[..., 0]) |
+        (b[..., 0] > r[..., 2]) |
+        (b[..., 3] < r[..., 1]) |
+        (b[..., 1] > r[..., 3])
+    )
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), -1)
+
+
+class GridIndex:
+    """
+    Uniform-grid spatial index over axis-aligned boxes on one page.
+
+    The page extent is split into about sqrt(n) x sqrt(n) cells and every
+    box is registered in each cell it covers, so a query only looks at the
+    boxes in the cells its rectangle covers; the exact test on those
+    candidates is a NumPy mask. Box ids are rows of the (N, 4) array the
+    index was built from.
+    """
+
+    def __init__(self, boxes, cells_per_axis=None):
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.cells = {}
+        if not len(self.boxes):
+            self.max_y = None
+            return
+
+        self.min_x, self.min_y = self.boxes[:, 0].min(), self.boxes[:, 1].min()
+        self.max_x, self.max_y = self.boxes[:, 2].max(), self.boxes[:, 3].max()
+        self.n_cells = cells_per_axis or max(1, int(math.sqrt(len(self.boxes))))
+        self.cell_w = max((self.max_x - self.min_x) / self.n_cells, 1e-6)
+        self.cell_h = max((self.max_y - self.min_y) / self.n_cells, 1e-6)
+
+        cells = defaultdict(list)
+        spans = zip(
+            self._cols(self.boxes[:, 0]).tolist(), self._cols(self.boxes[:, 2]).tolist(),
+            self._rows(self.boxes[:, 1]).tolist(), self._rows(self.boxes[:, 3]).tolist(),
+        )
+        for box_id, (c1, c2, r1, r2) in enumerate(spans):
+            for cx in range(c1, c2 + 1):
+                for cy in range(r1, r2 + 1):
+                    cells[(cx, cy)].append(box_id)
+        self.cells = {cell: np.array(ids, dtype=np.int64) for cell, ids in cells.items()}
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _cols(self, xs):
+        return np.clip(((np.asarray(xs) - self.min_x) // self.cell_w).astype(np.int64), 0, self.n_cells - 1)
+
+    def _rows(self, ys):
+        return np.clip(((np.asarray(ys) - self.min_y) // self.cell_h).astype(np.int64), 0, self.n_cells - 1)
+
+    def candidates(self, x1, y1, x2, y2):
+        """Sorted ids of boxes registered in the cells covering the rectangle (a superset of the hits)."""
+        if not len(self.boxes) or x2 < self.min_x or x1 > self.max_x or y2 < self.min_y or y1 > self.max_y:
+            return np.zeros(0, dtype=np.int64)
+        c1, c2 = self._cols([x1, x2]).tolist()
+        r1, r2 = self._rows([y1, y2]).tolist()
+        found = [
+            self.cells[(cx, cy)]
+            for cx in range(c1, c2 + 1)
+            for cy in range(r1, r2 + 1)
+            if (cx, cy) in self.cells
+        ]
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def intersecting(self, rect):
+        """
+        Ids of boxes overlapping or touching `rect` (x1, y1, x2, y2), in
+        index order.
+        """
+        ids = self.candidates(*rect)
+        return ids[intersects_mask(self.boxes[ids], rect)]
+
+    def below(self, key_box, stop_y, min_overlap=0.3):
+        """
+        Ids of boxes whose top lies strictly between the bottom of `key_box`
+        and `stop_y`, and whose horizontal overlap with `key_box` is at least
+        `min_overlap` of the key's width; sorted top to bottom (ties in index
+        order).
+        """
+        key_x1, _, key_x2, key_y2 = (float(v) for v in key_box)
+        key_width = key_x2 - key_x1
+
+        if min_overlap <= 0:
+            ids = np.arange(len(self.boxes))   # any box qualifies horizontally
+        elif key_width <= 0:
+            return np.zeros(0, dtype=np.int64)
+        else:
+            ids = self.candidates(key_x1, key_y2, key_x2, stop_y)
+
+        b = self.boxes[ids]
+        mask = (b[:, 1] > key_y2) & (b[:, 1] < stop_y)
+        if min_overlap > 0:
+            mask &= horizontal_overlap_ratios(b, (key_x1, 0, key_x2, 0)) >= min_overlap
+        return vertical_order(self.boxes, ids[mask])
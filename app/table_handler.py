@@ -1,6 +1,13 @@
+import os
+import json
+import hashlib
 import logging
-from doclayout_yolo import YOLOv10
-from  model_loader import get_yolo_model_path
+import threading
+from  model_loader import get_layout_model, LAYOUT_SETTINGS
+from config import LAYOUT_PAGE_CHUNK, LAYOUT_BATCH_MAX_WAIT, LAYOUT_CACHE_PATH, LAYOUT_CACHE_MAX_BYTES, RENDER_DPI
+from batcher import InferenceBatcher
+from cache_store import LRUCacheStore
+from spatial_index import GridIndex, poly_to_bbox, polys_to_bboxes
 
 # def layout_detect(model,images):
 #     det_res = model.predict(
@@ -14,12 +21,27 @@ from  model_loader import get_yolo_model_path
 import logging
 logger = logging.getLogger(__name__)
 
-def layout_detect(images):
+# The YOLO predictor keeps per-call state, so predictions are serialized
+_layout_lock = threading.Lock()
+_layout_batcher = None
+_layout_batcher_pid = None
+_layout_cache = None
+
+TABLE_CLASS = 5  # doclayout_yolo "Table" class
+
+# Bump when the cached table-region format changes
+LAYOUT_CACHE_VERSION = 1
+
+def layout_detect(images, imgsz=None, conf=None):
     """
-    Detect layout elements in one or more PIL images.
+    Detect layout elements in one or more page images with the shared
+    layout model from `get_layout_model`. A list is predicted as one batch,
+    so pages from several documents can be passed together.
 
     Args:
-        images: Single PIL image or list of PIL images
+        images: Single image or list of images; PIL images (RGB) or
+            HxWx3 uint8 arrays in BGR order, e.g. from PdfPageSource
+        imgsz / conf: override LAYOUT_SETTINGS for this call
 
     Returns:
         List of detection dictionaries per page
@@ -27,16 +49,17 @@ def layout_detect(images):
     logger.info("Starting layout detection")
 
     try:
-        filepath = get_yolo_model_path()
-        model = YOLOv10(filepath)
-        logger.debug(f"Model loaded successfully. Running detection on {len(images)} image(s)")
-
-        det_res = model.predict(
-            images,   # Image to predict
-            imgsz=1024,        # Prediction image size
-            conf=0.05,                           # Confidence threshold
-            device='cpu' ,    # Device to use (e.g., 'cuda:0' or 'cpu')
-        )
+        model = get_layout_model()
+        logger.debug(f"Running detection on {len(images)} image(s)")
+
+        with _layout_lock:
+            det_res = model.predict(
+                images,   # Image to predict
+                imgsz=LAYOUT_SETTINGS["imgsz"] if imgsz is None else imgsz,    # Prediction image size
+                conf=LAYOUT_SETTINGS["conf"] if conf is None else conf,        # Confidence threshold
+                device=LAYOUT_SETTINGS["device"],               # Device to use (e.g., 'cuda:0' or 'cpu')
+                verbose=False,
+            )
 
         logger.info(f"Layout detection completed for {len(det_res)} page(s)")
         return det_res
@@ -45,13 +68,38 @@ def layout_detect(images):
         logger.error(f"Layout detection failed: {str(e)}", exc_info=True)
         raise
 
+def get_layout_batcher():
+    """
+    Returns the process-wide layout InferenceBatcher, which merges pages
+    submitted by concurrent callers (pipeline threads, several documents)
+    into `layout_detect` calls of up to LAYOUT_PAGE_CHUNK pages.
+    """
+    global _layout_batcher, _layout_batcher_pid
+    if _layout_batcher is None or _layout_batcher_pid != os.getpid():
+        _layout_batcher = InferenceBatcher(
+            layout_detect,
+            batch_size=LAYOUT_PAGE_CHUNK,
+            max_wait=LAYOUT_BATCH_MAX_WAIT,
+            name="layout_batcher",
+        )
+        _layout_batcher_pid = os.getpid()
+    return _layout_batcher
+
+def detect_layout_pages(images):
+    """
+    Layout results for `images`, in order, batched with pages from any
+    other thread detecting layout at the same time.
+    """
+    return get_layout_batcher().map(images)
+
 def get_text_under_key_to_page_end(
     key_poly,
     rec_texts,
     rec_polys,
     image_height=None,
     stop_y=None,
-    horizontal_tolerance=0.3
+    horizontal_tolerance=0.3,
+    index=None
 ):
     """
     Extract all OCR text under a key.
@@ -63,15 +111,13 @@ def get_text_under_key_to_page_end(
         image_height: optional image height (preferred)
         stop_y: optional Y coordinate to stop extraction
         horizontal_tolerance: required horizontal overlap ratio
+        index: optional GridIndex over the page's rec_polys, reused across
+            keys on the same page
     """
+    if index is None:
+        index = GridIndex(polys_to_bboxes(rec_polys))
 
-    def poly_to_bbox(poly):
-        xs = [p[0] for p in poly]
-        ys = [p[1] for p in poly]
-        return min(xs), min(ys), max(xs), max(ys)
-
-    key_x1, key_y1, key_x2, key_y2 = poly_to_bbox(key_poly)
-    key_width = key_x2 - key_x1
+    key_box = poly_to_bbox(key_poly)
 
     # Determine bottom boundary
     if stop_y is not None:
@@ -79,82 +125,104 @@ def get_text_under_key_to_page_end(
     elif image_height is not None:
         page_bottom = image_height
     else:
-        page_bottom = max(poly_to_bbox(p)[3] for p in rec_polys)
-
-    hits = []
+        page_bottom = index.max_y
+        if page_bottom is None:
+            return []
 
-    for txt, poly in zip(rec_texts, rec_polys):
-        x1, y1, x2, y2 = poly_to_bbox(poly)
+    return [
+        {
+            "text": rec_texts[box_id],
+            "bbox": rec_polys[box_id],
+            "y_top": float(index.boxes[box_id, 1])
+        }
+        for box_id in index.below(key_box, page_bottom, horizontal_tolerance).tolist()
+    ]
 
-        # must be below the key
-        if y1 <= key_y2:
-            continue
-
-        # must be above stop boundary
-        if y1 >= page_bottom:
-            continue
-
-        # horizontal overlap
-        overlap_x1 = max(key_x1, x1)
-        overlap_x2 = min(key_x2, x2)
-        overlap_width = max(0, overlap_x2 - overlap_x1)
-
-        if overlap_width / key_width >= horizontal_tolerance:
-            hits.append({
-                "text": txt,
-                "bbox": poly,
-                "y_top": y1
-            })
-
-    hits.sort(key=lambda x: x["y_top"])
-    return hits
 
+def get_layout_cache():
+    """
+    Returns the global on-disk cache of per-page table regions, creating it if necessary.
+    """
+    global _layout_cache
+    if _layout_cache is None:
+        _layout_cache = LRUCacheStore(LAYOUT_CACHE_PATH, LAYOUT_CACHE_MAX_BYTES, name="layout_cache")
+    return _layout_cache
 
-def detect_table_regions_for_key_hits(filtered_keys, ocr_key_hit, value_matched, layout_model, images):
+def layout_cache_key(pdf_hash, page_idx, dpi=RENDER_DPI):
+    """
+    Cache key for the table regions of one rendered page: PDF content, page,
+    DPI, the layout model settings (weights, imgsz, conf) and the table class.
+    """
+    key_data = {
+        "version": LAYOUT_CACHE_VERSION,
+        "pdf": pdf_hash,
+        "page": page_idx,
+        "dpi": dpi,
+        "layout": {k: v for k, v in LAYOUT_SETTINGS.items() if k != "device"},
+        "class": TABLE_CLASS,
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+def table_regions_from_layout(res):
+    """Table boxes of one layout result, sorted top to bottom, left to right."""
+    d_sorted = sorted(res.summary(), key=lambda x: (x['box']['y1'], x['box']['x1']))
+    return [
+        {k: float(v) for k, v in det["box"].items()}
+        for det in d_sorted
+        if det['class'] == TABLE_CLASS
+    ]
+
+def detect_table_regions_for_key_hits(filtered_keys, ocr_key_hit, value_matched, images, layout_cache=None, pdf_hash=None):
     """
     Given a list of OCR key hits and value-matched attributes, detect layout tables
-    on the relevant pages and return table bounding boxes grouped by relative page index.
+    on the pages that contain hits and return table bounding boxes grouped by
+    relative page index.
 
     Args:
         ocr_key_hit (list): List of key-hit dicts from find_key_hits_from_ocr.
         value_matched (dict): Attributes that passed value-presence check.
-        layout_model: Layout detection model (e.g., YOLO).
-        images (list): Full list of PDF page images.
+        images: Indexable page images (PdfPageSource or list); only pages with
+            hits are fetched, LAYOUT_PAGE_CHUNK at a time.
+        layout_cache / pdf_hash: look table regions up in the on-disk cache,
+            so YOLO only runs on pages not seen before with these settings
 
     Returns:
         dict: {relative_page_index (int): [table_bbox1, table_bbox2, ...]}
     """
-    # Find which pages contain these hits
     if not filtered_keys:
         return {}
 
-    # Find which pages contain these hits
-    page_indices = {item["ocr_result_index"] for item in filtered_keys}
-    min_page = min(page_indices)
-    max_page = max(page_indices)
-
-    logging.info(f"  → Detecting layout on pages {min_page + 1} to {max_page + 1} (0-indexed: {min_page}-{max_page})...")
-
-    # Run layout detection only on relevant pages
-    image_subset = images[min_page : max_page + 1]
-    layout_results = layout_detect(image_subset)
-
-    regions_by_page = {}
-    for i, res in enumerate(layout_results):
-        d = res.summary()
-        d_sorted = sorted(d, key=lambda x: (x['box']['y1'], x['box']['x1']))
+    # Only the distinct pages that contain these hits
+    page_indices = sorted({item["ocr_result_index"] for item in filtered_keys})
+    dpi = getattr(images, "dpi", RENDER_DPI)
+    use_cache = layout_cache is not None and pdf_hash is not None
+
+    tables_by_page = {}
+    to_detect = []
+    for page_idx in page_indices:
+        payload = layout_cache.get(layout_cache_key(pdf_hash, page_idx, dpi)) if use_cache else None
+        if payload is not None:
+            tables_by_page[page_idx] = json.loads(payload)
+        else:
+            to_detect.append(page_idx)
+
+    logging.info(
+        f"  → Detecting layout on {len(to_detect)} of {len(page_indices)} page(s) with hits "
+        f"({len(page_indices) - len(to_detect)} cached): {[p + 1 for p in to_detect]}"
+    )
 
-        page_tables = []
-        for det in d_sorted:
-            if det['class'] == 5:  # "Table" class
-                bbox = det["box"]
-                page_tables.append(bbox)
+    # Run layout detection on the remaining pages, a chunk at a time
+    for chunk_start in range(0, len(to_detect), LAYOUT_PAGE_CHUNK):
+        chunk = to_detect[chunk_start:chunk_start + LAYOUT_PAGE_CHUNK]
+        layout_results = detect_layout_pages([images[page_idx] for page_idx in chunk])
 
-        if page_tables:
-            # Map back to original page index
-            original_page_idx = min_page + i
-            regions_by_page[original_page_idx] = page_tables
+        for page_idx, res in zip(chunk, layout_results):
+            page_tables = table_regions_from_layout(res)
+            tables_by_page[page_idx] = page_tables
+            if use_cache:
+                layout_cache.put(layout_cache_key(pdf_hash, page_idx, dpi), json.dumps(page_tables).encode("utf-8"))
 
+    regions_by_page = {page_idx: tables for page_idx, tables in sorted(tables_by_page.items()) if tables}
     logging.debug(f"Detected tables on {len(regions_by_page)} page(s).")
     return regions_by_page
 
@@ -167,7 +235,7 @@ def extract_candidate_rows_for_keys(filtered_keys, ocr_results):
     Args:
         filtered_keys (list): List of filtered key-hit dicts from `filter_ocr_keys_by_regions`.
             Each must contain: 'key', 'bbox', 'ocr_result_index', and 'stop_y'.
-        ocr_results (list): Full OCR output per page (from `get_ocr_object_per_page`).
+        ocr_results (list): Full OCR output per page (OcrPage, from `get_ocr_results_with_text_layer`).
         
     Returns:
         tuple: 
@@ -176,6 +244,7 @@ def extract_candidate_rows_for_keys(filtered_keys, ocr_results):
     """
     pages = set()
     row_for_key_data = []
+    page_data = {}   # page -> (texts, OcrPage), decoded once per page
 
     logging.debug(f"Extracting candidate text rows for {len(filtered_keys)} filtered keys...")
 
@@ -183,12 +252,16 @@ def extract_candidate_rows_for_keys(filtered_keys, ocr_results):
         index = item["ocr_result_index"]
         pages.add(index)
 
-        page_ocr = ocr_results[index][0]
+        if index not in page_data:
+            page_ocr = ocr_results[index][0]
+            page_data[index] = (page_ocr.texts, page_ocr)
+        texts, page_ocr = page_data[index]
         results = get_text_under_key_to_page_end(
             key_poly=item["bbox"],
-            rec_texts=page_ocr["rec_texts"],
-            rec_polys=page_ocr["rec_polys"],
-            stop_y=item["stop_y"]
+            rec_texts=texts,
+            rec_polys=page_ocr.polys,
+            stop_y=item["stop_y"],
+            index=page_ocr.grid_index()
         )
         row_for_key_data.append({
             'key': item['key'],
@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+from batcher import InferenceBatcher
+
+
+def test_outputs_come_back_in_order_from_many_threads():
+    batcher = InferenceBatcher(lambda items: [i * 10 for i in items], batch_size=4, max_wait=0.01)
+    results = {}
+
+    def worker(start):
+        results[start] = batcher.map(range(start, start + 25))
+
+    threads = [threading.Thread(target=worker, args=(start,)) for start in range(0, 100, 25)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+    for start, outputs in results.items():
+        assert outputs == [i * 10 for i in range(start, start + 25)]
+    stats = batcher.stats()
+    assert stats["items"] == 100 and stats["batches"] >= 25
+
+
+def test_inputs_queued_during_a_batch_are_merged():
+    started, release = threading.Event(), threading.Event()
+    sizes = []
+
+    def predict(items):
+        sizes.append(len(items))
+        if len(sizes) == 1:
+            started.set()
+            release.wait(5)
+        return items
+
+    batcher = InferenceBatcher(predict, batch_size=8, max_wait=0.05)
+    first = batcher.submit(0)
+    started.wait(5)
+    rest = [batcher.submit(i) for i in range(1, 11)]    # queued while the first batch runs
+    release.set()
+    assert first.result() == 0 and [f.result() for f in rest] == list(range(1, 11))
+    batcher.close()
+    assert sizes == [1, 8, 2]
+
+
+def test_failures_reach_every_caller_in_the_batch():
+    batcher = InferenceBatcher(lambda items: items[:-1], batch_size=2, max_wait=0.5)
+    futures = [batcher.submit(i) for i in range(2)]
+    for f in futures:
+        with pytest.raises(RuntimeError, match="1 output"):
+            f.result()
+    batcher.close()
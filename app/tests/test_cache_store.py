@@ -0,0 +1,42 @@
+import itertools
+import types
+
+import cache_store
+from cache_store import LRUCacheStore
+
+
+def make_store(tmp_path, monkeypatch, max_bytes):
+    # A strictly increasing clock, so access order never ties
+    ticks = itertools.count()
+    monkeypatch.setattr(cache_store, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+    return LRUCacheStore(str(tmp_path / "sub" / "cache.sqlite"), max_bytes, name="test")
+
+
+def test_round_trip_and_stats(tmp_path, monkeypatch):
+    store = make_store(tmp_path, monkeypatch, 1000)
+    assert store.get("a") is None
+    store.put("a", b"\x00payload")
+    assert store.get("a") == b"\x00payload"
+    store.put("a", b"new")
+    assert store.get("a") == b"new"
+    assert store.stats() == {"hits": 2, "misses": 1, "entries": 1, "bytes": 3, "max_bytes": 1000}
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    store = make_store(tmp_path, monkeypatch, 30)
+    for key in "abc":
+        store.put(key, b"x" * 10)
+    store.get("a")                  # "b" is now the least recently used
+    store.put("d", b"x" * 10)
+    assert store.get("b") is None
+    assert all(store.get(key) is not None for key in "acd")
+    assert store.stats()["bytes"] == 30
+
+
+def test_entries_persist_across_stores(tmp_path, monkeypatch):
+    store = make_store(tmp_path, monkeypatch, 1000)
+    store.put("page", b"ocr")
+    store.close()
+    reopened = LRUCacheStore(store.path, 1000)
+    assert reopened.get("page") == b"ocr"
+    reopened.close()
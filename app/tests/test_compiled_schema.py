@@ -0,0 +1,63 @@
+import json
+import os
+
+import compiled_schema
+from cache_store import LRUCacheStore
+from compiled_schema import CompiledSchema, build_attribute_index, compile_schema_file, load_compiled_schema
+from input_handler import get_attribute_info_by_key
+
+SCHEMA = {
+    "Color Temperature": {"data_type": "str", "values": ["2700K", " 3000K "], "product_types": ["Downlight", "Troffer"]},
+    " color temperature": {"data_type": "str", "values": ["4000K"], "product_types": ["Pendant"]},
+    "CRI": {"data_type": "int", "values": [], "product_types": ["Downlight"]},
+}
+
+
+def write_schema(path, schema):
+    path.write_text(json.dumps(schema), encoding="utf-8")
+    return str(path)
+
+
+def test_attribute_info_matches_the_scan():
+    compiled = CompiledSchema(SCHEMA, "md5")
+    index = build_attribute_index(SCHEMA)
+    for key in ["Color Temperature", "COLOR TEMPERATURE ", "cri", "Wattage", ""]:
+        expected = get_attribute_info_by_key(key, SCHEMA)
+        assert compiled.attribute_info(key) == expected
+        assert get_attribute_info_by_key(key, SCHEMA, index) == expected
+    assert compiled.attribute_info("color temperature")["values"] == ["2700k", "3000k"]
+
+
+def test_product_type_masks():
+    compiled = CompiledSchema(SCHEMA, "md5")
+    assert compiled.product_types == ["Downlight", "Pendant", "Troffer"]
+    downlight = compiled.product_type_bits["Downlight"]
+    assert compiled.attribute_masks["CRI"] == downlight
+    assert compiled.product_type_mask(["Downlight", "Troffer", "Unknown"]) == compiled.attribute_masks["Color Temperature"]
+
+
+def test_cache_follows_file_content(tmp_path):
+    cache = LRUCacheStore(str(tmp_path / "schema.sqlite"), 1 << 20)
+    path = write_schema(tmp_path / "schema.json", SCHEMA)
+    first = compile_schema_file(path, cache)
+    again = compile_schema_file(path, cache)
+    assert cache.hits == 1
+    assert again.content_hash == first.content_hash and again.key_index == first.key_index
+
+    changed = dict(SCHEMA, Wattage={"data_type": "int", "values": ["12"], "product_types": ["Troffer"]})
+    write_schema(tmp_path / "schema.json", changed)
+    updated = compile_schema_file(path, cache)
+    assert updated.content_hash != first.content_hash
+    assert updated.attribute_info("wattage")["values"] == ["12"]
+
+
+def test_load_compiled_schema_reloads_a_changed_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(compiled_schema, "_compiled", {})
+    path = write_schema(tmp_path / "schema.json", SCHEMA)
+    first = load_compiled_schema(path, use_cache=False)
+    assert load_compiled_schema(path, use_cache=False) is first
+
+    write_schema(tmp_path / "schema.json", {"CRI": SCHEMA["CRI"]})
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert len(load_compiled_schema(path, use_cache=False)) == 1
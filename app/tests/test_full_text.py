@@ -0,0 +1,50 @@
+from full_text import FullText, PAGE_SEPARATOR, folded, lowered
+from ocr_page import OcrPage
+
+PAGES = [
+    ["Color Temperature", "2700K"],
+    [],
+    ["CRI", "", "90+"],
+    ["İP65 Rated"],
+]
+
+
+def make_text():
+    results = [[OcrPage.from_lists(texts, [[[0, 0]] * 4] * len(texts))] for texts in PAGES]
+    results.insert(2, [])                       # a page without any result
+    return FullText.from_ocr_results(results)
+
+
+def test_text_is_lowercased_boxes_and_pages():
+    text = make_text()
+    assert str(text) == PAGE_SEPARATOR.join([
+        "color temperature 2700k", "", "", "cri  90+", "ip65 rated",      # same length as "İP65 Rated"
+    ])
+    assert lowered(text) is text
+
+
+def test_locate_every_character():
+    text = make_text()
+    page_indices = [0, 1, 3, 4]                # page 2 has no result
+    expected = [
+        (page_idx, line_idx, box)
+        for page_idx, texts in zip(page_indices, PAGES)
+        for line_idx, box in enumerate(texts)
+    ]
+    assert len(text.line_starts) == len(expected)
+    for (page_idx, line_idx, box), start in zip(expected, text.line_starts):
+        assert text[start:start + len(box)] == lowered(box)
+        for offset in range(start, start + len(box)):
+            assert text.locate(offset) == (page_idx, line_idx)
+    # a separator belongs to the box before it
+    end_of_first = text.line_starts[0] + len(PAGES[0][0])
+    assert text.locate(end_of_first) == (0, 0)
+    assert FullText("abc").locate(0) is None
+
+
+def test_locate_span_and_folding():
+    text = make_text()
+    start = text.index("temperature")
+    assert text.locate_span(start, start + len("temperature 27")) == [(0, 0), (0, 1)]
+    assert text.locate_span(text.index("cri"), text.index("cri") + 3) == [(3, 0)]
+    assert folded(text) == folded(str(text)) and len(folded(text)) == len(text)
@@ -0,0 +1,64 @@
+import pytest
+
+for module in ("paddleocr", "llama_cpp", "doclayout_yolo", "huggingface_hub"):
+    pytest.importorskip(module)
+
+import generate_mouting
+from cache_store import LRUCacheStore
+
+
+@pytest.fixture
+def llm(monkeypatch, tmp_path):
+    """Scripted completions and an empty LLM cache for generate_mouting."""
+    replies, requests = [], []
+    cache = LRUCacheStore(str(tmp_path / "llm.sqlite"), 1 << 20, name="llm_cache")
+
+    def chat_completion(instance, messages, **params):
+        requests.append(params)
+        content, finish_reason = replies.pop(0)
+        return {
+            "choices": [{"message": {"content": content}, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+        }
+
+    monkeypatch.setattr(generate_mouting, "chat_completion", chat_completion)
+    monkeypatch.setattr(generate_mouting, "get_llm_instance", lambda use_gpu: None)
+    monkeypatch.setattr(generate_mouting, "get_llm_model_path", lambda use_gpu: "model.gguf")
+    monkeypatch.setattr(generate_mouting, "model_file_hash", lambda path, cache: "weights")
+    monkeypatch.setattr(generate_mouting, "get_llm_cache", lambda: cache)
+    return replies, cache, requests
+
+
+def test_truncated_response_is_not_cached(llm):
+    replies, cache, _ = llm
+    replies += [('{"Troffer": "rec', "length"), ('{"Troffer": "recessed"}', "stop")]
+    assert generate_mouting.generate_llm_response("p") == '{"Troffer": "rec'
+    assert cache.stats()["entries"] == 0
+    assert generate_mouting.generate_llm_response("p") == '{"Troffer": "recessed"}'
+    assert generate_mouting.generate_llm_response("p") == '{"Troffer": "recessed"}'
+    assert replies == []
+
+
+def test_only_parsed_json_is_cached(llm):
+    replies, cache, _ = llm
+    replies += [("not json", "stop"), ('<think>hm</think>{"Troffer": "recessed"}', "stop")]
+    assert generate_mouting.get_valid_json("p") == {"Troffer": "recessed"}
+    assert cache.stats()["entries"] == 1
+    # served from the cache, not the scripted replies (which are used up)
+    assert generate_mouting.get_valid_json("p") == {"Troffer": "recessed"}
+
+
+def test_response_schema_constrains_sampling_and_keys_the_cache(llm):
+    replies, cache, requests = llm
+    schema = generate_mouting.mounting_response_schema({"Troffer", "Pendant"})
+    assert schema["required"] == ["Pendant", "Troffer"]
+    # the prompt allows a list of mounting words per product type
+    assert schema["properties"]["Pendant"]["anyOf"][1] == {"type": "array", "items": {"type": "string"}}
+    replies += [('{"Troffer": "recessed", "Pendant": ["cable", "suspended"]}', "stop"), ('{"Troffer": "recessed"}', "stop")]
+
+    assert generate_mouting.get_valid_json("p", response_schema=schema)["Pendant"] == ["cable", "suspended"]
+    assert requests[0]["response_format"] == {"type": "json_object", "schema": schema}
+    # the same prompt without the schema is a different completion
+    assert generate_mouting.get_valid_json("p") == {"Troffer": "recessed"}
+    assert "response_format" not in requests[1]
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,28 @@
+from cache_store import LRUCacheStore
+from generate_regex import regex_response_schema, attribute_guidance_key, get_cached_attribute_guidance, put_cached_attribute_guidance
+
+CCT = {"data_type": "str", "formatting": "e.g. 2700K", "values": ["2700K", "3000K"], "product_types": ["Downlight"]}
+
+
+def test_guidance_key_follows_what_the_prompt_shows():
+    key = attribute_guidance_key("CCT", CCT)
+    # data_type and product_types are not in the prompt
+    assert attribute_guidance_key("CCT", dict(CCT, data_type="int", product_types=["Pendant"])) == key
+    assert attribute_guidance_key("CCT", dict(CCT, values=["2700K"])) != key
+    assert attribute_guidance_key("CCT", dict(CCT, formatting="e.g. 3000 K")) != key
+    assert attribute_guidance_key("Color Temperature", CCT) != key
+
+
+def test_guidance_round_trip(tmp_path):
+    cache = LRUCacheStore(str(tmp_path / "guidance.sqlite"), 1 << 20)
+    assert get_cached_attribute_guidance(cache, "CCT", CCT) is None
+    put_cached_attribute_guidance(cache, "CCT", CCT, {"pair_regex": r"(\d{4})\s*K"})
+    assert get_cached_attribute_guidance(cache, "CCT", dict(CCT, product_types=[])) == {"pair_regex": r"(\d{4})\s*K"}
+
+
+def test_regex_response_schema_requires_every_attribute():
+    schema = regex_response_schema(["CCT", "CRI"])
+    assert schema["required"] == ["CCT", "CRI"] and schema["additionalProperties"] is False
+    entry = schema["properties"]["CCT"]
+    assert entry["required"] == ["pair_regex"] and entry["additionalProperties"] is False
+    assert {"type": "null"} in entry["properties"]["pair_regex"]["anyOf"]
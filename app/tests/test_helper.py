@@ -0,0 +1,36 @@
+import random
+
+from helper import (
+    generate_ocr_variants, lower_preserving_length, ocr_char_options, ocr_fold, ocr_fold_term, ocr_match_at,
+)
+
+ALPHABET = "0125689ilosbgqzk wKW/-.IOSBGZ"
+
+
+def test_variants_fold_to_the_term():
+    for term in ["109", "2700K", "Wall Mount", "IP65", "5000 lm"]:
+        folded = ocr_fold_term(term)
+        for variant in generate_ocr_variants(term):
+            assert ocr_fold(variant) == folded
+
+
+def test_match_at_equals_variant_expansion():
+    rng = random.Random(12)
+    for _ in range(400):
+        term = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 5)))
+        text = lower_preserving_length("".join(rng.choice(ALPHABET) for _ in range(40)))
+        variants = generate_ocr_variants(term)
+        options = ocr_char_options(term)
+        folded_term, folded_text = ocr_fold_term(term), ocr_fold(text)
+        for start in range(len(text)):
+            expected = any(text.startswith(v, start) for v in variants)
+            assert ocr_match_at(options, text, start) == expected, (term, text, start)
+            if expected:
+                # folding finds every real match as a candidate
+                assert folded_text.startswith(folded_term, start)
+
+
+def test_lower_preserving_length():
+    assert lower_preserving_length("2700K Wall") == "2700k wall"
+    text = "İP65 rated"
+    assert len(lower_preserving_length(text)) == len(text)
@@ -0,0 +1,50 @@
+import os
+
+import llm_cache
+from cache_store import LRUCacheStore
+from llm_cache import get_cached_response, llm_cache_key, model_file_hash, put_cached_response
+
+MESSAGES = [{"role": "system", "content": "JSON only"}, {"role": "user", "content": "Mounting for Troffer?"}]
+PARAMS = {"temperature": 0.0, "max_tokens": 512}
+
+
+def test_key_covers_model_messages_and_params():
+    base = llm_cache_key("weights", MESSAGES, PARAMS)
+    assert base == llm_cache_key("weights", [dict(m) for m in MESSAGES], dict(reversed(list(PARAMS.items()))))
+    variants = [
+        llm_cache_key("other weights", MESSAGES, PARAMS),
+        llm_cache_key("weights", MESSAGES[1:], PARAMS),
+        llm_cache_key("weights", MESSAGES[:1] + [{"role": "user", "content": "Mounting for Pendant?"}], PARAMS),
+        llm_cache_key("weights", MESSAGES, dict(PARAMS, temperature=0.7)),
+        llm_cache_key("weights", MESSAGES, dict(PARAMS, response_format={"type": "json_object"})),
+    ]
+    assert len({base, *variants}) == 6
+
+
+def test_response_round_trip(tmp_path):
+    cache = LRUCacheStore(str(tmp_path / "llm.sqlite"), 1 << 20)
+    key = llm_cache_key("weights", MESSAGES, PARAMS)
+    assert get_cached_response(cache, key) is None
+    put_cached_response(cache, key, '{"Troffer": "récessed"}', {"prompt_tokens": 12})
+    assert get_cached_response(cache, key) == '{"Troffer": "récessed"}'
+    cache.put(key, b"not json")
+    assert get_cached_response(cache, key) is None
+
+
+def test_model_hash_follows_file_content(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_model_hashes", {})
+    cache = LRUCacheStore(str(tmp_path / "llm.sqlite"), 1 << 20)
+    path = tmp_path / "model.gguf"
+    path.write_bytes(b"weights v1")
+    first = model_file_hash(str(path), cache)
+
+    monkeypatch.setattr(llm_cache, "_model_hashes", {})    # a later run: from the store, not re-hashed
+    monkeypatch.setattr(llm_cache, "file_sha256", lambda p: "should not be called")
+    assert model_file_hash(str(path), cache) == first
+
+    monkeypatch.undo()
+    monkeypatch.setattr(llm_cache, "_model_hashes", {})
+    path.write_bytes(b"weights v2")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert model_file_hash(str(path), cache) != first
@@ -0,0 +1,34 @@
+import random
+import re
+
+from matcher import KeyTokenIndex
+
+
+def legacy_keys_in_line(keys, txt):
+    """The per-line loop of find_key_hits_from_ocr before KeyTokenIndex."""
+    normalized_key_map = {tuple(re.findall(r"\b\w+\b", key.lower())): key for key in keys}
+    words = re.findall(r"\b\w+\b", txt.lower())
+    found = []
+    for key_words, orig_key in normalized_key_map.items():
+        key_len = len(key_words)
+        for i in range(len(words) - key_len + 1):
+            if tuple(words[i:i + key_len]) == key_words:
+                found.append(orig_key)
+                break
+    return found
+
+
+def test_key_token_index_matches_sliding_windows():
+    rng = random.Random(14)
+    vocab = ["color", "temp", "cct", "cri", "lumens", "input", "voltage", "ip", "65", "Temp"]
+    for _ in range(300):
+        keys = [
+            rng.choice(["", "-", "/"]).join(rng.choice(vocab) for _ in range(rng.randint(1, 3)))
+            for _ in range(rng.randint(1, 10))
+        ]
+        if rng.random() < 0.05:
+            keys.append("--")                   # no words at all
+        index = KeyTokenIndex(keys)
+        for _ in range(5):
+            line = rng.choice([" ", ": ", " / "]).join(rng.choice(vocab) for _ in range(rng.randint(0, 8)))
+            assert index.find(line) == legacy_keys_in_line(keys, line), (keys, line)
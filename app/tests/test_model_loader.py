@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+for module in ("paddleocr", "llama_cpp", "doclayout_yolo", "huggingface_hub"):
+    pytest.importorskip(module)
+
+from llama_cpp.llama import LlamaState
+from model_loader import PrefixStateCache
+
+
+def state(n_tokens, vocab=1000):
+    return LlamaState(
+        input_ids=np.zeros(n_tokens, dtype=np.intc),
+        scores=np.zeros((n_tokens, vocab), dtype=np.single),
+        n_tokens=n_tokens,
+        llama_state=b"",
+        llama_state_size=1000,
+        seed=0,
+    )
+
+
+def test_prefix_cache_counts_logits_copies():
+    cache = PrefixStateCache(capacity_bytes=100_000)
+    cache[(1, 2)] = state(2)        # 1000 + 8000 + 8 bytes
+    assert cache.cache_size == 9008
+    for n in range(3, 30):
+        cache[tuple(range(n))] = state(10)
+    # the 1000-byte state buffers alone would all fit; with the logits only 2 do
+    assert len(cache.cache_state) == 2
+    assert cache.cache_size <= 100_000
@@ -0,0 +1,76 @@
+import sys
+import threading
+import types
+from multiprocessing import Pipe
+
+import numpy as np
+from PIL import Image
+
+from model_server import ModelServer, shared_images, read_shared_images, _as_bgr
+
+
+def test_shared_images_round_trip():
+    page = np.arange(30 * 20 * 3, dtype=np.uint8).reshape(30, 20, 3)
+    images = [page, page[:, ::-1], np.ones((3, 4), dtype=np.float32)]
+    with shared_images(images) as descriptor:
+        copies = read_shared_images(descriptor)
+    for original, copy in zip(images, copies):
+        assert copy.dtype == original.dtype
+        np.testing.assert_array_equal(copy, original)
+
+
+def test_pil_pages_are_sent_as_bgr():
+    img = Image.new("RGB", (2, 1), (10, 20, 30))
+    assert _as_bgr(img)[0, 0].tolist() == [30, 20, 10]
+
+
+class FakeLayout:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, images, **kwargs):
+        self.calls.append(kwargs)
+        return [types.SimpleNamespace(summary=lambda: {"boxes": []}) for _ in images]
+
+
+def bare_server():
+    server = object.__new__(ModelServer)
+    server._ocr_lock = threading.Lock()
+    server._layout_lock = threading.Lock()
+    server.requests = {}
+    server._requests_lock = threading.Lock()
+    server.layout = FakeLayout()
+    return server
+
+
+def test_layout_predict_keeps_explicit_zero(monkeypatch):
+    settings = {"imgsz": 1024, "conf": 0.2, "device": "cpu"}
+    monkeypatch.setitem(sys.modules, "model_loader", types.SimpleNamespace(LAYOUT_SETTINGS=settings))
+    server = bare_server()
+    with shared_images([np.zeros((4, 4, 3), dtype=np.uint8)]) as descriptor:
+        server.layout_predict(descriptor, conf=0)
+        server.layout_predict(descriptor)
+    assert server.layout.calls[0] == {"verbose": False, "imgsz": 1024, "conf": 0, "device": "cpu"}
+    assert server.layout.calls[1]["conf"] == 0.2
+
+
+def test_request_counts_from_concurrent_connections():
+    server = bare_server()
+    server.ping = lambda: "pong"
+    clients, threads = [], []
+    for _ in range(8):
+        ours, theirs = Pipe()
+        clients.append(ours)
+        threads.append(threading.Thread(target=server.handle, args=(theirs,)))
+    for t in threads:
+        t.start()
+    for _ in range(200):
+        for conn in clients:
+            conn.send(("ping", (), {}))
+        for conn in clients:
+            assert conn.recv() == ("ok", "pong")
+    for conn in clients:
+        conn.close()
+    for t in threads:
+        t.join()
+    assert server.request_counts() == {"ping": 1600}
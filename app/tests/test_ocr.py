@@ -0,0 +1,152 @@
+import types
+
+import fitz
+import numpy as np
+import pytest
+
+for module in ("paddleocr", "llama_cpp", "doclayout_yolo", "huggingface_hub"):
+    pytest.importorskip(module)
+
+from input_handler import PdfPageSource
+import ocr as ocr_module
+from cache_store import LRUCacheStore
+from config import MULTIRES_LAYOUT_DPI, MULTIRES_REGION_PAD_PT
+from ocr import (
+    extract_text_layer_page, is_usable_text_layer, get_ocr_results_with_text_layer, ocr_cache_key,
+    get_ocr_object_multires, merge_rects,
+)
+from ocr_page import OcrPage
+
+SPEC_LINES = [
+    "Wattage", "12 W",
+    "Color Temperature", "2700K / 3000K / 4000K",
+    "CRI", "90+ minimum across all listed color temperatures",
+]
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    """A born-digital spec table on page 0, an empty (scanned-like) page 1."""
+    path = tmp_path / "spec.pdf"
+    with fitz.open() as doc:
+        page = doc.new_page(width=400, height=200)
+        for row in range(3):
+            y = 40 + 30 * row
+            page.insert_text((20, y), SPEC_LINES[2 * row], fontsize=11)
+            page.insert_text((160, y), SPEC_LINES[2 * row + 1], fontsize=11)
+        doc.new_page(width=400, height=200)
+        doc.save(path)
+    return str(path)
+
+
+class FakeOcr:
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, image):
+        self.calls += 1
+        return [{"rec_texts": ["scanned"], "rec_polys": [np.zeros((4, 2))], "rec_scores": [0.5]}]
+
+
+def test_text_layer_splits_table_cells(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        page_1x = extract_text_layer_page(doc[0], dpi=72)
+        page_2x = extract_text_layer_page(doc[0], dpi=144)
+    assert page_1x.texts == SPEC_LINES
+    assert np.allclose(page_1x.scores, 1.0)
+    # polygons are in pixels of the rendering at `dpi`
+    assert abs(page_1x.polys[0][0][0] - 20) <= 1
+    assert np.abs(page_2x.polys - 2 * page_1x.polys).max() <= 1
+
+
+def test_text_layer_follows_page_rotation(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        page = doc[0]
+        page.set_rotation(90)
+        result = extract_text_layer_page(page, dpi=72)
+        width, height = page.rect.width, page.rect.height      # rotated: 200 x 400
+    assert result.texts == SPEC_LINES
+    assert (result.polys[..., 0] >= 0).all() and (result.polys[..., 0] <= width).all()
+    assert (result.polys[..., 1] >= 0).all() and (result.polys[..., 1] <= height).all()
+
+
+def test_is_usable_text_layer():
+    poly = np.zeros((4, 2))
+    assert is_usable_text_layer(OcrPage.from_lists(SPEC_LINES, [poly] * len(SPEC_LINES)))
+    assert not is_usable_text_layer(OcrPage.from_lists(["12 W"], [poly]))
+    garbled = "�" * 20 + "x" * 40
+    assert not is_usable_text_layer(OcrPage.from_lists([garbled], [poly]))
+
+
+def test_only_pages_without_a_text_layer_are_ocrd(pdf_path):
+    ocr = FakeOcr()
+    with PdfPageSource(pdf_path, dpi=72) as pages:
+        results, report = get_ocr_results_with_text_layer(pages, ocr)
+    assert [r["source"] for r in report] == ["text_layer", "ocr"]
+    assert ocr.calls == 1
+    assert results[0][0].texts == SPEC_LINES
+    assert results[1][0].texts == ["scanned"]
+
+    with PdfPageSource(pdf_path, dpi=72) as pages:
+        _, report = get_ocr_results_with_text_layer(pages, ocr, use_text_layer=False)
+    assert [r["source"] for r in report] == ["ocr", "ocr"]
+
+
+def test_ocr_cache_key_covers_what_changes_the_result():
+    base = ocr_cache_key("pdf", 0)
+    assert base == ocr_cache_key("pdf", 0)
+    variants = [
+        ocr_cache_key("other pdf", 0),
+        ocr_cache_key("pdf", 1),
+        ocr_cache_key("pdf", 0, dpi=150),
+        ocr_cache_key("pdf", 0, mode="multires"),
+    ]
+    assert len({base, *variants}) == 5
+
+
+def test_cached_pages_are_not_rendered_or_ocrd(pdf_path, tmp_path):
+    ocr = FakeOcr()
+    cache = LRUCacheStore(str(tmp_path / "ocr.sqlite"), 1 << 20)
+    for _ in range(2):
+        with PdfPageSource(pdf_path, dpi=72) as pages:
+            results, _ = get_ocr_results_with_text_layer(pages, ocr, ocr_cache=cache, pdf_hash="h")
+            rendered = len(pages._cache)
+    assert ocr.calls == 1
+    assert rendered == 0                # second run: page 1 came from the cache
+    assert results[1][0].texts == ["scanned"]
+
+
+def test_merge_rects_unions_overlaps_transitively():
+    merged = merge_rects([(0, 0, 10, 10), (30, 0, 40, 10), (9, 0, 31, 5), (100, 100, 110, 110)], pad=1)
+    assert sorted(tuple(r) for r in merged) == [(-1, -1, 41, 11), (99, 99, 111, 111)]
+
+
+def test_multires_ocrs_merged_regions_in_page_pixels(pdf_path, tmp_path, monkeypatch):
+    to_px = MULTIRES_LAYOUT_DPI / 72
+
+    def box(x1, y1, x2, y2, cls=1):
+        return {"class": cls, "box": {"x1": x1 * to_px, "y1": y1 * to_px, "x2": x2 * to_px, "y2": y2 * to_px}}
+
+    detections = [box(20, 30, 120, 60), box(110, 50, 200, 80), box(250, 120, 380, 180, cls=3), box(20, 150, 60, 170)]
+    layout_calls = []
+
+    def detect_layout_pages(images):
+        layout_calls.append(len(images))
+        return [types.SimpleNamespace(summary=lambda: detections) for _ in images]
+
+    class RegionOcr:
+        def predict(self, image):
+            return [{"rec_texts": ["region"], "rec_polys": [np.array([[0, 0], [10, 0], [10, 10], [0, 10]])], "rec_scores": [0.9]}]
+
+    monkeypatch.setattr(ocr_module, "detect_layout_pages", detect_layout_pages)
+    cache = LRUCacheStore(str(tmp_path / "ocr.sqlite"), 1 << 20)
+    with PdfPageSource(pdf_path, dpi=144) as pages:
+        page = get_ocr_object_multires(pages, [1], RegionOcr(), ocr_cache=cache, pdf_hash="h")[0]
+        assert get_ocr_object_multires(pages, [1], RegionOcr(), ocr_cache=cache, pdf_hash="h")[0].texts == page.texts
+    assert layout_calls == [1]                  # the second call came from the cache
+    # the two overlapping regions are OCR'd as one, the figure is skipped
+    assert page.texts == ["region", "region"]
+    origins = page.polys[:, 0].tolist()
+    pad = MULTIRES_REGION_PAD_PT
+    assert origins[0] == pytest.approx([(20 - pad) * 2, (30 - pad) * 2], abs=2)
+    assert origins[1] == pytest.approx([(20 - pad) * 2, (150 - pad) * 2], abs=2)
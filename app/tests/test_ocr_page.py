@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from ocr_page import OcrPage
+
+TEXTS = ["Color Temperature", "2700K – 5000K", "", "Ø 120 mm", "IP65"]
+
+
+def make_page():
+    polys = [np.array([[i, 2 * i], [i + 30, 2 * i], [i + 30, 2 * i + 8], [i, 2 * i + 8]]) for i in range(5)]
+    polys[3] = np.array([[1, 1], [9, 2], [5, 7]])          # not a quad: kept as its bounding rectangle
+    return OcrPage.from_lists(TEXTS, polys, [0.9, 0.8, 0.7, 0.6, 0.5])
+
+
+def test_reads_like_a_paddleocr_page():
+    page = make_page()
+    assert len(page) == 5
+    assert page["rec_texts"] == TEXTS and page.texts == TEXTS
+    assert page.text_at(3) == "Ø 120 mm"
+    assert page["rec_polys"].shape == (5, 4, 2)
+    assert page["rec_polys"][3].tolist() == [[1, 1], [9, 1], [9, 7], [1, 7]]
+    assert page.bboxes[3].tolist() == [1, 1, 9, 7]
+    assert page.get("rec_scores")[0] == pytest.approx(0.9)
+    assert page.get("input_img") is None and "rec_texts" in page
+    with pytest.raises(KeyError):
+        page["dt_polys"]
+
+
+def test_bytes_round_trip():
+    page = make_page()
+    copy = OcrPage.from_bytes(page.to_bytes())
+    assert copy.texts == TEXTS
+    assert np.array_equal(copy.polys, page.polys) and copy.polys.dtype == np.int32
+    assert np.array_equal(copy.scores, page.scores)
+    assert np.array_equal(copy.bboxes, page.bboxes)
+
+
+def test_empty_page_round_trip():
+    page = OcrPage.from_bytes(OcrPage.empty().to_bytes())
+    assert len(page) == 0 and page.texts == [] and page.polys.shape == (0, 4, 2)
+    assert page.grid_index().below((0, 0, 10, 0), 100).tolist() == []
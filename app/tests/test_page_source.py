@@ -0,0 +1,66 @@
+import fitz
+import numpy as np
+import pytest
+from PIL import Image
+from input_handler import PdfPageSource, pixmap_to_ndarray
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    """Three pages with red and blue text, so channel order is visible."""
+    path = tmp_path / "sample.pdf"
+    with fitz.open() as doc:
+        for i in range(3):
+            page = doc.new_page(width=200, height=100)
+            page.insert_text((20, 40), f"Wattage {i + 1}0 W", fontsize=14, color=(1, 0, 0))
+            page.draw_rect(fitz.Rect(120, 60, 180, 90), color=(0, 0, 1), fill=(0, 0, 1))
+        doc.save(path)
+    return str(path)
+
+
+def test_pixmap_to_ndarray_is_a_contiguous_bgr_copy(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        pixmap = doc.load_page(0).get_pixmap(dpi=72)
+        rgb = np.asarray(Image.frombytes("RGB", [pixmap.width, pixmap.height], pixmap.samples))
+        bgr = pixmap_to_ndarray(pixmap, "BGR")
+        assert bgr.flags.c_contiguous and bgr.flags.owndata
+        assert np.array_equal(bgr, rgb[:, :, ::-1])
+        assert np.array_equal(pixmap_to_ndarray(pixmap, "RGB"), rgb)
+        with pytest.raises(ValueError):
+            pixmap_to_ndarray(pixmap, "HSV")
+
+
+def test_pages_render_lazily_with_a_bounded_cache(pdf_path):
+    with PdfPageSource(pdf_path, dpi=72, cache_size=2) as pages:
+        assert len(pages) == 3
+        assert len(pages._cache) == 0
+        first = pages[0]
+        assert first.shape == (100, 200, 3)
+        assert pages[0] is first                    # served from the cache
+        pages[1], pages[2]
+        assert list(pages._cache) == [1, 2]          # page 0 evicted
+        assert pages[-1] is pages[2]
+        with pytest.raises(IndexError):
+            pages[3]
+
+
+def test_render_clip_reports_pixel_origin(pdf_path):
+    with PdfPageSource(pdf_path, dpi=144) as pages:
+        full = pages[0]
+        crop, (x0, y0) = pages.render(0, clip=fitz.Rect(120, 60, 180, 90))
+        assert (x0, y0) == (240, 120)
+        assert np.array_equal(crop, full[y0:y0 + crop.shape[0], x0:x0 + crop.shape[1]])
+
+
+def test_concurrent_rendering_of_several_documents(pdf_path):
+    from concurrent.futures import ThreadPoolExecutor
+    with PdfPageSource(pdf_path, dpi=72) as pages:
+        expected = [pages.render(i)[0] for i in range(3)]
+
+    def render_all(_):
+        with PdfPageSource(pdf_path, dpi=72, cache_size=0) as pages:
+            return [pages[i] for i in range(len(pages))]
+
+    with ThreadPoolExecutor(4) as pool:
+        for rendered in pool.map(render_all, range(16)):
+            assert all(np.array_equal(a, b) for a, b in zip(rendered, expected))
@@ -0,0 +1,115 @@
+import re
+import time
+import random
+import pytest
+import regex
+import pair_regex
+from pair_regex import PairRegex, RegexGuidance, compile_pair_regex, cached_pair_regex, complexity_issue, required_literal, sre_parse
+
+
+def parse(source):
+    return sre_parse.parse(source, re.IGNORECASE)
+
+
+@pytest.mark.parametrize("source, reason", [
+    ("(a|aa)*b", "ambiguous alternation"),
+    ("(?:ab|a)+c", "ambiguous alternation"),
+    ("(\\w+\\s*)+:", "nested unbounded repeat"),
+    ("(a)\\1", "backreference"),
+    ("wattage[", "invalid regex"),
+    ("a" * 600, "longer than"),
+])
+def test_rejected_patterns(source, reason):
+    with pytest.raises(ValueError, match=reason):
+        compile_pair_regex(source)
+
+
+@pytest.mark.parametrize("source", [
+    "(?:kw|w)+",
+    "(?:\\d|,)+",
+    "\\bwattage\\b[\\s:-]+(\\d+(?:\\.\\d+)?\\s*(?:w|watts))",
+])
+def test_accepted_patterns(source):
+    assert complexity_issue(parse(source)) is None
+    compile_pair_regex(source)
+
+
+def test_required_literal():
+    assert required_literal(parse("\\bWattage\\b[\\s:-]+\\S+")) == ("wattage", True)
+    assert required_literal(parse("\\d+\\s*lumens")) == ("lumens", False)
+    assert required_literal(parse("[0-9]+K CCT")) == ("k cct", False)
+    assert required_literal(parse("\\d+")) == ("", False)
+
+
+def test_findall_matches_re_findall():
+    rng = random.Random(19)
+    templates = [
+        "{key}[\\s:-]+\\S+",
+        "\\b{key}\\b\\s*:?\\s*(\\d+)",
+        "{key}\\s*(\\d+)\\s*(w|lm)",
+        "(\\d+)\\s*{key}",
+        "[a-z]+\\s{key}",
+    ]
+    keys = ["watt", "input watts", "cct", "lumens"]
+    vocabulary = ["watt", "Watts", "input", "INPUT WATTS", "cct", "CCT", "lumens", "12", "3000", "lm", "w", ":", "-", "  "]
+    for _ in range(500):
+        source = rng.choice(templates).format(key=re.escape(rng.choice(keys)))
+        text = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 30)))
+        matches, completed = cached_pair_regex(source).findall(text)
+        assert completed
+        assert matches == re.findall(source, text, re.IGNORECASE)
+
+
+def test_probe_timeout_rejects_slow_pattern(monkeypatch):
+    # Passes the structural check, but is polynomial of high degree on long word runs
+    source = "\\w*\\w*\\w*\\w*\\w*\\w*\\w*!"
+    assert complexity_issue(parse(source)) is None
+    monkeypatch.setattr(pair_regex, "PAIR_REGEX_TIME_BUDGET", 0.05)
+    start = time.perf_counter()
+    with pytest.raises(ValueError, match="probe"):
+        compile_pair_regex(source)
+    assert time.perf_counter() - start < 2
+
+
+def test_runtime_timeout_quarantines(monkeypatch):
+    monkeypatch.setattr(pair_regex, "PAIR_REGEX_TIME_BUDGET", 0.05)
+    guidance = RegexGuidance({})
+    source = "(a|aa)*b"     # would run for hours on the text below without a timeout
+    guidance.patterns["Finish"] = PairRegex(source, regex.compile(source, regex.IGNORECASE), "b", False)
+
+    start = time.perf_counter()
+    assert guidance.findall("Finish", "a" * 60 + " b") == []
+    assert time.perf_counter() - start < 2
+    assert guidance.get("Finish") is None
+    assert "Finish" in guidance.quarantined
+
+
+def test_scan_delayed_by_other_threads_is_not_quarantined(monkeypatch):
+    # A scan cut off by wall-clock time while this thread barely ran (GIL
+    # held elsewhere) keeps the pattern for later documents
+    monkeypatch.setattr(pair_regex, "PAIR_REGEX_TIME_BUDGET", 0.01)
+    monkeypatch.setattr(pair_regex.time, "thread_time", lambda: 0.0)
+    guidance = RegexGuidance({})
+    source = "(a|aa)*b"
+    guidance.patterns["Finish"] = PairRegex(source, regex.compile(source, regex.IGNORECASE), "b", False)
+    assert guidance.findall("Finish", "a" * 60 + " b") == []
+    assert guidance.get("Finish") is not None and guidance.quarantined == {}
+
+
+def test_budget_scales_with_text_length():
+    budget = pair_regex.PAIR_REGEX_TIME_BUDGET
+    assert pair_regex.pair_regex_budget(10) == budget
+    assert pair_regex.pair_regex_budget(3 * pair_regex.PAIR_REGEX_PROBE_CHARS) == pytest.approx(3 * budget)
+
+
+def test_guidance_quarantines_bad_entries():
+    guidance = RegexGuidance({
+        "Wattage": {"pair_regex": "\\bwattage\\b[\\s:-]+(\\d+)"},
+        "Finish": {"pair_regex": "(a|aa)*b"},
+        "Mounting": {"pair_regex": None},
+        "Broken": "not a dict",
+    })
+    assert set(guidance.patterns) == {"Wattage"}
+    assert set(guidance.quarantined) == {"Finish", "Broken"}
+    assert guidance.findall("Wattage", "Wattage: 12 W") == ["12"]
+
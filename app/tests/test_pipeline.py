@@ -0,0 +1,62 @@
+import threading
+import time
+
+from pipeline import Pipeline, Stage
+
+
+def test_every_item_passes_every_stage():
+    done, errors = [], []
+    lock = threading.Lock()
+
+    def record(item):
+        with lock:
+            done.append(item)
+
+    stages = [
+        Stage("render", lambda x: x + 1, workers=2),
+        Stage("ocr", lambda x: x * 10, workers=3),
+        Stage("match", lambda x: -x),
+    ]
+    pipeline = Pipeline(stages, on_done=record, on_error=lambda *a: errors.append(a)).start()
+    for i in range(50):
+        pipeline.submit(i)
+    pipeline.close()
+    assert sorted(done) == sorted(-(i + 1) * 10 for i in range(50))
+    assert errors == []
+    stats = pipeline.stats()
+    assert [stats[name]["items"] for name in ("render", "ocr", "match")] == [50, 50, 50]
+
+
+def test_a_failing_item_is_dropped_and_reported():
+    done, errors = [], []
+
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("broken page")
+        return x
+
+    pipeline = Pipeline(
+        [Stage("render", fail_on_three), Stage("match", lambda x: x)],
+        on_done=done.append,
+        on_error=lambda item, stage, exc: errors.append((item, stage, str(exc))),
+    ).start()
+    for i in range(6):
+        pipeline.submit(i)
+    pipeline.close()
+    assert done == [0, 1, 2, 4, 5]
+    assert errors == [(3, "render", "broken page")]
+    assert pipeline.stats()["render"]["errors"] == 1
+
+
+def test_stages_overlap():
+    # Two 50 ms stages over 4 items take ~250 ms pipelined, 400 ms in sequence
+    def slow(x):
+        time.sleep(0.05)
+        return x
+
+    pipeline = Pipeline([Stage("a", slow), Stage("b", slow)]).start()
+    start = time.perf_counter()
+    for i in range(4):
+        pipeline.submit(i)
+    pipeline.close()
+    assert time.perf_counter() - start < 0.35
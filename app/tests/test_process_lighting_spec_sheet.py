@@ -0,0 +1,30 @@
+import pytest
+
+for module in ("paddleocr", "llama_cpp", "doclayout_yolo", "huggingface_hub"):
+    pytest.importorskip(module)
+
+import process_lighting_spec_sheet as pls
+from cache_store import LRUCacheStore
+from pair_regex import RegexGuidance
+
+
+def test_regex_guidance_is_generated_once_per_schema(monkeypatch, tmp_path):
+    schema = {"CCT": {"formatting": "2700K"}, "CRI": {"formatting": "90"}}
+    cache = LRUCacheStore(str(tmp_path / "guidance.sqlite"), 1 << 20, name="regex_guidance")
+    asked = []
+
+    def generate_regex_guidance(missing, use_gpu):
+        asked.append(sorted(missing))
+        return {"CCT": {"pair_regex": r"(\d{4})\s*K"}, "CRI": {"pair_regex": "(a|aa)*b"}}
+
+    monkeypatch.setattr(pls, "get_regex_guidance_cache", lambda: cache)
+    monkeypatch.setattr(pls, "generate_regex_guidance", generate_regex_guidance)
+
+    first = pls.load_or_generate_regex_guidance(schema, None, str(tmp_path / "a"), schema_hash="s")
+    assert (tmp_path / "a" / "regex_guidance_s.json").exists()
+    # another output dir (e.g. a worker without the file) reads the per-attribute cache
+    second = pls.load_or_generate_regex_guidance(schema, None, str(tmp_path / "b"), schema_hash="s")
+    assert asked == [["CCT", "CRI"]]
+    assert second == first
+    # the rejected pattern is kept in the caches and quarantined on load
+    assert set(RegexGuidance(second).quarantined) == {"CRI"}
@@ -0,0 +1,26 @@
+import pytest
+
+from bench_schema_grouping import legacy_grouping, make_schema
+from generate_regex import group_schema_by_sentence_closeness
+
+
+def as_lists(groups):
+    return [list(group) for group in groups]
+
+
+@pytest.mark.parametrize("threshold", [0.0, 0.3, 0.5, 0.8, 1.0, 1.5])
+def test_grouping_matches_all_pairs(threshold):
+    schema = make_schema(60, seed=23)
+    assert as_lists(group_schema_by_sentence_closeness(schema, threshold)) == as_lists(legacy_grouping(schema, threshold))
+
+
+def test_duplicate_and_empty_sentences():
+    schema = make_schema(40, seed=5)
+    names = list(schema)
+    for name in names[::4]:
+        schema[name] = dict(schema[names[0]])               # identical sentences, scattered
+    for name in names[1::9]:
+        schema[name] = {"values": []}                       # no formatting sentence at all
+    groups = group_schema_by_sentence_closeness(schema)
+    assert as_lists(groups) == as_lists(legacy_grouping(schema))
+    assert sorted(name for group in groups for name in group) == sorted(names)
@@ -0,0 +1,73 @@
+import random
+
+import numpy as np
+import pytest
+
+from spatial_index import GridIndex, boxes_intersect, first_intersecting
+
+
+def random_boxes(rng, n, size=1000):
+    boxes = []
+    for _ in range(n):
+        x1, y1 = rng.randint(0, size), rng.randint(0, size)
+        boxes.append((x1, y1, x1 + rng.randint(0, 200), y1 + rng.randint(0, 40)))
+    return boxes
+
+
+def legacy_below(boxes, key_box, stop_y, min_overlap):
+    """The loop of get_text_under_key_to_page_end before GridIndex, as box ids."""
+    key_x1, _, key_x2, key_y2 = key_box
+    hits = []
+    for box_id, (x1, y1, x2, _) in enumerate(boxes):
+        if y1 <= key_y2 or y1 >= stop_y:
+            continue
+        overlap = max(0, min(key_x2, x2) - max(key_x1, x1))
+        if overlap / (key_x2 - key_x1) >= min_overlap:
+            hits.append((y1, box_id))
+    return [box_id for _, box_id in sorted(hits, key=lambda hit: hit[0])]
+
+
+def test_intersecting_matches_brute_force():
+    rng = random.Random(15)
+    for n in (0, 1, 5, 200):
+        boxes = random_boxes(rng, n)
+        index = GridIndex(np.array(boxes).reshape(-1, 4))
+        for rect in random_boxes(rng, 50, size=1100) + [(-10, -10, 2000, 2000)]:
+            expected = [i for i, box in enumerate(boxes) if boxes_intersect(box, rect)]
+            assert index.intersecting(rect).tolist() == expected
+
+
+def test_below_matches_legacy_loop():
+    rng = random.Random(16)
+    boxes = random_boxes(rng, 300)
+    index = GridIndex(np.array(boxes))
+    for key_box in random_boxes(rng, 100):
+        if key_box[2] == key_box[0]:
+            continue
+        stop_y = rng.choice([key_box[3] + rng.randint(0, 400), 1100])
+        for min_overlap in (0.0, 0.3, 1.0):
+            assert index.below(key_box, stop_y, min_overlap).tolist() == legacy_below(boxes, key_box, stop_y, min_overlap)
+
+
+def test_first_intersecting():
+    regions = [(0, 0, 10, 10), (5, 5, 20, 20)]
+    assert first_intersecting([(6, 6, 7, 7), (15, 15, 16, 16), (30, 30, 31, 31)], regions).tolist() == [0, 1, -1]
+    assert first_intersecting([], regions).tolist() == []
+
+
+def test_filter_ocr_keys_by_regions_keeps_first_region():
+    for module in ("paddleocr", "llama_cpp", "doclayout_yolo", "huggingface_hub"):
+        pytest.importorskip(module)
+    from ocr import filter_ocr_keys_by_regions
+
+    square = lambda x, y: [[x, y], [x + 10, y], [x + 10, y + 10], [x, y + 10]]
+    hits = [
+        {"key": "CCT", "ocr_result_index": 0, "bbox": square(50, 50)},
+        {"key": "CRI", "ocr_result_index": 0, "bbox": square(500, 500)},
+        {"key": "Watt", "ocr_result_index": 1, "bbox": square(50, 50)},
+        {"key": "IP", "ocr_result_index": 0, "bbox": None},
+    ]
+    regions = {0: [{"x1": 0, "y1": 0, "x2": 100, "y2": 300}, {"x1": 40, "y1": 40, "x2": 600, "y2": 700}]}
+    filtered = filter_ocr_keys_by_regions(hits, regions)
+    assert [(h["key"], h["stop_y"]) for h in filtered] == [("CCT", 300), ("CRI", 700)]
+    assert "stop_y" not in hits[0]
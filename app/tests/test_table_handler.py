@@ -0,0 +1,64 @@
+import types
+
+import pytest
+
+for module in ("paddleocr", "llama_cpp", "doclayout_yolo", "huggingface_hub"):
+    pytest.importorskip(module)
+
+import table_handler
+from cache_store import LRUCacheStore
+from table_handler import TABLE_CLASS, detect_table_regions_for_key_hits, layout_cache_key
+
+
+class Pages(list):
+    """Page images that remember which pages were fetched."""
+
+    dpi = 300
+
+    def __init__(self, n):
+        super().__init__(f"page {i}" for i in range(n))
+        self.fetched = []
+
+    def __getitem__(self, page_idx):
+        self.fetched.append(page_idx)
+        return super().__getitem__(page_idx)
+
+
+def detection(cls, x1, y1):
+    return {"class": cls, "box": {"x1": x1, "y1": y1, "x2": x1 + 50, "y2": y1 + 20}}
+
+
+@pytest.fixture
+def layout(monkeypatch):
+    calls = []
+
+    def detect_layout_pages(images):
+        calls.append(list(images))
+        dets = [detection(TABLE_CLASS, 10, 300), detection(1, 0, 0), detection(TABLE_CLASS, 10, 100)]
+        return [types.SimpleNamespace(summary=lambda: dets) for _ in images]
+
+    monkeypatch.setattr(table_handler, "detect_layout_pages", detect_layout_pages)
+    return calls
+
+
+def test_layout_runs_only_on_pages_with_hits_and_is_cached(layout, tmp_path):
+    hits = [{"ocr_result_index": 4}, {"ocr_result_index": 1}, {"ocr_result_index": 4}]
+    cache = LRUCacheStore(str(tmp_path / "layout.sqlite"), 1 << 20)
+    pages = Pages(6)
+
+    regions = detect_table_regions_for_key_hits(hits, hits, {}, pages, layout_cache=cache, pdf_hash="h")
+    assert sorted(pages.fetched) == [1, 4]
+    assert layout == [["page 1", "page 4"]]
+    assert list(regions) == [1, 4]
+    assert [r["y1"] for r in regions[4]] == [100.0, 300.0]        # tables only, top to bottom
+
+    pages.fetched.clear()
+    assert detect_table_regions_for_key_hits(hits, hits, {}, pages, layout_cache=cache, pdf_hash="h") == regions
+    assert pages.fetched == [] and len(layout) == 1
+    assert detect_table_regions_for_key_hits([], hits, {}, pages) == {}
+
+
+def test_layout_cache_key():
+    base = layout_cache_key("pdf", 0)
+    assert base == layout_cache_key("pdf", 0)
+    assert len({base, layout_cache_key("pdf", 1), layout_cache_key("other", 0), layout_cache_key("pdf", 0, dpi=150)}) == 4
@@ -0,0 +1,87 @@
+import random
+import re
+from helper import generate_ocr_variants
+from serching import find_hits, refine_by_value_hits, match_product_types_via_lookup, matches_key_value_pair
+
+
+def legacy_find_hits(big_text, search_terms):
+    """find_hits before the automaton: one substring scan per OCR variant."""
+    big_text_lower = big_text.lower()
+    return [
+        term for term in search_terms
+        if any(variant in big_text_lower for variant in generate_ocr_variants(term))
+    ]
+
+
+def test_find_hits_matches_variant_loop():
+    rng = random.Random(11)
+    alphabet = "abcilo0125689kw -/"
+    for _ in range(300):
+        terms = list({"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 5))) for _ in range(rng.randint(1, 8))})
+        text = "".join(rng.choice(alphabet + alphabet.upper()) for _ in range(rng.randint(0, 80)))
+        assert find_hits(text, terms) == legacy_find_hits(text, terms)
+
+
+def test_refine_by_value_hits_mixed_case_values():
+    schema = {
+        "Color Temperature": {"data_type": "str", "values": ["2700K", "3000K", " 4000K "], "product_types": ["Downlight"]},
+        "Finish": {"data_type": "str", "values": ["White", "Black"], "product_types": ["Downlight"]},
+    }
+    big_text = "CCT: 2700k / 4000K. Finish: WHITE powder coat"
+
+    matched, not_matched = refine_by_value_hits(schema, {}, big_text, schema)
+
+    assert matched["Color Temperature"]["values"] == {"2700k": True, "3000k": False, "4000k": True}
+    assert matched["Finish"]["values"] == {"white": True, "black": False}
+    assert not_matched == {}
+
+
+def test_lookup_string_value_is_one_term():
+    lookup = {"Downlight": "recessed", "Pendant": ["pendant", "suspended"]}
+    # Every letter of "recessed" occurs in the text, but the word does not
+    assert match_product_types_via_lookup("suspended from a cable", lookup) == {"Pendant"}
+    assert match_product_types_via_lookup("Recessed housing", lookup) == {"Downlight"}
+
+
+def legacy_matches_key_value_pair(big_text, key, value):
+    """matches_key_value_pair before the compiled matcher: one regex per value variant."""
+    if isinstance(value, str):
+        value = [value]
+    key_clean = key.strip().lower()
+    if not key_clean:
+        return False
+    for val in value:
+        val_clean = str(val).strip()
+        if not val_clean:
+            continue
+        for variant in generate_ocr_variants(val_clean):
+            pattern = rf"{re.escape(key_clean)}[:\-\–\—=]?\s*{re.escape(variant.lower())}"
+            if re.search(pattern, big_text.lower(), re.IGNORECASE):
+                return True
+    return False
+
+
+def test_matches_key_value_pair_matches_regex_loop():
+    rng = random.Random(13)
+    alphabet = "cti0125kw"
+    separators = ["", " ", ":", ": ", "-", " - ", "–", "=\t", "\n", "::"]
+    checked = matched = 0
+    for _ in range(400):
+        key = rng.choice(["CCT", "cri", "Watt", "CCT ", " I/O"])
+        values = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 3))]
+        if rng.random() < 0.2:
+            values = values[0]
+        pieces = []
+        for _ in range(rng.randint(1, 4)):
+            pieces.append(rng.choice([key.strip(), key.strip().upper(), "".join(rng.choice(alphabet) for _ in range(3))]))
+            pieces.append(rng.choice(separators))
+            if rng.random() < 0.5:
+                vals = [values] if isinstance(values, str) else values
+                pieces.append(rng.choice(generate_ocr_variants(rng.choice(vals))).upper())
+            pieces.append("".join(rng.choice(alphabet + alphabet.upper()) for _ in range(rng.randint(0, 5))))
+        text = "".join(pieces)
+        expected = legacy_matches_key_value_pair(text, key, values)
+        assert matches_key_value_pair(text, key, values) == expected, (text, key, values)
+        checked += 1
+        matched += expected
+    assert matched > 50 and checked - matched > 50
@@ -0,0 +1,36 @@
+import pytest
+
+for module in ("paddleocr", "llama_cpp", "doclayout_yolo", "huggingface_hub"):
+    pytest.importorskip(module)
+
+from worker_pool import merge_worker_stats, merge_cache_stats
+
+
+def cache_stats(hits, misses, entries):
+    return {"hits": hits, "misses": misses, "entries": entries, "bytes": entries * 100, "max_bytes": 1000}
+
+
+def worker(items, ocr_hits, llm_completions):
+    return {
+        "ocr": {"items": items, "batches": items, "busy_time": items * 0.5, "wall_time": 1.0, "items_per_sec": 1.0},
+        "ocr_cache": cache_stats(ocr_hits, items, 5),
+        "layout_cache": None,
+        "llm": {"completions": llm_completions, "cache_hits": 1},
+        "llm_cache": cache_stats(1, llm_completions, 2),
+    }
+
+
+def test_merge_worker_stats_sums_counters():
+    totals = merge_worker_stats(merge_worker_stats({}, worker(4, 2, 0)), worker(6, 1, 3))
+    assert totals["ocr"] == {"items": 10, "batches": 10, "busy_time": 5.0}
+    assert totals["ocr_cache"]["hits"] == 3 and totals["ocr_cache"]["misses"] == 10
+    assert totals["ocr_cache"]["entries"] == 5       # one shared cache file, not 10 entries
+    assert totals["layout_cache"] is None
+    assert totals["llm"] == {"completions": 3, "cache_hits": 2}
+
+
+def test_merge_cache_stats_with_missing_side():
+    stats = cache_stats(1, 2, 3)
+    assert merge_cache_stats(None, stats) == stats
+    assert merge_cache_stats(stats, None) == stats
+    assert merge_cache_stats(None, None) is None
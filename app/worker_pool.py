@@ -0,0 +1,282 @@
+import time
+import queue
+import logging
+import multiprocessing as mp
+from collections import deque
+from model_loader import get_ocr_instance, get_layout_model
+from ocr import get_ocr_cache, make_ocr_batcher
+from table_handler import get_layout_cache
+from llm_cache import set_llm_cache_enabled, get_llm_cache
+from generate_mouting import llm_stats
+from model_server import set_model_server_enabled
+from process_lighting_spec_sheet import process_lighting_spec_sheet
+
+logger = logging.getLogger(__name__)
+
+
+def worker_stats(ocr_batcher, ocr_cache, layout_cache):
+    """Counters of one worker process, sent to the parent when it exits."""
+    llm_cache = get_llm_cache()
+    return {
+        "ocr": ocr_batcher.stats(),
+        "ocr_cache": ocr_cache.stats() if ocr_cache is not None else None,
+        "layout_cache": layout_cache.stats() if layout_cache is not None else None,
+        "llm": llm_stats(),
+        "llm_cache": llm_cache.stats() if llm_cache is not None else None,
+    }
+
+
+def merge_cache_stats(total, stats):
+    """Sum of the hit/miss counters of two processes' stats() of one cache file (either may be None)."""
+    if stats is None:
+        return total
+    if total is None:
+        return dict(stats)
+    merged = dict(total)
+    merged["hits"] += stats["hits"]
+    merged["misses"] += stats["misses"]
+    # Every worker opens the same cache file: entries and bytes are not additive
+    merged["entries"] = max(total["entries"], stats["entries"])
+    merged["bytes"] = max(total["bytes"], stats["bytes"])
+    return merged
+
+
+def merge_worker_stats(total, stats):
+    """Adds one worker's `worker_stats` into `total` (a dict from a previous merge, or {})."""
+    ocr = total.get("ocr") or {"items": 0, "batches": 0, "busy_time": 0.0}
+    for name in ("items", "batches", "busy_time"):
+        ocr[name] += stats["ocr"][name]
+    llm = dict(total.get("llm") or {})
+    for name, n in stats["llm"].items():
+        llm[name] = llm.get(name, 0) + n
+    return {
+        "ocr": ocr,
+        "ocr_cache": merge_cache_stats(total.get("ocr_cache"), stats["ocr_cache"]),
+        "layout_cache": merge_cache_stats(total.get("layout_cache"), stats["layout_cache"]),
+        "llm": llm,
+        "llm_cache": merge_cache_stats(total.get("llm_cache"), stats["llm_cache"]),
+    }
+
+
+def _worker_main(worker_id, task_queue, result_queue, schema_path, process_kwargs, worker_options):
+    """
+    Worker loop: set up OCR and layout models once (or proxies to a running
+    model server), then process PDFs from `task_queue` until a None
+    arrives. Every task gets exactly one ("done", ...) message back, and
+    the worker sends its counters in a ("stats", ...) message before it
+    exits. If the models cannot be set up, the worker sends an
+    ("init_error", ...) message instead and exits without taking tasks.
+    """
+    set_llm_cache_enabled(not worker_options.get("no_llm_cache"))
+    set_model_server_enabled(not worker_options.get("no_model_server"))
+    try:
+        ocr_engine = get_ocr_instance()
+        get_layout_model()
+    except Exception as e:
+        logger.error(f"Worker {worker_id} could not load the models: {e}", exc_info=True)
+        result_queue.put(("init_error", worker_id, f"{type(e).__name__}: {e}"))
+        return
+    ocr_cache = None if worker_options.get("no_ocr_cache") else get_ocr_cache()
+    layout_cache = None if worker_options.get("no_layout_cache") else get_layout_cache()
+    ocr_batcher = make_ocr_batcher(
+        ocr_engine,
+        batch_size=worker_options["ocr_batch_size"],
+        max_wait=worker_options["ocr_max_wait"],
+    )
+
+    try:
+        while True:
+            pdf_path = task_queue.get()
+            if pdf_path is None:
+                break
+            try:
+                is_hit = process_lighting_spec_sheet(
+                    pdf_path,
+                    schema_path,
+                    ocr_engine,
+                    ocr_cache=ocr_cache,
+                    ocr_batcher=ocr_batcher,
+                    layout_cache=layout_cache,
+                    **process_kwargs,
+                )
+                result_queue.put(("done", worker_id, (pdf_path, bool(is_hit), None)))
+            except Exception as e:
+                logger.error(f"Worker {worker_id} failed on {pdf_path}: {e}", exc_info=True)
+                result_queue.put(("done", worker_id, (pdf_path, None, f"{type(e).__name__}: {e}")))
+    finally:
+        ocr_batcher.close()
+        result_queue.put(("stats", worker_id, worker_stats(ocr_batcher, ocr_cache, layout_cache)))
+
+
+def run_documents_in_workers(
+    pdf_paths,
+    schema_path,
+    n_workers,
+    on_result,
+    process_kwargs=None,
+    worker_options=None,
+    prefetch=1,
+    preload=True,
+):
+    """
+    Process PDFs in `n_workers` processes.
+
+    The parent hands each worker at most `1 + prefetch` documents at a time
+    through its own bounded queue, so it always knows which documents a
+    worker holds. If a worker process dies, the document it was working on
+    is reported as failed, its prefetched documents go back to the pending
+    queue and a replacement worker is started. A worker that cannot load
+    its models is not replaced: once no worker is left, the documents not
+    processed yet are reported as failed with its initialization error.
+    `on_result(pdf_path, is_hit, error)` runs in the parent for every
+    document, so moving files and printing stay single-threaded.
+
+    Workers are never forked from this process: by the time they start, it
+    may have PaddleOCR, torch or llama threads running (e.g. after
+    prepare_schema_artifacts), and forking a process with live OpenMP or
+    torch threads can deadlock the child. With `preload`, workers are forked
+    from a forkserver process that has only imported the model libraries
+    (no model initialized, no threads started), which saves each worker the
+    imports; otherwise they are spawned as fresh interpreters. Either way,
+    each worker loads its own models, or uses the model server when one is
+    running (one shared copy of the models for all workers).
+
+    Returns:
+        dict: merged worker counters (see worker_stats) plus "documents"
+              and "elapsed" (seconds) for the whole run; a worker that
+              crashed contributes no counters
+    """
+    process_kwargs = process_kwargs or {}
+    worker_options = worker_options or {}
+
+    if preload:
+        ctx = mp.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__])
+    else:
+        ctx = mp.get_context("spawn")
+    started = time.perf_counter()
+    totals = {}
+
+    result_queue = ctx.Queue()
+    pending = deque(pdf_paths)
+    workers = {}        # worker_id -> (process, task_queue)
+    assigned = {}       # worker_id -> deque of pdf paths sent, oldest is in progress
+    next_worker_id = 0
+    remaining = len(pdf_paths)
+    init_error = None   # first model initialization error of any worker
+    failed_init = set() # ids of the workers that sent it
+
+    def start_worker():
+        nonlocal next_worker_id
+        worker_id = next_worker_id
+        next_worker_id += 1
+        task_queue = ctx.Queue(maxsize=1 + prefetch)
+        proc = ctx.Process(
+            target=_worker_main,
+            args=(worker_id, task_queue, result_queue, schema_path, process_kwargs, worker_options),
+            name=f"spec-sheet-worker-{worker_id}",
+            daemon=True,
+        )
+        proc.start()
+        workers[worker_id] = (proc, task_queue)
+        assigned[worker_id] = deque()
+
+    def dispatch():
+        for worker_id, (_, task_queue) in workers.items():
+            while worker_id not in failed_init and pending and len(assigned[worker_id]) < 1 + prefetch:
+                pdf_path = pending.popleft()
+                task_queue.put(pdf_path)
+                assigned[worker_id].append(pdf_path)
+
+    def handle(kind, worker_id, payload):
+        nonlocal totals, remaining, init_error
+        if kind == "stats":
+            totals = merge_worker_stats(totals, payload)
+        elif kind == "init_error":
+            logger.error(f"Worker {worker_id} failed to initialize: {payload}")
+            init_error = init_error or payload
+            failed_init.add(worker_id)
+        elif kind == "done":
+            pdf_path, is_hit, error = payload
+            if pdf_path not in assigned.get(worker_id, ()):
+                return  # already reported when its worker died
+            assigned[worker_id].remove(pdf_path)
+            remaining -= 1
+            on_result(pdf_path, is_hit, error)
+
+    def drain():
+        # Messages a worker sent before it died are read before it is reaped
+        while True:
+            try:
+                handle(*result_queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def reap():
+        nonlocal remaining
+        dead = [worker_id for worker_id, (proc, _) in workers.items() if not proc.is_alive()]
+        if not dead:
+            return
+        drain()
+        for worker_id in dead:
+            proc, _ = workers.pop(worker_id)
+            lost = assigned.pop(worker_id)
+            if worker_id in failed_init:
+                # Never got to its documents: another worker can take them
+                pending.extendleft(reversed(lost))
+                continue
+            logger.error(f"Worker {worker_id} exited with code {proc.exitcode}")
+            if lost:
+                crashed_on = lost.popleft()
+                pending.extendleft(reversed(lost))
+                remaining -= 1
+                on_result(crashed_on, None, f"worker process exited with code {proc.exitcode}")
+            if remaining and init_error is None:
+                start_worker()
+        if init_error is not None and not workers:
+            # Restarting would fail the same way
+            while pending:
+                remaining -= 1
+                on_result(pending.popleft(), None, f"worker initialization failed: {init_error}")
+
+    for _ in range(min(n_workers, len(pdf_paths))):
+        start_worker()
+
+    try:
+        while remaining:
+            dispatch()
+            try:
+                handle(*result_queue.get(timeout=1.0))
+            except queue.Empty:
+                pass
+            reap()
+    finally:
+        for proc, task_queue in workers.values():
+            if proc.is_alive():
+                try:
+                    task_queue.put(None, timeout=1.0)
+                except queue.Full:
+                    proc.terminate()
+
+        # Collect the exit counters before joining: a process that still has
+        # queued messages does not exit until they are read
+        waiting = set(workers)
+        deadline = time.monotonic() + 30
+        while waiting and time.monotonic() < deadline:
+            try:
+                kind, worker_id, payload = result_queue.get(timeout=1.0)
+            except queue.Empty:
+                waiting = {worker_id for worker_id in waiting if workers[worker_id][0].is_alive()}
+                continue
+            if kind == "stats":
+                totals = merge_worker_stats(totals, payload)
+                waiting.discard(worker_id)
+
+        for proc, _ in workers.values():
+            proc.join(timeout=30)
+            if proc.is_alive():
+                proc.terminate()
+
+    totals["documents"] = len(pdf_paths)
+    totals["elapsed"] = time.perf_counter() - started
+    return totals